@@ -274,6 +274,29 @@ TWILIO_AUTH_TOKEN = os.environ.get("TWILIO_AUTH_TOKEN")
 TWILIO_API_KEY_SID = os.environ.get("TWILIO_API_KEY_SID")
 TWILIO_API_SECRET = os.environ.get("TWILIO_API_SECRET")
 TWILIO_CONVERSATIONS_SERVICE_SID = os.environ.get("TWILIO_CONVERSATIONS_SERVICE_SID")
+# Shared Twilio client (messaging/twilio_client.py): timeouts, retries and circuit breaker
+TWILIO_HTTP_TIMEOUT = float(os.environ.get("TWILIO_HTTP_TIMEOUT", "10"))
+TWILIO_HTTP_MAX_RETRIES = int(os.environ.get("TWILIO_HTTP_MAX_RETRIES", "2"))
+TWILIO_CIRCUIT_FAILURE_THRESHOLD = int(os.environ.get("TWILIO_CIRCUIT_FAILURE_THRESHOLD", "5"))
+TWILIO_CIRCUIT_RESET_SECONDS = float(os.environ.get("TWILIO_CIRCUIT_RESET_SECONDS", "30"))
+# Point all Twilio REST calls at a local stand-in (e.g. http://127.0.0.1:8765) for load tests
+TWILIO_API_BASE_URL = os.environ.get("TWILIO_API_BASE_URL")
+# Conversations access tokens: lifetime, and how long before expiry a cached token is re-signed
+TWILIO_TOKEN_TTL = int(os.environ.get("TWILIO_TOKEN_TTL", "3600"))
+TWILIO_TOKEN_REFRESH_MARGIN = int(os.environ.get("TWILIO_TOKEN_REFRESH_MARGIN", "300"))
+TWILIO_PROVISIONING_WORKERS = int(os.environ.get("TWILIO_PROVISIONING_WORKERS", "8"))
+# Webhook ingestion: public URL Twilio signs (defaults to the request URL) and batching
+TWILIO_WEBHOOK_URL = os.environ.get("TWILIO_WEBHOOK_URL")
+TWILIO_WEBHOOK_BATCH_SIZE = int(os.environ.get("TWILIO_WEBHOOK_BATCH_SIZE", "100"))
+TWILIO_WEBHOOK_FLUSH_SECONDS = float(os.environ.get("TWILIO_WEBHOOK_FLUSH_SECONDS", "1.0"))
+# Message archival (messaging/archive.py): full months kept in the hot table, optional tablespace for cold partitions
+MESSAGING_HOT_MONTHS = int(os.environ.get("MESSAGING_HOT_MONTHS", "6"))
+MESSAGING_ARCHIVE_TABLESPACE = os.environ.get("MESSAGING_ARCHIVE_TABLESPACE")
+# WebSocket fan-out backend (messaging/realtime.py); use messaging.realtime.PostgresNotifyBroker with several nodes
+MESSAGING_REALTIME_BROKER = os.environ.get("MESSAGING_REALTIME_BROKER", "messaging.realtime.InProcessBroker")
+# Roommate matching index (roommates/matching.py): poll for other nodes' post edits, full rebuild interval
+ROOMMATE_MATCHING_REFRESH_SECONDS = float(os.environ.get("ROOMMATE_MATCHING_REFRESH_SECONDS", "5"))
+ROOMMATE_MATCHING_REBUILD_SECONDS = float(os.environ.get("ROOMMATE_MATCHING_REBUILD_SECONDS", "300"))
 SECURE_SSL_REDIRECT = False
 
 # Secure cookies only in production
@@ -179,3 +179,22 @@ class ListingImageSerializer(serializers.ModelSerializer):
             return obj.image.url if obj.image else None
         except Exception:
             return None
+
+
+class ListingCompactSerializer(serializers.ModelSerializer):
+    """Slim listing projection for embedding in other resources (e.g. review lists)."""
+    primary_image = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Listing
+        fields = ['id', 'title', 'district', 'primary_image']
+        read_only_fields = fields
+
+    def get_primary_image(self, obj):
+        # Images are ordered primary-first; iterate so a prefetched cache is reused
+        image = next(iter(obj.images.all()), None)
+        try:
+            return image.image.url if image and image.image else None
+        except Exception:
+            return None
+
@@ -0,0 +1,103 @@
+# messaging/archive.py
+"""
+Moves cold months of Message rows into ArchivedMessage so the hot table (inserts, inbox,
+recent history) stays small. On Postgres the archive is partitioned by month: each month
+gets its own partition, created with lz4 compression and a low toast_tuple_target so rows
+are stored compressed, optionally in MESSAGING_ARCHIVE_TABLESPACE. Whole months move at
+once, so every archived message in a conversation is older than its hot messages and
+history can page through the hot table first and then continue into the archive. For the
+same reason archiving stops before the first month that still holds a message waiting for
+Twilio delivery: its outbox row must stay with the hot message until the worker is done.
+"""
+import logging
+from datetime import datetime, timezone as dt_timezone
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F, Max, Min
+from django.db.models.functions import Coalesce, Greatest, TruncMonth
+from django.utils import timezone
+from .models import ArchivedMessage, Conversation, Message, MessageOutbox
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 1000
+ARCHIVED_FIELDS = ('conversation_id', 'sender_id', 'content', 'is_read', 'twilio_sid', 'twilio_index', 'created_at')
+
+
+def month_start(value):
+  value = value.astimezone(dt_timezone.utc)
+  return datetime(value.year, value.month, 1, tzinfo=dt_timezone.utc)
+
+
+def add_months(month, count):
+  index = month.year * 12 + month.month - 1 + count
+  return datetime(index // 12, index % 12 + 1, 1, tzinfo=dt_timezone.utc)
+
+
+def partition_name(month):
+  return f"{ArchivedMessage._meta.db_table}_y{month.year}m{month.month:02d}"
+
+
+def ensure_partition(month):
+  """Create the archive partition for month (Postgres only; a no-op elsewhere)."""
+  if connection.vendor != 'postgresql':
+    return
+  name = connection.ops.quote_name(partition_name(month))
+  parent = connection.ops.quote_name(ArchivedMessage._meta.db_table)
+  with connection.cursor() as cursor:
+    cursor.execute(
+      f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF {parent} "
+      f"FOR VALUES FROM (%s) TO (%s) WITH (toast_tuple_target = 128)",
+      [month, add_months(month, 1)],
+    )
+    if connection.pg_version >= 140000:
+      cursor.execute(f"ALTER TABLE {name} ALTER COLUMN content SET COMPRESSION lz4")
+    if settings.MESSAGING_ARCHIVE_TABLESPACE:
+      cursor.execute(f"ALTER TABLE {name} SET TABLESPACE {connection.ops.quote_name(settings.MESSAGING_ARCHIVE_TABLESPACE)}")
+
+
+def cold_months(keep_months):
+  """
+  Months (UTC) that end before the last keep_months months and still have hot messages,
+  up to the first month with an undelivered message.
+  """
+  cutoff = add_months(month_start(timezone.now()), -keep_months)
+  undelivered = MessageOutbox.objects.filter(status=MessageOutbox.Status.PENDING).aggregate(
+    oldest=Min('message__created_at')
+  )['oldest']
+  if undelivered is not None and month_start(undelivered) < cutoff:
+    logger.warning("Archiving stops before %s: messages from that month are still waiting for Twilio", undelivered.strftime("%Y-%m"))
+    cutoff = month_start(undelivered)
+  return list(
+    Message.objects.filter(created_at__lt=cutoff, conversation__isnull=False)
+    .annotate(month=TruncMonth('created_at', tzinfo=dt_timezone.utc))
+    .values_list('month', flat=True)
+    .distinct()
+    .order_by('month')
+  )
+
+
+def archive_month(month, batch_size=BATCH_SIZE):
+  """Move every message of month into the archive, batch by batch. Returns the number moved."""
+  ensure_partition(month)
+  # Deleting a message cascades to its outbox row, so messages still pending delivery stay hot
+  hot = Message.objects.filter(
+    created_at__gte=month, created_at__lt=add_months(month, 1), conversation__isnull=False,
+  ).exclude(outbox__status=MessageOutbox.Status.PENDING)
+  moved = 0
+  while True:
+    with transaction.atomic():
+      batch = list(hot.select_for_update(skip_locked=True).order_by('created_at', 'id')[:batch_size])
+      if not batch:
+        return moved
+      ids = [m.id for m in batch]
+      ArchivedMessage.objects.bulk_create([
+        ArchivedMessage(id=m.id, **{field: getattr(m, field) for field in ARCHIVED_FIELDS}) for m in batch
+      ])
+      latest = Message.objects.filter(id__in=ids).values('conversation_id').annotate(latest=Max('created_at'))
+      for row in latest:
+        Conversation.objects.filter(pk=row['conversation_id']).update(
+          archived_until=Greatest(Coalesce(F('archived_until'), row['latest']), row['latest'])
+        )
+      Message.objects.filter(id__in=ids).delete()
+      moved += len(batch)
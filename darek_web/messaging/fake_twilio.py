@@ -0,0 +1,190 @@
+# messaging/fake_twilio.py
+"""
+Stand-ins for the Twilio Conversations API. FakeTwilioClient replaces the parts of
+twilio.rest.Client the app uses (client.conversations.services(..).conversations ...)
+in-process; FakeTwilioServer serves the same calls over HTTP so the real shared client
+can be exercised and load-tested. Both support injected latency and failures.
+"""
+import itertools
+import json
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+from urllib.parse import parse_qs, urlsplit
+
+
+def _sid(prefix):
+  return prefix + uuid.uuid4().hex
+
+
+class FakeTwilioError(Exception):
+  pass
+
+
+class _Messages:
+  def __init__(self, server, conversation_sid):
+    self.server = server
+    self.conversation_sid = conversation_sid
+
+  def create(self, author=None, body=None, attributes=None, **kwargs):
+    self.server._call('messages.create')
+    record = SimpleNamespace(
+      sid=_sid('IM'), conversation_sid=self.conversation_sid,
+      author=author, body=body, attributes=attributes,
+    )
+    with self.server.lock:
+      self.server.messages.append(record)
+    return record
+
+
+class _Participants:
+  def __init__(self, server, conversation_sid):
+    self.server = server
+    self.conversation_sid = conversation_sid
+
+  def create(self, identity=None, **kwargs):
+    self.server._call('participants.create')
+    record = SimpleNamespace(sid=_sid('MB'), conversation_sid=self.conversation_sid, identity=identity)
+    with self.server.lock:
+      self.server.participants.setdefault(self.conversation_sid, []).append(identity)
+    return record
+
+
+class _Conversation:
+  def __init__(self, server, sid):
+    self.server = server
+    self.sid = sid
+    self.messages = _Messages(server, sid)
+    self.participants = _Participants(server, sid)
+
+  def update(self, **kwargs):
+    self.server._call('conversations.update')
+    with self.server.lock:
+      self.server.created_conversations.setdefault(self.sid, {}).update(kwargs)
+    return SimpleNamespace(sid=self.sid, **kwargs)
+
+
+class _Conversations:
+  def __init__(self, server):
+    self.server = server
+
+  def __call__(self, sid):
+    return _Conversation(self.server, sid)
+
+  def create(self, friendly_name=None, **kwargs):
+    self.server._call('conversations.create')
+    sid = _sid('CH')
+    with self.server.lock:
+      self.server.created_conversations[sid] = {'friendly_name': friendly_name}
+    return SimpleNamespace(sid=sid, friendly_name=friendly_name)
+
+
+class _Service:
+  def __init__(self, server):
+    self.conversations = _Conversations(server)
+
+
+class FakeTwilioClient:
+  """
+  latency: seconds slept per API call. fail_every: raise on every Nth call (0 = never).
+  Recorded state: .messages, .created_conversations, .participants, .calls.
+  """
+
+  def __init__(self, latency=0.0, fail_every=0):
+    self.latency = latency
+    self.fail_every = fail_every
+    self.lock = threading.Lock()
+    self.messages = []
+    self.created_conversations = {}
+    self.participants = {}
+    self.calls = []
+    self._counter = itertools.count(1)
+    # Mirrors client.conversations.services(<service_sid>)
+    self.conversations = SimpleNamespace(services=lambda service_sid: _Service(self))
+
+  def _call(self, name):
+    n = next(self._counter)
+    with self.lock:
+      self.calls.append(name)
+    if self.latency:
+      time.sleep(self.latency)
+    if self.fail_every and n % self.fail_every == 0:
+      raise FakeTwilioError(f"Injected failure on call {n} ({name})")
+
+
+class FakeTwilioServer:
+  """
+  Minimal HTTP stand-in for the Conversations REST endpoints the app calls, for tests and
+  load tests of the real client (set TWILIO_API_BASE_URL to .url). Backed by a
+  FakeTwilioClient for latency/failure injection and recorded state.
+  """
+  PATTERN = re.compile(
+    r'^/v1/Services/(?P<service>[^/]+)/Conversations(?:/(?P<convo>[^/]+)(?:/(?P<child>Participants|Messages))?)?$'
+  )
+
+  def __init__(self, host='127.0.0.1', port=0, latency=0.0, fail_every=0):
+    self.backend = FakeTwilioClient(latency=latency, fail_every=fail_every)
+    self.httpd = ThreadingHTTPServer((host, port), self._handler())
+    self.httpd.daemon_threads = True
+    self.thread = None
+
+  @property
+  def url(self):
+    host, port = self.httpd.server_address[:2]
+    return f"http://{host}:{port}"
+
+  def start(self):
+    self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+    self.thread.start()
+    return self
+
+  def stop(self):
+    self.httpd.shutdown()
+    self.httpd.server_close()
+
+  def dispatch(self, path, form):
+    match = self.PATTERN.match(path)
+    if not match:
+      return 404, {"code": 20404, "message": "Not found", "status": 404}
+    service = self.backend.conversations.services(match['service'])
+    try:
+      if match['convo'] is None:
+        created = service.conversations.create(friendly_name=form.get('FriendlyName'))
+        return 201, {"sid": created.sid, "chat_service_sid": match['service'], "friendly_name": created.friendly_name}
+      convo = service.conversations(match['convo'])
+      if match['child'] == 'Participants':
+        created = convo.participants.create(identity=form.get('Identity'))
+        return 201, {"sid": created.sid, "conversation_sid": match['convo'], "identity": created.identity}
+      if match['child'] == 'Messages':
+        created = convo.messages.create(author=form.get('Author'), body=form.get('Body'), attributes=form.get('Attributes'))
+        return 201, {"sid": created.sid, "conversation_sid": match['convo'], "author": created.author,
+                     "body": created.body, "attributes": created.attributes}
+      convo.update(**form)
+      return 200, {"sid": match['convo'], "chat_service_sid": match['service'], "attributes": form.get('Attributes')}
+    except FakeTwilioError as e:
+      return 503, {"code": 20503, "message": str(e), "status": 503}
+
+  def _handler(self):
+    server = self
+
+    class Handler(BaseHTTPRequestHandler):
+      protocol_version = 'HTTP/1.1'
+
+      def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        form = {k: v[-1] for k, v in parse_qs(self.rfile.read(length).decode()).items()}
+        code, payload = server.dispatch(urlsplit(self.path).path, form)
+        body = json.dumps(payload).encode()
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+      def log_message(self, *args):
+        pass
+
+    return Handler
@@ -0,0 +1,29 @@
+# messaging/management/commands/archive_messages.py
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from messaging import archive
+
+
+class Command(BaseCommand):
+    help = (
+        "Move messages older than the hot window into the monthly-partitioned, compressed "
+        "ArchivedMessage table. Safe to re-run; run it monthly (e.g. from cron)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--keep-months", type=int, default=settings.MESSAGING_HOT_MONTHS,
+                            help="Full months of history to keep in the hot table")
+        parser.add_argument("--batch-size", type=int, default=archive.BATCH_SIZE)
+        parser.add_argument("--dry-run", action="store_true", help="Only list the months that would move")
+
+    def handle(self, *args, **options):
+        months = archive.cold_months(options["keep_months"])
+        if not months:
+            self.stdout.write("Nothing to archive.")
+            return
+        for month in months:
+            if options["dry_run"]:
+                self.stdout.write(f"{month:%Y-%m}: would archive into {archive.partition_name(month)}")
+                continue
+            moved = archive.archive_month(month, options["batch_size"])
+            self.stdout.write(f"{month:%Y-%m}: archived {moved} messages into {archive.partition_name(month)}")
@@ -0,0 +1,50 @@
+# messaging/management/commands/bench_outbox.py
+import time
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from messaging import outbox
+from messaging.fake_twilio import FakeTwilioClient
+from messaging.models import Conversation, MessageOutbox
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark the send path: request-side enqueue cost versus a blocking Twilio call, "
+        "and worker delivery throughput, against the in-process fake Twilio client. "
+        "Creates and then removes its own bench users/conversation."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--messages", type=int, default=500)
+        parser.add_argument("--latency-ms", type=float, default=150.0, help="Simulated Twilio latency per call")
+        parser.add_argument("--batch-size", type=int, default=outbox.BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        count, batch_size = options["messages"], options["batch_size"]
+        latency = options["latency_ms"] / 1000.0
+        sender, _ = User.objects.get_or_create(username="bench_sender", defaults={"email": "bench_sender@bench.local"})
+        other, _ = User.objects.get_or_create(username="bench_other", defaults={"email": "bench_other@bench.local"})
+        convo = Conversation.objects.create(twilio_sid="CHbench")
+        convo.participants.add(sender, other)
+        try:
+            start = time.perf_counter()
+            for i in range(count):
+                outbox.enqueue_message(convo, sender, f"bench message {i}")
+            enqueue_s = time.perf_counter() - start
+
+            client = FakeTwilioClient(latency=latency)
+            start = time.perf_counter()
+            sent, failed = outbox.drain(client, batch_size)
+            deliver_s = time.perf_counter() - start
+        finally:
+            MessageOutbox.objects.filter(message__conversation=convo).delete()
+            convo.delete()
+            User.objects.filter(pk__in=[sender.pk, other.pk]).delete()
+
+        self.stdout.write(f"messages:               {count}")
+        self.stdout.write(f"request path (outbox):  {enqueue_s / count * 1000:.2f} ms/message")
+        self.stdout.write(f"request path (inline):  >= {latency * 1000:.2f} ms/message (one blocking Twilio call)")
+        self.stdout.write(f"worker delivery:        {sent} sent, {failed} failed in {deliver_s:.2f}s "
+                          f"({sent / deliver_s if deliver_s else 0:.1f} msg/s per worker)")
@@ -0,0 +1,50 @@
+# messaging/management/commands/bench_twilio_token.py
+import time
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from rest_framework.test import APIRequestFactory, force_authenticate
+from messaging.twilio_client import _token_cache_key, twilio_identity_for_user
+from messaging.views import TwilioAccessTokenView
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = (
+        "Micro-benchmark of the Twilio token endpoint: requests/s when every call signs a new "
+        "JWT (cache cleared each time) versus the cached path. Creates and removes a bench user."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=2000)
+
+    def handle(self, *args, **options):
+        count = options["requests"]
+        user, _ = User.objects.get_or_create(username="bench_token", defaults={"email": "bench_token@bench.local"})
+        factory = APIRequestFactory()
+        view = TwilioAccessTokenView.as_view()
+        key = _token_cache_key(twilio_identity_for_user(user))
+
+        def run(clear_cache):
+            start = time.perf_counter()
+            for _ in range(count):
+                if clear_cache:
+                    cache.delete(key)
+                request = factory.get("/messaging/twilio-token/")
+                force_authenticate(request, user=user)
+                response = view(request)
+                if response.status_code != 200:
+                    raise SystemExit(f"Token endpoint returned {response.status_code}: {response.data}")
+            return time.perf_counter() - start
+
+        try:
+            uncached_s = run(clear_cache=True)
+            cached_s = run(clear_cache=False)
+        finally:
+            cache.delete(key)
+            user.delete()
+
+        self.stdout.write(f"requests:         {count}")
+        self.stdout.write(f"sign every call:  {count / uncached_s:,.0f} req/s ({uncached_s / count * 1e6:.0f} us/req)")
+        self.stdout.write(f"cached token:     {count / cached_s:,.0f} req/s ({cached_s / count * 1e6:.0f} us/req)")
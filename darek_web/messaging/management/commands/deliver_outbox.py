@@ -0,0 +1,28 @@
+# messaging/management/commands/deliver_outbox.py
+import time
+from django.core.management.base import BaseCommand
+from messaging import outbox
+from messaging.twilio_client import get_twilio_client, twilio_stats
+
+
+class Command(BaseCommand):
+    help = "Deliver queued chat messages to Twilio (run one or more alongside the web process)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=outbox.BATCH_SIZE)
+        parser.add_argument("--interval", type=float, default=1.0, help="Idle poll interval in seconds")
+        parser.add_argument("--once", action="store_true", help="Drain what is due and exit")
+
+    def handle(self, *args, **options):
+        client = get_twilio_client()
+        batch_size = options["batch_size"]
+        if options["once"]:
+            sent, failed = outbox.drain(client, batch_size)
+            self.stdout.write(f"Delivered {sent}, failed {failed}; Twilio HTTP stats: {twilio_stats()}")
+            return
+        while True:
+            sent, failed = outbox.deliver_batch(client, batch_size)
+            if sent or failed:
+                self.stdout.write(f"Delivered {sent}, failed {failed}")
+            else:
+                time.sleep(options["interval"])
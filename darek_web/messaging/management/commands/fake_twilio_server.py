@@ -0,0 +1,26 @@
+# messaging/management/commands/fake_twilio_server.py
+import time
+from django.core.management.base import BaseCommand
+from messaging.fake_twilio import FakeTwilioServer
+
+
+class Command(BaseCommand):
+    help = "Run a local Twilio Conversations stand-in. Point the app at it with TWILIO_API_BASE_URL."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--host", default="127.0.0.1")
+        parser.add_argument("--port", type=int, default=8765)
+        parser.add_argument("--latency-ms", type=float, default=0.0)
+        parser.add_argument("--fail-every", type=int, default=0, help="Fail every Nth call with a 503")
+
+    def handle(self, *args, **options):
+        server = FakeTwilioServer(
+            host=options["host"], port=options["port"],
+            latency=options["latency_ms"] / 1000.0, fail_every=options["fail_every"],
+        ).start()
+        self.stdout.write(f"Fake Twilio listening on {server.url} (TWILIO_API_BASE_URL={server.url})")
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            server.stop()
@@ -0,0 +1,21 @@
+# messaging/management/commands/warm_conversation_pool.py
+import time
+from django.core.management.base import BaseCommand
+from messaging.provisioning import fill_pool
+
+
+class Command(BaseCommand):
+    help = "Keep a pool of empty Twilio conversations ready so new chats only need participant adds."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--size", type=int, default=20, help="Target number of warm conversations")
+        parser.add_argument("--interval", type=float, default=0, help="Re-check every N seconds (0 = run once)")
+
+    def handle(self, *args, **options):
+        while True:
+            created = fill_pool(options["size"])
+            if created:
+                self.stdout.write(f"Pre-created {created} conversations")
+            if not options["interval"]:
+                return
+            time.sleep(options["interval"])
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.7 on 2026-10-19 13:11
+
+from django.db import migrations, models
+
+
+def backfill_participant_keys(apps, schema_editor):
+    # Key existing two-person chats; when a pair already has duplicates keep the oldest one keyed
+    Conversation = apps.get_model('messaging', 'Conversation')
+    Participant = Conversation.participants.through
+    members = {}
+    for conversation_id, user_id in Participant.objects.values_list('conversation_id', 'user_id').iterator():
+        members.setdefault(conversation_id, []).append(user_id)
+    claimed = set()
+    for conversation in Conversation.objects.order_by('created_at').only('id'):
+        user_ids = members.get(conversation.id, [])
+        if len(user_ids) != 2:
+            continue
+        low, high = sorted(user_ids)
+        key = f"{low}:{high}"
+        if key in claimed:
+            continue
+        claimed.add(key)
+        Conversation.objects.filter(pk=conversation.pk).update(participant_key=key)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('messaging', '0003_message_convo_created_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='conversation',
+            name='participant_key',
+            field=models.CharField(blank=True, editable=False, max_length=64, null=True, unique=True),
+        ),
+        migrations.RunPython(backfill_participant_keys, migrations.RunPython.noop),
+    ]
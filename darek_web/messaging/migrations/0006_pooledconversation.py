@@ -0,0 +1,24 @@
+# Generated by Django 5.2.7 on 2026-10-19 13:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('messaging', '0005_messageoutbox'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PooledConversation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('twilio_sid', models.CharField(max_length=34, unique=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'ordering': ['created_at'],
+            },
+        ),
+    ]
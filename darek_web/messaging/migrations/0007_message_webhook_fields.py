@@ -0,0 +1,29 @@
+# Generated by Django 5.2.7 on 2026-10-19 13:18
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('messaging', '0006_pooledconversation'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='message',
+            name='twilio_index',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='message',
+            name='created_at',
+            field=models.DateTimeField(blank=True, default=django.utils.timezone.now, null=True),
+        ),
+        migrations.AlterField(
+            model_name='message',
+            name='twilio_sid',
+            field=models.CharField(blank=True, max_length=34, null=True, unique=True),
+        ),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 5.2.7 on 2026-10-19 13:22
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Max
+
+
+def backfill_read_states(apps, schema_editor):
+    # A participant has read up to the newest message from someone else that is flagged read
+    Conversation = apps.get_model('messaging', 'Conversation')
+    Message = apps.get_model('messaging', 'Message')
+    ConversationReadState = apps.get_model('messaging', 'ConversationReadState')
+    Participant = Conversation.participants.through
+    read_by_sender = {}
+    rows = (
+        Message.objects.filter(is_read=True, created_at__isnull=False)
+        .values_list('conversation_id', 'sender_id')
+        .annotate(latest=Max('created_at'))
+    )
+    for conversation_id, sender_id, latest in rows.iterator():
+        read_by_sender.setdefault(conversation_id, []).append((sender_id, latest))
+    states = []
+    for conversation_id, user_id in Participant.objects.values_list('conversation_id', 'user_id').iterator():
+        latest = [at for sender_id, at in read_by_sender.get(conversation_id, []) if sender_id != user_id]
+        if latest:
+            states.append(ConversationReadState(conversation_id=conversation_id, user_id=user_id, last_read_at=max(latest)))
+    ConversationReadState.objects.bulk_create(states, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('messaging', '0007_message_webhook_fields'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ConversationReadState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_read_at', models.DateTimeField()),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('conversation', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='read_states', to='messaging.conversation')),
+                ('last_read_message', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='messaging.message')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='conversation_read_states', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('conversation', 'user'), name='read_state_unique_participant')],
+            },
+        ),
+        migrations.RunPython(backfill_read_states, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.7 on 2026-10-19 14:05
+
+from django.db import migrations
+
+INDEX_NAME = 'message_content_search_idx'
+
+# Must match messaging.search.search_vector() for the planner to use the index
+CREATE_SQL = (
+    'CREATE INDEX IF NOT EXISTS {name} ON "messaging_message" USING gin (('
+    "to_tsvector('english'::regconfig, COALESCE(\"content\", '')) || "
+    "to_tsvector('arabic'::regconfig, COALESCE(\"content\", ''))))"
+)
+
+
+def create_search_index(apps, schema_editor):
+    # Full-text search is Postgres-only; other backends use the substring fallback
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(CREATE_SQL.format(name=INDEX_NAME))
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(f'DROP INDEX IF EXISTS {INDEX_NAME}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('messaging', '0008_conversationreadstate'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
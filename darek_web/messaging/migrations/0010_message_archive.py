@@ -0,0 +1,83 @@
+# Generated by Django 5.2.7 on 2026-10-19 13:33
+
+import django.db.models.deletion
+import django.utils.timezone
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def backfill_message_created_at(apps, schema_editor):
+    # created_at becomes the archive partition key, so it can no longer be null
+    Conversation = apps.get_model('messaging', 'Conversation')
+    Message = apps.get_model('messaging', 'Message')
+    Message.objects.filter(created_at__isnull=True, conversation__isnull=False).update(
+        created_at=Subquery(Conversation.objects.filter(pk=OuterRef('conversation_id')).values('created_at')[:1])
+    )
+    Message.objects.filter(created_at__isnull=True).update(created_at=django.utils.timezone.now())
+
+
+def create_archive_table(apps, schema_editor):
+    # On Postgres the table is partitioned by month; archive_messages adds one partition per month.
+    # The default partition only catches rows written without running archive_messages.
+    model = apps.get_model('messaging', 'ArchivedMessage')
+    if schema_editor.connection.vendor != 'postgresql':
+        schema_editor.create_model(model)
+        return
+    table = schema_editor.quote_name(model._meta.db_table)
+    sql, params = schema_editor.table_sql(model)
+    schema_editor.execute(f'{sql} PARTITION BY RANGE ("created_at")', params or None)
+    schema_editor.deferred_sql.extend(schema_editor._model_indexes_sql(model))
+    schema_editor.execute(
+        f'CREATE TABLE {schema_editor.quote_name(model._meta.db_table + "_default")} PARTITION OF {table} DEFAULT'
+    )
+
+
+def drop_archive_table(apps, schema_editor):
+    schema_editor.delete_model(apps.get_model('messaging', 'ArchivedMessage'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('messaging', '0009_message_content_search_idx'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='conversation',
+            name='archived_until',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.RunPython(backfill_message_created_at, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='message',
+            name='created_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.CreateModel(
+                    name='ArchivedMessage',
+                    fields=[
+                        ('pk', models.CompositePrimaryKey('id', 'created_at', blank=True, editable=False, primary_key=True, serialize=False)),
+                        ('id', models.UUIDField(default=uuid.uuid4, editable=False)),
+                        ('content', models.TextField(blank=True, null=True)),
+                        ('is_read', models.BooleanField(blank=True, default=False, null=True)),
+                        ('twilio_sid', models.CharField(blank=True, max_length=34, null=True)),
+                        ('twilio_index', models.PositiveIntegerField(blank=True, null=True)),
+                        ('created_at', models.DateTimeField()),
+                        ('archived_at', models.DateTimeField(default=django.utils.timezone.now)),
+                        ('conversation', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_messages', to='messaging.conversation')),
+                        ('sender', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='archived_messages', to=settings.AUTH_USER_MODEL)),
+                    ],
+                    options={
+                        'indexes': [models.Index(fields=['conversation', 'created_at', 'id'], name='archive_convo_created_idx')],
+                    },
+                ),
+            ],
+        ),
+        migrations.RunPython(create_archive_table, drop_archive_table),
+    ]
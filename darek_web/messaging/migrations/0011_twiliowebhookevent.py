@@ -0,0 +1,21 @@
+# Generated by Django 5.2.7 on 2026-10-19 14:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('messaging', '0010_message_archive'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TwilioWebhookEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('payload', models.JSONField()),
+                ('received_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
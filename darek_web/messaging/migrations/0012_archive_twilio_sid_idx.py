@@ -0,0 +1,19 @@
+# Generated by Django 5.2.7 on 2026-10-19 14:09
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('messaging', '0011_twiliowebhookevent'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='archivedmessage',
+            index=models.Index(fields=['twilio_sid'], name='archive_twilio_sid_idx'),
+        ),
+    ]
@@ -1,19 +1,31 @@
 # messaging/models.py
 import uuid
-from django.db import models
+from datetime import datetime, timezone as dt_timezone
+from django.db import models, transaction
+from django.db.models import Case, Q, Value, When
 from django.conf import settings
+from django.utils import timezone
 
 class Conversation(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     participants = models.ManyToManyField(settings.AUTH_USER_MODEL, related_name='conversations')
     listing = models.ForeignKey('listings.Listing', on_delete=models.SET_NULL, null=True, blank=True)
     twilio_sid = models.CharField(max_length=34, blank=True, null=True)
+    # Sorted "<low_id>:<high_id>" for 1:1 chats (null for group chats); unique so a pair maps to one chat
+    participant_key = models.CharField(max_length=64, unique=True, null=True, blank=True, editable=False)
+    # Newest message moved to ArchivedMessage; history reads continue into the archive when set
+    archived_until = models.DateTimeField(null=True, blank=True, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return f"Conversation {self.id} with {', '.join([p.username for p in self.participants.all()])}"
 
+    @staticmethod
+    def pair_key(user_id, other_user_id):
+        low, high = sorted([int(user_id), int(other_user_id)])
+        return f"{low}:{high}"
+
 class Message(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     conversation = models.ForeignKey(
@@ -32,8 +44,155 @@ class Message(models.Model):
     )
     content = models.TextField(null=True, blank=True)
     is_read = models.BooleanField(default=False, null=True, blank=True)
-    twilio_sid = models.CharField(max_length=34, blank=True, null=True)
-    created_at = models.DateTimeField(auto_now_add=True, null=True, blank=True)
+    # Unique so webhook ingestion can bulk insert with ignore_conflicts
+    twilio_sid = models.CharField(max_length=34, blank=True, null=True, unique=True)
+    # Twilio's per-conversation message index; read receipts are reported against it
+    twilio_index = models.PositiveIntegerField(null=True, blank=True)
+    # default rather than auto_now_add so ingested messages keep Twilio's timestamp
+    created_at = models.DateTimeField(default=timezone.now)
 
     def __str__(self):
         return f"Message from {self.sender.username if self.sender else 'Unknown'} in {self.conversation.id if self.conversation else 'No Conversation'}"
+
+    class Meta:
+        indexes = [
+            # Latest-message lookups and history paging within a conversation
+            models.Index(fields=['conversation', 'created_at', 'id'], name='message_convo_created_idx'),
+        ]
+
+
+class ArchivedMessage(models.Model):
+    """
+    Cold copy of a Message, moved here by the archive_messages command. On Postgres the table
+    is range-partitioned by month on created_at (hence the composite primary key), and each
+    month's partition is created with compressed storage. Nothing references these rows, so
+    the hot table's foreign keys and unique twilio_sid are not needed here.
+    """
+    pk = models.CompositePrimaryKey('id', 'created_at')
+    id = models.UUIDField(default=uuid.uuid4, editable=False)
+    conversation = models.ForeignKey(Conversation, on_delete=models.CASCADE, related_name='archived_messages')
+    sender = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='archived_messages', null=True, blank=True
+    )
+    content = models.TextField(null=True, blank=True)
+    is_read = models.BooleanField(default=False, null=True, blank=True)
+    twilio_sid = models.CharField(max_length=34, blank=True, null=True)
+    twilio_index = models.PositiveIntegerField(null=True, blank=True)
+    created_at = models.DateTimeField()
+    archived_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"Archived message {self.id} in {self.conversation_id}"
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['conversation', 'created_at', 'id'], name='archive_convo_created_idx'),
+            # Webhook ingestion checks incoming sids against the archive
+            models.Index(fields=['twilio_sid'], name='archive_twilio_sid_idx'),
+        ]
+
+
+class ConversationReadState(models.Model):
+    """
+    Per-participant read watermark: every message in the conversation created at or before
+    last_read_at counts as read by user. Unread counts are a range scan on
+    message_convo_created_idx past this point instead of a per-message flag.
+    """
+    conversation = models.ForeignKey(Conversation, on_delete=models.CASCADE, related_name='read_states')
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='conversation_read_states')
+    last_read_at = models.DateTimeField()
+    last_read_message = models.ForeignKey(Message, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    updated_at = models.DateTimeField(auto_now=True)
+
+    # Watermark of a row created only to be advanced: before every message
+    UNREAD = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+    def __str__(self):
+        return f"{self.user_id} read {self.conversation_id} up to {self.last_read_at}"
+
+    @classmethod
+    def advance(cls, states):
+        """
+        Move watermarks forward in two statements however many states: an INSERT .. ON CONFLICT
+        DO NOTHING creates missing rows at UNREAD, then one UPDATE rewrites only rows still behind
+        their new value. The comparison happens in that UPDATE, so out-of-order or concurrent
+        calls never move a watermark backwards. Returns how many watermarks moved.
+        """
+        behind, read_at, message = Q(), [], []
+        for state in states:
+            key = Q(conversation_id=state.conversation_id, user_id=state.user_id)
+            behind |= key & Q(last_read_at__lt=state.last_read_at)
+            read_at.append(When(key, then=Value(state.last_read_at)))
+            message.append(When(key, then=Value(state.last_read_message_id, output_field=models.UUIDField())))
+        with transaction.atomic(savepoint=False):
+            cls.objects.bulk_create([
+                cls(conversation_id=state.conversation_id, user_id=state.user_id, last_read_at=cls.UNREAD)
+                for state in states
+            ], ignore_conflicts=True)
+            return cls.objects.filter(behind).update(
+                last_read_at=Case(*read_at, output_field=models.DateTimeField()),
+                last_read_message=Case(*message, output_field=models.UUIDField()),
+                updated_at=timezone.now(),
+            )
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['conversation', 'user'], name='read_state_unique_participant'),
+        ]
+
+
+class MessageOutbox(models.Model):
+    """
+    Pending Twilio delivery for a locally stored Message. Written in the same transaction
+    as the Message and drained by the deliver_outbox management command.
+    """
+    class Status(models.TextChoices):
+        PENDING = 'PENDING', 'Pending'
+        SENT = 'SENT', 'Sent'
+        FAILED = 'FAILED', 'Failed'
+
+    message = models.OneToOneField(Message, on_delete=models.CASCADE, related_name='outbox')
+    status = models.CharField(max_length=10, choices=Status.choices, default=Status.PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    # Due time for the next attempt; also used as a lease while a worker holds the row
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Outbox {self.message_id} ({self.status}, attempts={self.attempts})"
+
+    @property
+    def idempotency_key(self):
+        return str(self.message_id)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='outbox_due_idx'),
+        ]
+
+
+class PooledConversation(models.Model):
+    """Empty, pre-created Twilio service conversation waiting to be claimed by a new chat."""
+    twilio_sid = models.CharField(max_length=34, unique=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Pooled {self.twilio_sid}"
+
+    class Meta:
+        ordering = ['created_at']
+
+
+class TwilioWebhookEvent(models.Model):
+    """
+    Verified Twilio webhook payload staged before the webhook is acknowledged, so an event
+    survives a restart between the 200 and processing. messaging.webhooks drains the table
+    in batches and deletes rows in the transaction that persists them.
+    """
+    payload = models.JSONField()
+    received_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Webhook {self.payload.get('EventType')} received {self.received_at}"
@@ -0,0 +1,141 @@
+# messaging/outbox.py
+"""
+Transactional outbox for Twilio message delivery.
+
+SendMessageView writes the Message and its MessageOutbox row in one transaction and
+returns immediately; deliver_outbox workers claim due rows in batches, push them to
+Twilio and backfill Message.twilio_sid. Rows are leased (next_attempt_at pushed into
+the future) rather than locked for the duration of the HTTP calls, so a crashed worker
+only delays delivery until the lease expires.
+
+The batch lease only reserves rows. Each row is leased again right before its send,
+conditionally on still holding the lease the worker was given, and its outcome is
+recorded as soon as the send returns. A row whose batch lease ran out while earlier
+sends were slow is therefore skipped once another worker has reclaimed it, instead of
+being sent twice. Twilio does not deduplicate on the idempotency key, so a worker dying
+between a send and its SENT commit can still cause one duplicate after the lease expires.
+"""
+import json
+import logging
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from .models import Message, MessageOutbox
+from .realtime import publish_message
+from .twilio_client import twilio_identity_for_user
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 50
+# Minimum lease; a send lease also covers every HTTP attempt of one Twilio call
+LEASE_SECONDS = 60
+MAX_ATTEMPTS = 8
+MAX_BACKOFF_SECONDS = 15 * 60
+
+
+def enqueue_message(conversation, sender, body):
+  """Store a message and its pending delivery atomically. Caller decides the response."""
+  with transaction.atomic():
+    message = Message.objects.create(conversation=conversation, sender=sender, content=body)
+    MessageOutbox.objects.create(message=message)
+    publish_message(message)
+  return message
+
+
+def retry_delay(attempts):
+  return timedelta(seconds=min(2 ** attempts, MAX_BACKOFF_SECONDS))
+
+
+def send_lease():
+  attempts = (settings.TWILIO_HTTP_MAX_RETRIES or 0) + 1
+  return timedelta(seconds=max(LEASE_SECONDS, 2 * settings.TWILIO_HTTP_TIMEOUT * attempts))
+
+
+def claim_batch(batch_size=BATCH_SIZE, lease_seconds=LEASE_SECONDS):
+  """Lease up to batch_size due rows; concurrent workers skip each other's rows."""
+  now = timezone.now()
+  with transaction.atomic():
+    ids = list(
+      MessageOutbox.objects.select_for_update(skip_locked=True)
+      .filter(status=MessageOutbox.Status.PENDING, next_attempt_at__lte=now)
+      .order_by('next_attempt_at')
+      .values_list('id', flat=True)[:batch_size]
+    )
+    if ids:
+      MessageOutbox.objects.filter(id__in=ids).update(next_attempt_at=now + timedelta(seconds=lease_seconds))
+  return list(
+    MessageOutbox.objects.filter(id__in=ids)
+    .select_related('message__conversation', 'message__sender')
+    .order_by('message__created_at')
+  )
+
+
+def _send(client, entry):
+  message = entry.message
+  return client.conversations.services(
+    settings.TWILIO_CONVERSATIONS_SERVICE_SID
+  ).conversations(message.conversation.twilio_sid).messages.create(
+    author=twilio_identity_for_user(message.sender),
+    body=message.content,
+    # Echoed back by Twilio webhooks so the local row can be matched instead of duplicated
+    attributes=json.dumps({"idempotency_key": entry.idempotency_key}),
+  )
+
+
+def _renew_lease(entry):
+  """Lease entry for one send; False when the worker no longer holds it (reclaimed or finished elsewhere)."""
+  lease = timezone.now() + send_lease()
+  held = MessageOutbox.objects.filter(
+    id=entry.id, status=MessageOutbox.Status.PENDING, next_attempt_at=entry.next_attempt_at,
+  ).update(next_attempt_at=lease)
+  entry.next_attempt_at = lease
+  return bool(held)
+
+
+def _record(entry, **fields):
+  # Conditional on the send lease, so a worker that stalled past it cannot overwrite a newer outcome
+  MessageOutbox.objects.filter(id=entry.id, next_attempt_at=entry.next_attempt_at).update(**fields)
+
+
+def deliver_batch(client, batch_size=BATCH_SIZE):
+  """Deliver one claimed batch. Returns (sent, failed) counts."""
+  batch = claim_batch(batch_size)
+  sent = failed = 0
+  for entry in batch:
+    if not _renew_lease(entry):
+      continue
+    entry.attempts += 1
+    try:
+      if not entry.message.conversation or not entry.message.conversation.twilio_sid:
+        raise RuntimeError("Conversation has no Twilio SID yet")
+      remote = _send(client, entry)
+    except Exception as e:
+      logger.warning("Outbox delivery of %s failed (attempt %s): %s", entry.message_id, entry.attempts, e)
+      exhausted = entry.attempts >= MAX_ATTEMPTS
+      _record(
+        entry,
+        status=MessageOutbox.Status.FAILED if exhausted else MessageOutbox.Status.PENDING,
+        attempts=entry.attempts,
+        last_error=str(e)[:1000],
+        next_attempt_at=timezone.now() + retry_delay(entry.attempts),
+      )
+      failed += 1
+      continue
+    # The SID and the SENT marker commit together, before the send lease can run out
+    with transaction.atomic():
+      Message.objects.filter(pk=entry.message_id).update(twilio_sid=remote.sid)
+      _record(entry, status=MessageOutbox.Status.SENT, attempts=entry.attempts, sent_at=timezone.now(), last_error=None)
+    sent += 1
+  return sent, failed
+
+
+def drain(client, batch_size=BATCH_SIZE):
+  """Deliver until nothing is due. Returns (sent, failed) totals."""
+  total_sent = total_failed = 0
+  while True:
+    sent, failed = deliver_batch(client, batch_size)
+    total_sent += sent
+    total_failed += failed
+    if not sent and not failed:
+      return total_sent, total_failed
@@ -0,0 +1,99 @@
+# messaging/provisioning.py
+"""
+Twilio conversation provisioning.
+
+A chat is set up as: take an empty conversation from the local warm pool (one row claim;
+falls back to creating one remotely), then add participants and set name/attributes
+concurrently on a shared thread pool. That turns four sequential round trips into roughly
+one. Keep the pool filled with the warm_conversation_pool command.
+"""
+import json
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.db import transaction
+from .models import PooledConversation
+from .twilio_client import get_twilio_client
+
+logger = logging.getLogger(__name__)
+
+_executor = ThreadPoolExecutor(max_workers=settings.TWILIO_PROVISIONING_WORKERS, thread_name_prefix="twilio-provision")
+
+
+class ProvisioningError(Exception):
+  """Provisioning failed after a conversation SID was obtained; .sid must not be reused."""
+
+  def __init__(self, message, sid=None):
+    super().__init__(message)
+    self.sid = sid
+
+
+def _service(client):
+  return client.conversations.services(settings.TWILIO_CONVERSATIONS_SERVICE_SID)
+
+
+def claim_pooled_sid():
+  """Take one warm conversation SID, or None when the pool is empty."""
+  with transaction.atomic():
+    row = PooledConversation.objects.select_for_update(skip_locked=True).first()
+    if row is None:
+      return None
+    row.delete()
+    return row.twilio_sid
+
+
+def discard_sid(sid):
+  """Forget a SID whose provisioning failed (e.g. a claim rolled back with its transaction)."""
+  PooledConversation.objects.filter(twilio_sid=sid).delete()
+  try:
+    _service(get_twilio_client()).conversations(sid).delete()
+  except Exception:
+    logger.warning("Could not delete Twilio conversation %s after failed provisioning", sid)
+
+
+def provision_conversation(friendly_name, identities, attributes=None):
+  """
+  Return the SID of a conversation named friendly_name with the given participant
+  identities. Raises ProvisioningError (with .sid) if any step fails.
+  """
+  client = get_twilio_client()
+  svc = _service(client)
+  sid = claim_pooled_sid()
+  if sid is None:
+    sid = svc.conversations.create(friendly_name=friendly_name).sid
+    update = {"attributes": json.dumps(attributes)} if attributes else None
+  else:
+    update = {"friendly_name": friendly_name}
+    if attributes:
+      update["attributes"] = json.dumps(attributes)
+
+  convo = svc.conversations(sid)
+  futures = [_executor.submit(convo.participants.create, identity=identity) for identity in identities]
+  if update:
+    futures.append(_executor.submit(convo.update, **update))
+  errors = []
+  for future in futures:
+    try:
+      future.result()
+    except Exception as e:
+      errors.append(e)
+  if errors:
+    raise ProvisioningError(f"Provisioning {sid} failed: {errors[0]}", sid=sid)
+  return sid
+
+
+def fill_pool(target_size):
+  """Top the warm pool up to target_size conversations. Returns how many were created."""
+  missing = target_size - PooledConversation.objects.count()
+  if missing <= 0:
+    return 0
+  svc = _service(get_twilio_client())
+  futures = [_executor.submit(svc.conversations.create, friendly_name="Darek chat") for _ in range(missing)]
+  sids = []
+  for future in futures:
+    try:
+      sids.append(future.result().sid)
+    except Exception as e:
+      logger.warning("Could not pre-create Twilio conversation: %s", e)
+  PooledConversation.objects.bulk_create([PooledConversation(twilio_sid=sid) for sid in sids])
+  return len(sids)
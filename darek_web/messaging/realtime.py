@@ -0,0 +1,288 @@
+# messaging/realtime.py
+"""
+Self-hosted push channel for chat events.
+
+Clients open ws(s)://<host>/ws/messaging/?token=<SimpleJWT access token> and receive JSON
+events for every conversation they take part in:
+
+  {"type": "message.created", "conversation_id": ..., "message": {...}}
+  {"type": "read", "conversation_id": ..., "user_id": ..., "last_read_at": ..., "message_id": ...}
+  {"type": "typing", "conversation_id": ..., "user_id": ...}
+  {"type": "conversation.created", "conversation_id": ...}
+
+and may send {"type": "typing", "conversation_id": ...}. Server code publishes with the
+publish_* helpers, which fire after the surrounding transaction commits. Delivery goes
+through the broker named by MESSAGING_REALTIME_BROKER: InProcessBroker for a single node
+(and tests), PostgresNotifyBroker to fan out across nodes sharing the database.
+"""
+import asyncio
+import json
+import logging
+import select
+import threading
+from collections import defaultdict
+from urllib.parse import parse_qs
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import close_old_connections, connection, transaction
+from django.utils.module_loading import import_string
+from .serializers import InboxMessageSerializer
+
+logger = logging.getLogger(__name__)
+
+WEBSOCKET_PATH = "/ws/messaging/"
+CLOSE_UNAUTHORIZED = 4401
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def conversation_channel(conversation_id):
+  return f"conversation.{conversation_id}"
+
+
+def user_channel(user_id):
+  return f"user.{user_id}"
+
+
+class InProcessBroker:
+  """Fan-out between connections of this process. publish() is safe to call from any thread."""
+
+  def __init__(self):
+    self._subscribers = defaultdict(set)
+    self._lock = threading.Lock()
+
+  def subscribe(self, channel, subscriber):
+    with self._lock:
+      self._subscribers[channel].add(subscriber)
+
+  def unsubscribe(self, channel, subscriber):
+    with self._lock:
+      subscribers = self._subscribers.get(channel)
+      if subscribers is not None:
+        subscribers.discard(subscriber)
+        if not subscribers:
+          del self._subscribers[channel]
+
+  def publish(self, channel, event):
+    self.dispatch(channel, event)
+
+  def dispatch(self, channel, event):
+    with self._lock:
+      subscribers = list(self._subscribers.get(channel, ()))
+    for subscriber in subscribers:
+      subscriber.deliver(event)
+
+
+class PostgresNotifyBroker(InProcessBroker):
+  """
+  Multi-node backend: publish() issues NOTIFY on one shared channel and every process runs a
+  LISTEN thread that dispatches to its local subscribers. Payloads are capped by Postgres at
+  8000 bytes; oversized message events are sent without content for clients to refetch.
+  """
+  PG_CHANNEL = "darek_realtime"
+  MAX_PAYLOAD = 7900
+
+  def __init__(self):
+    super().__init__()
+    self._listener = None
+    self._listener_lock = threading.Lock()
+
+  def subscribe(self, channel, subscriber):
+    self._ensure_listener()
+    super().subscribe(channel, subscriber)
+
+  def publish(self, channel, event):
+    payload = json.dumps({"channel": channel, "event": event}, cls=DjangoJSONEncoder)
+    if len(payload.encode()) > self.MAX_PAYLOAD and "message" in event:
+      slim = dict(event, message={k: v for k, v in event["message"].items() if k != "content"}, truncated=True)
+      payload = json.dumps({"channel": channel, "event": slim}, cls=DjangoJSONEncoder)
+    with connection.cursor() as cursor:
+      cursor.execute("SELECT pg_notify(%s, %s)", [self.PG_CHANNEL, payload])
+
+  def _ensure_listener(self):
+    with self._listener_lock:
+      if self._listener is None or not self._listener.is_alive():
+        self._listener = threading.Thread(target=self._listen, name="realtime-listener", daemon=True)
+        self._listener.start()
+
+  def _listen(self):
+    import psycopg2
+    params = connection.get_connection_params()
+    while True:
+      try:
+        conn = psycopg2.connect(**params)
+        conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+        with conn.cursor() as cursor:
+          cursor.execute(f"LISTEN {self.PG_CHANNEL}")
+        while True:
+          if select.select([conn], [], [], 30) == ([], [], []):
+            continue
+          conn.poll()
+          while conn.notifies:
+            notice = json.loads(conn.notifies.pop(0).payload)
+            self.dispatch(notice["channel"], notice["event"])
+      except Exception:
+        logger.exception("Realtime LISTEN connection lost; reconnecting")
+        threading.Event().wait(1)
+
+
+def get_broker():
+  global _broker
+  if _broker is None:
+    with _broker_lock:
+      if _broker is None:
+        _broker = import_string(settings.MESSAGING_REALTIME_BROKER)()
+  return _broker
+
+
+def publish(channels, event):
+  """Publish event to channels once the current transaction commits (immediately outside one)."""
+  def send():
+    broker = get_broker()
+    for channel in channels:
+      try:
+        broker.publish(channel, event)
+      except Exception:
+        logger.exception("Realtime publish to %s failed", channel)
+  transaction.on_commit(send)
+
+
+def publish_message(message):
+  data = json.loads(json.dumps(InboxMessageSerializer(message).data, cls=DjangoJSONEncoder))
+  publish(
+    [conversation_channel(message.conversation_id)],
+    {"type": "message.created", "conversation_id": str(message.conversation_id), "message": data},
+  )
+
+
+def publish_read(conversation_id, user_id, last_read_at, message_id):
+  publish([conversation_channel(conversation_id)], {
+    "type": "read",
+    "conversation_id": str(conversation_id),
+    "user_id": user_id,
+    "last_read_at": last_read_at.isoformat(),
+    "message_id": str(message_id) if message_id else None,
+  })
+
+
+def publish_conversation_created(conversation_id, user_ids):
+  publish(
+    [user_channel(user_id) for user_id in user_ids],
+    {"type": "conversation.created", "conversation_id": str(conversation_id)},
+  )
+
+
+def _database_sync_to_async(func):
+  def wrapped(*args, **kwargs):
+    close_old_connections()
+    try:
+      return func(*args, **kwargs)
+    finally:
+      close_old_connections()
+  return sync_to_async(wrapped, thread_sensitive=True)
+
+
+@_database_sync_to_async
+def _authenticate(raw_token):
+  from rest_framework_simplejwt.authentication import JWTAuthentication
+  from rest_framework_simplejwt.exceptions import InvalidToken, AuthenticationFailed
+  auth = JWTAuthentication()
+  try:
+    user = auth.get_user(auth.get_validated_token(raw_token))
+  except (InvalidToken, AuthenticationFailed):
+    return None
+  return user if user.is_active else None
+
+
+@_database_sync_to_async
+def _conversation_ids(user_id):
+  from .models import Conversation
+  return [str(pk) for pk in Conversation.participants.through.objects.filter(user_id=user_id)
+          .values_list("conversation_id", flat=True)]
+
+
+class Connection:
+  """One authenticated socket: its subscriptions and an outbound queue fed by the broker."""
+
+  def __init__(self, user_id, broker, loop):
+    self.user_id = user_id
+    self.broker = broker
+    self.loop = loop
+    self.queue = asyncio.Queue()
+    self.channels = set()
+    self.conversation_ids = set()
+
+  def deliver(self, event):
+    self.loop.call_soon_threadsafe(self.queue.put_nowait, event)
+
+  def join(self, conversation_id):
+    self.conversation_ids.add(conversation_id)
+    self.subscribe(conversation_channel(conversation_id))
+
+  def subscribe(self, channel):
+    if channel not in self.channels:
+      self.channels.add(channel)
+      self.broker.subscribe(channel, self)
+
+  def close(self):
+    for channel in self.channels:
+      self.broker.unsubscribe(channel, self)
+    self.channels.clear()
+
+  async def pump(self, send):
+    while True:
+      event = await self.queue.get()
+      if event["type"] == "conversation.created":
+        self.join(event["conversation_id"])
+      if event["type"] == "typing" and event.get("user_id") == self.user_id:
+        continue
+      await send({"type": "websocket.send", "text": json.dumps(event, cls=DjangoJSONEncoder)})
+
+  async def handle(self, text):
+    try:
+      event = json.loads(text or "")
+    except ValueError:
+      return
+    if not isinstance(event, dict):
+      return
+    conversation_id = str(event.get("conversation_id"))
+    if event.get("type") == "typing" and conversation_id in self.conversation_ids:
+      # Backends may do blocking I/O (e.g. NOTIFY on a Django connection), so publish off the
+      # event loop on the shared sync thread, whose connections are closed around each call
+      await _database_sync_to_async(self.broker.publish)(conversation_channel(conversation_id), {
+        "type": "typing", "conversation_id": conversation_id, "user_id": self.user_id,
+      })
+
+
+async def websocket_application(scope, receive, send):
+  event = await receive()
+  if event["type"] != "websocket.connect":
+    return
+  if scope.get("path") != WEBSOCKET_PATH:
+    await send({"type": "websocket.close", "code": 4404})
+    return
+  token = (parse_qs(scope.get("query_string", b"").decode()).get("token") or [""])[0]
+  user = await _authenticate(token) if token else None
+  if user is None:
+    await send({"type": "websocket.close", "code": CLOSE_UNAUTHORIZED})
+    return
+
+  conn = Connection(user.id, get_broker(), asyncio.get_running_loop())
+  conn.subscribe(user_channel(user.id))
+  for conversation_id in await _conversation_ids(user.id):
+    conn.join(conversation_id)
+  await send({"type": "websocket.accept"})
+
+  pump = asyncio.ensure_future(conn.pump(send))
+  try:
+    while True:
+      event = await receive()
+      if event["type"] == "websocket.disconnect":
+        break
+      if event["type"] == "websocket.receive":
+        await conn.handle(event.get("text"))
+  finally:
+    pump.cancel()
+    conn.close()
@@ -0,0 +1,88 @@
+# messaging/search.py
+"""
+Full-text search over Message.content, scoped to the caller's conversations.
+
+On Postgres the match uses the english+arabic tsvector that message_content_search_idx
+(GIN, migration 0009) is built on, so the expression here must stay identical to the index
+definition. Highlights are computed with ts_headline only for the rows of the returned page.
+Other databases (local SQLite) fall back to a substring match.
+"""
+import html
+import re
+from django.contrib.postgres.search import SearchHeadline, SearchQuery, SearchVector
+from django.db import connection
+from users.serializers import UserCompactSerializer
+from .models import Conversation, Message
+
+SEARCH_CONFIGS = ("english", "arabic")
+MIN_QUERY_LENGTH = 2
+SNIPPET_CHARS = 60
+# Control characters never appear in chat text; swapped for <mark> after HTML-escaping
+_START, _STOP = "\x02", "\x03"
+_ARABIC = re.compile(r"[\u0600-\u06FF]")
+
+
+def use_full_text():
+  return connection.vendor == "postgresql"
+
+
+def search_vector():
+  english, arabic = SEARCH_CONFIGS
+  return SearchVector("content", config=english) + SearchVector("content", config=arabic)
+
+
+def search_query(q):
+  english, arabic = SEARCH_CONFIGS
+  return SearchQuery(q, config=english, search_type="websearch") | SearchQuery(q, config=arabic, search_type="websearch")
+
+
+def search_messages(user, q):
+  """Messages matching q in conversations user takes part in (unordered; paginate on created_at)."""
+  # Membership comes from the participants table's user_id index rather than a join through Conversation
+  member_of = Conversation.participants.through.objects.filter(user_id=user.id).values("conversation_id")
+  messages = Message.objects.filter(conversation_id__in=member_of)
+  if use_full_text():
+    messages = messages.alias(document=search_vector()).filter(document=search_query(q))
+  else:
+    messages = messages.filter(content__icontains=q)
+  sender_fields = [f"sender__{name}" for name in UserCompactSerializer.Meta.fields]
+  return messages.select_related("sender").only(
+    "id", "conversation_id", "content", "is_read", "created_at", "twilio_sid", "sender", *sender_fields
+  )
+
+
+def _fallback_snippet(content, q):
+  position = content.lower().find(q.lower())
+  if position < 0:
+    return content[:SNIPPET_CHARS * 2]
+  start = max(position - SNIPPET_CHARS, 0)
+  end = min(position + len(q) + SNIPPET_CHARS, len(content))
+  return (
+    ("…" if start else "") + content[start:position] + _START + content[position:position + len(q)] + _STOP
+    + content[position + len(q):end] + ("…" if end < len(content) else "")
+  )
+
+
+def render_highlight(raw):
+  return html.escape(raw or "").replace(_START, "<mark>").replace(_STOP, "</mark>")
+
+
+def attach_highlights(messages, q):
+  """Set .highlight (escaped HTML with <mark> around matches) on each message of one page."""
+  if not messages:
+    return messages
+  if use_full_text():
+    config = "arabic" if _ARABIC.search(q) else "english"
+    headlines = dict(
+      Message.objects.filter(id__in=[m.id for m in messages])
+      .annotate(headline=SearchHeadline(
+        "content", SearchQuery(q, config=config, search_type="websearch"), config=config,
+        start_sel=_START, stop_sel=_STOP, max_words=30, min_words=10, max_fragments=2,
+      ))
+      .values_list("id", "headline")
+    )
+  else:
+    headlines = {m.id: _fallback_snippet(m.content or "", q) for m in messages}
+  for message in messages:
+    message.highlight = render_highlight(headlines.get(message.id))
+  return messages
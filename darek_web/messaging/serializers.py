@@ -1,7 +1,7 @@
 # messaging/serializers.py
 from rest_framework import serializers
 from .models import Conversation, Message
-from users.serializers import UserSerializer
+from users.serializers import UserSerializer, UserCompactSerializer
 
 class MessageSerializer(serializers.ModelSerializer):
     sender = UserSerializer(read_only=True)
@@ -22,4 +22,44 @@ class ConversationSerializer(serializers.ModelSerializer):
 
     def get_last_message(self, obj):
         last_msg = obj.messages.order_by('-created_at').first()
-        return MessageSerializer(last_msg).data if last_msg else None
\ No newline at end of file
+        return MessageSerializer(last_msg).data if last_msg else None
+
+
+class InboxMessageSerializer(serializers.ModelSerializer):
+    sender = UserCompactSerializer(read_only=True)
+
+    class Meta:
+        model = Message
+        fields = ['id', 'sender', 'content', 'is_read', 'created_at', 'twilio_sid']
+        read_only_fields = fields
+
+
+class MessageSearchResultSerializer(InboxMessageSerializer):
+    """Search hit; highlight is escaped HTML with <mark> around matches (set by search.attach_highlights)."""
+    conversation_id = serializers.UUIDField(read_only=True)
+    highlight = serializers.CharField(read_only=True)
+
+    class Meta(InboxMessageSerializer.Meta):
+        fields = InboxMessageSerializer.Meta.fields + ['conversation_id', 'highlight']
+        read_only_fields = fields
+
+
+class InboxConversationSerializer(serializers.ModelSerializer):
+    """Inbox row; relies on the annotations/prefetches built by InboxView.get_queryset."""
+    participants = UserCompactSerializer(many=True, read_only=True)
+    last_message = serializers.SerializerMethodField()
+    unread_count = serializers.IntegerField(read_only=True)
+    last_activity_at = serializers.DateTimeField(read_only=True)
+
+    class Meta:
+        model = Conversation
+        fields = [
+            'id', 'participants', 'listing', 'last_message', 'unread_count',
+            'last_activity_at', 'created_at', 'twilio_sid'
+        ]
+        read_only_fields = fields
+
+    def get_last_message(self, obj):
+        latest = getattr(obj, 'latest_messages', None)
+        return InboxMessageSerializer(latest[0]).data if latest else None
+
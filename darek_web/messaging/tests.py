@@ -1,18 +1,44 @@
 # messaging/tests.py
-from django.test import TestCase, RequestFactory
+import json
+import threading
+import time
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, RequestFactory, override_settings
+from asgiref.sync import sync_to_async
+from asgiref.testing import ApplicationCommunicator
+from rest_framework_simplejwt.tokens import AccessToken as JWTAccessToken
 from django.contrib.auth import get_user_model
 from rest_framework.test import APIRequestFactory, force_authenticate
 from rest_framework import status
 from twilio.rest import Client
 from unittest.mock import patch
-from .views import TwilioAccessTokenView, CreateConversationView
-from .models import Conversation
+from twilio.request_validator import RequestValidator
+from datetime import timedelta
+from django.utils import timezone
+from django.core.cache import cache
+from django.core.management import call_command
+from io import StringIO
+from .views import (
+    TwilioAccessTokenView, CreateConversationView, InboxView, SendMessageView, TwilioWebhookView,
+    MarkConversationReadView, MarkMessageReadView, MessageHistoryView, MessageSearchView,
+)
+from .models import ArchivedMessage, Conversation, ConversationReadState, Message, MessageOutbox
+from .fake_twilio import FakeTwilioClient, FakeTwilioServer
+from .twilio_client import _reset_client, get_twilio_client, TwilioCircuitOpenError
+from .models import PooledConversation, TwilioWebhookEvent
+from . import provisioning
+from . import outbox
+from . import search, webhooks
+from .realtime import websocket_application, CLOSE_UNAUTHORIZED
 from django.conf import settings
 
 User = get_user_model()
 
 class MessagingTests(TestCase):
     def setUp(self):
+        # Tests patch twilio.rest.Client; each builds the shared client afresh and leaves none behind
+        _reset_client()
+        self.addCleanup(_reset_client)
         self.user1 = User.objects.create_user(username='user1', email='user1@example.com', password='pass', role='student')
         self.user2 = User.objects.create_user(username='user2', email='user2@example.com', password='pass', role='landlord')
         self.factory = APIRequestFactory()
@@ -25,6 +51,29 @@ class MessagingTests(TestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertIn('token', response.data)
 
+    @override_settings(TWILIO_ACCOUNT_SID='ACtest', TWILIO_AUTH_TOKEN='auth', TWILIO_API_KEY_SID='SKtest',
+                       TWILIO_API_SECRET='secret', TWILIO_CONVERSATIONS_SERVICE_SID='IStest')
+    def test_twilio_access_token_is_cached_until_near_expiry(self):
+        cache.clear()
+        view = TwilioAccessTokenView.as_view()
+
+        def fetch(user):
+            request = self.factory.get('/messaging/twilio-token/')
+            force_authenticate(request, user=user)
+            return view(request).data
+
+        first = fetch(self.user1)
+        self.assertEqual(fetch(self.user1)['token'], first['token'])
+        self.assertGreater(first['ttl'], settings.TWILIO_TOKEN_TTL - 5)
+        self.assertNotEqual(fetch(self.user2)['token'], first['token'])
+
+        # Inside the refresh margin a freshly signed token is issued
+        near_expiry = time.time() + settings.TWILIO_TOKEN_TTL - settings.TWILIO_TOKEN_REFRESH_MARGIN + 1
+        with patch('messaging.twilio_client.time.time', return_value=near_expiry):
+            refreshed = fetch(self.user1)
+        self.assertNotEqual(refreshed['token'], first['token'])
+        self.assertEqual(refreshed['ttl'], settings.TWILIO_TOKEN_TTL)
+
     @patch('twilio.rest.Client')  # Mock Twilio to avoid real API calls
     def test_create_conversation(self, mock_client):
         # Setup mock Twilio responses
@@ -43,7 +92,9 @@ class MessagingTests(TestCase):
 
     def test_duplicate_conversation(self):
         # Create an existing convo in DB
-        convo = Conversation.objects.create(twilio_sid='CHexisting')
+        convo = Conversation.objects.create(
+            twilio_sid='CHexisting', participant_key=Conversation.pair_key(self.user1.id, self.user2.id)
+        )
         convo.participants.add(self.user1, self.user2)
 
         request = self.factory.post('/messaging/conversations/create/', {'other_user_id': self.user2.id})
@@ -53,9 +104,551 @@ class MessagingTests(TestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(response.data['conversation_sid'], 'CHexisting')
 
+    def test_provisioning_runs_outside_transactions_and_first_sid_wins(self):
+        key = Conversation.pair_key(self.user1.id, self.user2.id)
+        request = self.factory.post('/messaging/conversations/create/', {'other_user_id': self.user2.id})
+        force_authenticate(request, user=self.user1)
+        outer_savepoints = len(connection.savepoint_ids)
+
+        def provision(*args, **kwargs):
+            # No transaction of the view is open while Twilio is called
+            self.assertEqual(len(connection.savepoint_ids), outer_savepoints)
+            self.assertEqual(Conversation.objects.get(participant_key=key).participants.count(), 2)
+            # Meanwhile a concurrent request for the same pair records its conversation
+            Conversation.objects.filter(participant_key=key).update(twilio_sid='CHfirst')
+            return 'CHsecond'
+
+        with patch('messaging.views.provision_conversation', side_effect=provision), \
+                patch('messaging.views.discard_sid') as discard:
+            response = CreateConversationView.as_view()(request)
+        self.assertEqual((response.status_code, response.data['conversation_sid']), (status.HTTP_200_OK, 'CHfirst'))
+        discard.assert_called_once_with('CHsecond')
+        self.assertEqual(Conversation.objects.get(participant_key=key).twilio_sid, 'CHfirst')
+
     def test_invalid_user(self):
         request = self.factory.post('/messaging/conversations/create/', {'other_user_id': 999})
         force_authenticate(request, user=self.user1)
         view = CreateConversationView.as_view()
         response = view(request)
-        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
\ No newline at end of file
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_inbox_fixed_queries_with_last_message_and_unread(self):
+        others = [
+            User.objects.create_user(username=f'peer{i}', email=f'peer{i}@example.com', password='pass', role='student')
+            for i in range(6)
+        ]
+        for i, other in enumerate(others):
+            convo = Conversation.objects.create(twilio_sid=f'CH{i}')
+            convo.participants.add(self.user1, other)
+            Message.objects.create(conversation=convo, sender=other, content='hi')
+            Message.objects.create(conversation=convo, sender=self.user1, content=f'last {i}')
+        Message.objects.create(conversation=convo, sender=others[-1], content='newest')
+
+        request = self.factory.get('/messaging/conversations/')
+        force_authenticate(request, user=self.user1)
+        with self.assertNumQueries(3):
+            response = InboxView.as_view()(request)
+            response.render()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        rows = response.data['results']
+        self.assertEqual(len(rows), 6)
+        self.assertEqual(rows[0]['last_message']['content'], 'newest')
+        self.assertEqual(rows[0]['unread_count'], 2)
+        self.assertEqual(rows[1]['last_message']['content'], 'last 4')
+        self.assertEqual(rows[1]['unread_count'], 1)
+        self.assertEqual(len(rows[0]['participants']), 2)
+
+    def inbox_unread(self, user):
+        request = self.factory.get('/messaging/conversations/')
+        force_authenticate(request, user=user)
+        return {row['id']: row['unread_count'] for row in InboxView.as_view()(request).data['results']}
+
+    def mark_conversation_read(self, convo, user, **data):
+        request = self.factory.post(f'/messaging/conversations/{convo.id}/read/', data)
+        force_authenticate(request, user=user)
+        return MarkConversationReadView.as_view()(request, conversation_id=convo.id)
+
+    def test_read_up_to_is_one_request_and_constant_statements(self):
+        convo = Conversation.objects.create(twilio_sid='CHread')
+        convo.participants.add(self.user1, self.user2)
+        start = timezone.now() - timedelta(hours=1)
+        Message.objects.bulk_create([
+            Message(conversation=convo, sender=self.user2, content=f'm{i}', created_at=start + timedelta(seconds=i))
+            for i in range(500)
+        ])
+        self.assertEqual(self.inbox_unread(self.user1)[str(convo.id)], 500)
+
+        # lookup, then insert-if-missing + conditional watermark UPDATE + one set-based is_read UPDATE inside a savepoint
+        with self.assertNumQueries(6):
+            response = self.mark_conversation_read(convo, self.user1)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.inbox_unread(self.user1)[str(convo.id)], 0)
+        self.assertFalse(Message.objects.filter(conversation=convo, is_read=False).exists())
+
+        # Replays and older targets never move the watermark back
+        older = Message.objects.get(content='m10')
+        with self.assertNumQueries(1):
+            self.mark_conversation_read(convo, self.user1, message_id=str(older.id))
+        Message.objects.create(conversation=convo, sender=self.user2, content='new')
+        self.assertEqual(self.inbox_unread(self.user1)[str(convo.id)], 1)
+        self.assertEqual(ConversationReadState.objects.get(conversation=convo, user=self.user1).last_read_message.content, 'm499')
+
+    def test_watermark_write_is_forward_only(self):
+        convo = Conversation.objects.create(twilio_sid='CHorder')
+        convo.participants.add(self.user1, self.user2)
+        older = Message.objects.create(conversation=convo, sender=self.user2, content='older')
+        newer = Message.objects.create(conversation=convo, sender=self.user2, content='newer')
+
+        def state(message):
+            return ConversationReadState(conversation=convo, user=self.user1,
+                                         last_read_at=message.created_at, last_read_message=message)
+
+        self.assertEqual(ConversationReadState.advance([state(newer)]), 1)
+        # A call that checked the stored watermark before the newer one landed
+        self.assertEqual(ConversationReadState.advance([state(older)]), 0)
+        stored = ConversationReadState.objects.get(conversation=convo, user=self.user1)
+        self.assertEqual((stored.last_read_at, stored.last_read_message), (newer.created_at, newer))
+
+    def test_read_up_to_rejects_non_participants(self):
+        outsider = User.objects.create_user(username='outsider', email='o@example.com', password='pass', role='student')
+        convo = Conversation.objects.create(twilio_sid='CHprivate')
+        convo.participants.add(self.user1, self.user2)
+        self.assertEqual(self.mark_conversation_read(convo, outsider).status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_legacy_mark_read_advances_watermark(self):
+        convo = Conversation.objects.create(twilio_sid='CHlegacy')
+        convo.participants.add(self.user1, self.user2)
+        first = Message.objects.create(conversation=convo, sender=self.user2, content='a', twilio_sid='IMa')
+        Message.objects.create(conversation=convo, sender=self.user2, content='b', twilio_sid='IMb')
+        request = self.factory.post('/messaging/messages/mark-read/', {'message_sid': 'IMa'})
+        force_authenticate(request, user=self.user1)
+        self.assertEqual(MarkMessageReadView.as_view()(request).status_code, status.HTTP_200_OK)
+        self.assertEqual(ConversationReadState.objects.get(conversation=convo, user=self.user1).last_read_message, first)
+        self.assertEqual(self.inbox_unread(self.user1)[str(convo.id)], 1)
+
+    def test_message_history_pages_backwards_at_constant_cost(self):
+        convo = Conversation.objects.create(twilio_sid='CHhistory')
+        convo.participants.add(self.user1, self.user2)
+        start = timezone.now() - timedelta(hours=1)
+        Message.objects.bulk_create([
+            Message(conversation=convo, sender=self.user2 if i % 2 else self.user1, content=f'm{i}',
+                    created_at=start + timedelta(seconds=i // 2))  # pairs share a timestamp; id breaks ties
+            for i in range(95)
+        ])
+        url = f'/messaging/conversations/{convo.id}/messages/?page_size=30'
+        seen = []
+        while url:
+            request = self.factory.get(url)
+            force_authenticate(request, user=self.user1)
+            with self.assertNumQueries(2):
+                response = MessageHistoryView.as_view()(request, conversation_id=convo.id)
+                response.render()
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            seen.extend(response.data['results'])
+            url = response.data['next']
+        self.assertEqual(len(seen), 95)
+        self.assertEqual(len({row['id'] for row in seen}), 95)
+        self.assertIn(seen[-1]['content'], {'m0', 'm1'})
+        self.assertEqual([row['created_at'] for row in seen], sorted((row['created_at'] for row in seen), reverse=True))
+        self.assertEqual(set(seen[0]['sender']), {'id', 'username', 'first_name', 'last_name', 'role', 'gender', 'avatar_url', 'avatar'})
+
+        outsider = User.objects.create_user(username='outsider', email='o@example.com', password='pass', role='student')
+        request = self.factory.get(f'/messaging/conversations/{convo.id}/messages/')
+        force_authenticate(request, user=outsider)
+        self.assertEqual(MessageHistoryView.as_view()(request, conversation_id=convo.id).status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_archive_moves_cold_months_and_history_reads_through(self):
+        convo = Conversation.objects.create(twilio_sid='CHarchive')
+        convo.participants.add(self.user1, self.user2)
+        old, recent = timezone.now() - timedelta(days=250), timezone.now() - timedelta(days=3)
+        Message.objects.bulk_create(
+            [Message(conversation=convo, sender=self.user2, content=f'old {i}', created_at=old + timedelta(minutes=i))
+             for i in range(25)]
+            + [Message(conversation=convo, sender=self.user1, content=f'new {i}', created_at=recent + timedelta(minutes=i))
+               for i in range(15)]
+        )
+        call_command('archive_messages', keep_months=6, batch_size=10, stdout=StringIO())
+        self.assertEqual(Message.objects.filter(conversation=convo).count(), 15)
+        self.assertEqual(ArchivedMessage.objects.filter(conversation=convo).count(), 25)
+        convo.refresh_from_db()
+        self.assertEqual(convo.archived_until, old + timedelta(minutes=24))
+
+        url, seen = f'/messaging/conversations/{convo.id}/messages/?page_size=10', []
+        while url:
+            request = self.factory.get(url)
+            force_authenticate(request, user=self.user1)
+            with self.assertNumQueries(2):
+                response = MessageHistoryView.as_view()(request, conversation_id=convo.id)
+                response.render()
+            seen.extend(response.data['results'])
+            url = response.data['next']
+        self.assertEqual([row['content'] for row in seen],
+                         [f'new {i}' for i in reversed(range(15))] + [f'old {i}' for i in reversed(range(25))])
+        self.assertEqual(seen[-1]['sender']['username'], 'user2')
+
+    def test_archive_stops_before_months_with_undelivered_messages(self):
+        convo = Conversation.objects.create(twilio_sid='CHpending')
+        older, old = timezone.now() - timedelta(days=300), timezone.now() - timedelta(days=250)
+        delivered = Message.objects.create(conversation=convo, sender=self.user1, content='delivered', created_at=older)
+        pending = Message.objects.create(conversation=convo, sender=self.user1, content='pending', created_at=old)
+        later = Message.objects.create(conversation=convo, sender=self.user1, content='same month', created_at=old + timedelta(minutes=1))
+        MessageOutbox.objects.create(message=pending)
+        with self.assertLogs('messaging.archive', 'WARNING'):
+            call_command('archive_messages', keep_months=6, stdout=StringIO())
+        # The undelivered message keeps its outbox row, and its month waits with it
+        self.assertEqual(list(ArchivedMessage.objects.values_list('id', flat=True)), [delivered.id])
+        self.assertEqual(set(Message.objects.values_list('id', flat=True)), {pending.id, later.id})
+        self.assertTrue(MessageOutbox.objects.filter(message=pending).exists())
+
+        MessageOutbox.objects.filter(message=pending).update(status=MessageOutbox.Status.SENT)
+        call_command('archive_messages', keep_months=6, stdout=StringIO())
+        self.assertFalse(Message.objects.exists())
+
+    def test_history_without_archive_ends_on_hot_table(self):
+        convo = Conversation.objects.create(twilio_sid='CHhot')
+        convo.participants.add(self.user1, self.user2)
+        Message.objects.create(conversation=convo, sender=self.user2, content='only')
+        call_command('archive_messages', stdout=StringIO())
+        request = self.factory.get(f'/messaging/conversations/{convo.id}/messages/')
+        force_authenticate(request, user=self.user1)
+        response = MessageHistoryView.as_view()(request, conversation_id=convo.id)
+        self.assertEqual([row['content'] for row in response.data['results']], ['only'])
+        self.assertIsNone(response.data['next'])
+
+    def search(self, user, q, url=None):
+        request = self.factory.get(url or '/messaging/messages/search/', None if url else {'q': q, 'page_size': 2})
+        force_authenticate(request, user=user)
+        return MessageSearchView.as_view()(request)
+
+    def test_message_search_is_scoped_paginated_and_highlighted(self):
+        mine = Conversation.objects.create(twilio_sid='CHmine')
+        mine.participants.add(self.user1, self.user2)
+        outsider = User.objects.create_user(username='outsider', email='o@example.com', password='pass', role='student')
+        theirs = Conversation.objects.create(twilio_sid='CHtheirs')
+        theirs.participants.add(self.user2, outsider)
+        start = timezone.now() - timedelta(hours=1)
+        for i, text in enumerate(['Is the apartment near KSU?', 'The apartment has <b>wifi</b>', 'الشقة قريبة من الجامعة',
+                                  'another apartment question']):
+            Message.objects.create(conversation=mine, sender=self.user2, content=text, created_at=start + timedelta(minutes=i))
+        Message.objects.create(conversation=theirs, sender=outsider, content='secret apartment', created_at=start)
+
+        response = self.search(self.user1, 'apartment')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        hits = response.data['results']
+        response = self.search(self.user1, None, url=response.data['next'])
+        hits += response.data['results']
+        self.assertIsNone(response.data['next'])
+        self.assertEqual([hit['content'] for hit in hits],
+                         ['another apartment question', 'The apartment has <b>wifi</b>', 'Is the apartment near KSU?'])
+        self.assertEqual(hits[1]['highlight'], 'The <mark>apartment</mark> has &lt;b&gt;wifi&lt;/b&gt;')
+        self.assertEqual(hits[0]['conversation_id'], str(mine.id))
+
+        arabic = self.search(self.user1, 'الجامعة').data['results']
+        self.assertEqual(len(arabic), 1)
+        self.assertIn('<mark>الجامعة</mark>', arabic[0]['highlight'])
+        self.assertEqual(self.search(self.user1, 'a').status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_search_vector_matches_the_gin_index_definition(self):
+        # Postgres only uses message_content_search_idx when the expressions are identical
+        from importlib import import_module
+        migration = import_module('messaging.migrations.0009_message_content_search_idx')
+        self.assertEqual(search.SEARCH_CONFIGS, ('english', 'arabic'))
+        for config in search.SEARCH_CONFIGS:
+            self.assertIn(f"to_tsvector('{config}'::regconfig, COALESCE(\"content\", ''))", migration.CREATE_SQL)
+
+    @patch('messaging.provisioning.get_twilio_client')
+    def test_pair_key_reuses_conversation_in_either_direction(self, mock_client):
+        mock_client.return_value.conversations.services.return_value.conversations.create.return_value.sid = 'CHpair'
+        view = CreateConversationView.as_view()
+
+        request = self.factory.post('/messaging/conversations/create/', {'other_user_id': self.user2.id})
+        force_authenticate(request, user=self.user1)
+        self.assertEqual(view(request).status_code, status.HTTP_201_CREATED)
+
+        request = self.factory.post('/messaging/conversations/create/', {'other_user_id': self.user1.id})
+        force_authenticate(request, user=self.user2)
+        response = view(request)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['conversation_sid'], 'CHpair')
+        self.assertEqual(Conversation.objects.count(), 1)
+        self.assertEqual(mock_client.return_value.conversations.services.return_value.conversations.create.call_count, 1)
+
+    def test_send_message_queues_and_worker_backfills_sid(self):
+        convo = Conversation.objects.create(twilio_sid='CHsend')
+        convo.participants.add(self.user1, self.user2)
+        request = self.factory.post('/messaging/messages/send/', {'conversation_sid': 'CHsend', 'body': 'hello'})
+        force_authenticate(request, user=self.user1)
+        response = SendMessageView.as_view()(request)
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        message = Message.objects.get(pk=response.data['id'])
+        self.assertIsNone(message.twilio_sid)
+        self.assertEqual(message.outbox.status, MessageOutbox.Status.PENDING)
+
+        client = FakeTwilioClient()
+        self.assertEqual(outbox.drain(client), (1, 0))
+        message.refresh_from_db()
+        self.assertEqual(message.twilio_sid, client.messages[0].sid)
+        self.assertIn(str(message.id), client.messages[0].attributes)
+        self.assertEqual(message.outbox.status, MessageOutbox.Status.SENT)
+
+    def test_outbox_retries_with_backoff(self):
+        convo = Conversation.objects.create(twilio_sid='CHretry')
+        message = outbox.enqueue_message(convo, self.user1, 'retry me')
+        self.assertEqual(outbox.deliver_batch(FakeTwilioClient(fail_every=1)), (0, 1))
+        entry = MessageOutbox.objects.get(message=message)
+        self.assertEqual((entry.status, entry.attempts), (MessageOutbox.Status.PENDING, 1))
+        self.assertIsNotNone(entry.last_error)
+        # Not due again until the backoff elapses
+        self.assertEqual(outbox.deliver_batch(FakeTwilioClient()), (0, 0))
+
+    def test_outbox_skips_rows_reclaimed_by_another_worker(self):
+        convo = Conversation.objects.create(twilio_sid='CHlease')
+        first = outbox.enqueue_message(convo, self.user1, 'first')
+        second = outbox.enqueue_message(convo, self.user1, 'second')
+        claimed = outbox.claim_batch()
+
+        def slow_then_reclaimed(*args, **kwargs):
+            # The batch lease on 'second' ran out during this send and another worker took it
+            MessageOutbox.objects.filter(message=second).update(next_attempt_at=timezone.now() + timedelta(minutes=5))
+            return claimed
+
+        client = FakeTwilioClient()
+        with patch('messaging.outbox.claim_batch', side_effect=slow_then_reclaimed):
+            self.assertEqual(outbox.deliver_batch(client), (1, 0))
+        self.assertEqual([m.body for m in client.messages], ['first'])
+        first.refresh_from_db()
+        self.assertEqual(first.twilio_sid, client.messages[0].sid)
+        self.assertEqual(MessageOutbox.objects.get(message=second).status, MessageOutbox.Status.PENDING)
+
+
+class SharedTwilioClientTests(TestCase):
+    def setUp(self):
+        _reset_client()
+        self.addCleanup(_reset_client)
+        self.server = FakeTwilioServer().start()
+        self.addCleanup(self.server.stop)
+
+    def test_shared_client_is_reused_and_targets_stand_in(self):
+        with override_settings(TWILIO_API_BASE_URL=self.server.url):
+            client = get_twilio_client()
+            self.assertIs(client, get_twilio_client())
+            convo = client.conversations.services('ISfake').conversations.create(friendly_name='Load test')
+            self.assertTrue(convo.sid.startswith('CH'))
+            client.conversations.services('ISfake').conversations(convo.sid).participants.create(identity='user_1_0')
+            self.assertEqual(self.server.backend.participants[convo.sid], ['user_1_0'])
+            self.assertEqual(client.http_client.stats['requests'], 2)
+
+    def test_circuit_opens_after_repeated_failures(self):
+        self.server.backend.fail_every = 1
+        with override_settings(TWILIO_API_BASE_URL=self.server.url, TWILIO_CIRCUIT_FAILURE_THRESHOLD=2,
+                               TWILIO_HTTP_MAX_RETRIES=None, TWILIO_HTTP_TIMEOUT=5.0):
+            service = get_twilio_client().conversations.services('ISfake')
+            for _ in range(2):
+                with self.assertRaises(Exception):
+                    service.conversations.create(friendly_name='x')
+            calls = len(self.server.backend.calls)
+            with self.assertRaises(TwilioCircuitOpenError):
+                service.conversations.create(friendly_name='x')
+            self.assertEqual(len(self.server.backend.calls), calls)
+
+
+class ProvisioningTests(TestCase):
+    def setUp(self):
+        self.fake = FakeTwilioClient(latency=0.05)
+        patcher = patch('messaging.provisioning.get_twilio_client', return_value=self.fake)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_pooled_conversation_needs_only_concurrent_participant_adds(self):
+        self.assertEqual(provisioning.fill_pool(2), 2)
+        self.fake.calls.clear()
+        # Each call waits until all three are in flight, so calls made one after another never get past it
+        in_flight = threading.Barrier(3, timeout=5)
+        threads = []
+        record = self.fake._call
+
+        def concurrent_call(name):
+            threads.append(threading.current_thread().name)
+            in_flight.wait()
+            record(name)
+
+        with patch.object(self.fake, '_call', side_effect=concurrent_call):
+            sid = provisioning.provision_conversation('Chat', ['user_1_0', 'user_2_0'], attributes={'usernames': {}})
+        self.assertEqual(PooledConversation.objects.count(), 1)
+        self.assertEqual(sorted(self.fake.calls), ['conversations.update', 'participants.create', 'participants.create'])
+        self.assertEqual(sorted(self.fake.participants[sid]), ['user_1_0', 'user_2_0'])
+        # No Twilio call is made on the request thread
+        self.assertTrue(all(name.startswith('twilio-provision') for name in threads), threads)
+
+    def test_empty_pool_falls_back_to_remote_create(self):
+        sid = provisioning.provision_conversation('Chat', ['user_1_0'])
+        self.assertIn(sid, self.fake.created_conversations)
+        self.assertEqual(self.fake.participants[sid], ['user_1_0'])
+
+
+@override_settings(TWILIO_AUTH_TOKEN='webhook-secret', TWILIO_WEBHOOK_URL='https://api.example.com/messaging/webhooks/twilio/')
+class WebhookIngestionTests(TestCase):
+    def setUp(self):
+        self.user1 = User.objects.create_user(username='user1', email='user1@example.com', password='pass', role='student')
+        self.user2 = User.objects.create_user(username='user2', email='user2@example.com', password='pass', role='landlord')
+        self.convo = Conversation.objects.create(twilio_sid='CHhook')
+        self.convo.participants.add(self.user1, self.user2)
+        self.factory = APIRequestFactory()
+
+    def added(self, sid, index, author, body='hi', **extra):
+        return {'EventType': 'onMessageAdded', 'ConversationSid': 'CHhook', 'MessageSid': sid,
+                'Index': str(index), 'Author': f'user_{author.id}_0', 'Body': body,
+                'DateCreated': '2025-01-01T10:00:00Z', **extra}
+
+    def post_signed(self, params, signature=None):
+        if signature is None:
+            signature = RequestValidator('webhook-secret').compute_signature(settings.TWILIO_WEBHOOK_URL, params)
+        request = self.factory.post('/messaging/webhooks/twilio/', params, HTTP_X_TWILIO_SIGNATURE=signature)
+        return TwilioWebhookView.as_view()(request)
+
+    @patch('messaging.webhooks.enqueue')
+    def test_signature_is_verified_before_buffering(self, enqueue):
+        params = self.added('IM1', 0, self.user1)
+        self.assertEqual(self.post_signed(params, signature='forged').status_code, status.HTTP_403_FORBIDDEN)
+        enqueue.assert_not_called()
+        self.assertEqual(self.post_signed(params).status_code, status.HTTP_200_OK)
+        enqueue.assert_called_once_with(params)
+
+    def test_batch_is_persisted_in_fixed_queries_and_retries_are_ignored(self):
+        events = [self.added(f'IM{i}', i, self.user1 if i % 2 else self.user2, body=f'm{i}') for i in range(30)]
+        # conversations, authors, existing sids, archived sids, one insert, inserted ids (+ savepoint pair)
+        with self.assertNumQueries(8):
+            webhooks.persist_events(events)
+        webhooks.persist_events(events[:10])  # Twilio retries deliver the same events again
+        self.assertEqual(Message.objects.filter(conversation=self.convo).count(), 30)
+        message = Message.objects.get(twilio_sid='IM3')
+        self.assertEqual((message.sender, message.twilio_index, message.created_at.year), (self.user1, 3, 2025))
+
+    def test_outbox_echo_backfills_local_message(self):
+        local = Message.objects.create(conversation=self.convo, sender=self.user1, content='hello')
+        webhooks.persist_events([self.added('IMecho', 0, self.user1, body='hello',
+                                            Attributes='{"idempotency_key": "%s"}' % local.id)])
+        local.refresh_from_db()
+        self.assertEqual((local.twilio_sid, local.twilio_index), ('IMecho', 0))
+        self.assertEqual(Message.objects.count(), 1)
+
+    def test_participant_read_horizon_marks_others_messages_read(self):
+        webhooks.persist_events([self.added(f'IM{i}', i, self.user2) for i in range(3)] + [self.added('IM9', 3, self.user1)])
+        webhooks.persist_events([{'EventType': 'onParticipantUpdated', 'ConversationSid': 'CHhook',
+                                  'Identity': f'user_{self.user1.id}_0', 'LastReadMessageIndex': '1'}])
+        read = set(Message.objects.filter(is_read=True).values_list('twilio_sid', flat=True))
+        self.assertEqual(read, {'IM0', 'IM1'})
+        state = ConversationReadState.objects.get(conversation=self.convo, user=self.user1)
+        self.assertEqual(state.last_read_message.twilio_sid, 'IM1')
+
+    def test_updates_for_archived_messages_do_not_recreate_them(self):
+        ArchivedMessage.objects.create(conversation=self.convo, sender=self.user1, content='old', twilio_sid='IMold',
+                                       twilio_index=0, created_at=timezone.now() - timedelta(days=300))
+        webhooks.persist_events([self.added('IMold', 0, self.user1, body='edited', EventType='onMessageUpdated')])
+        self.assertFalse(Message.objects.filter(twilio_sid='IMold').exists())
+
+    def test_only_inserted_messages_are_published(self):
+        webhooks.persist_events([self.added('IMa', 0, self.user1)])
+        # IMa is stored by another flusher after this batch looked up existing sids
+        with patch('messaging.webhooks.Message.objects.in_bulk', return_value={}), \
+                patch('messaging.webhooks.publish_message') as publish:
+            webhooks.persist_events([self.added('IMa', 0, self.user1), self.added('IMb', 1, self.user2)])
+        self.assertEqual([call.args[0].twilio_sid for call in publish.call_args_list], ['IMb'])
+        self.assertEqual(Message.objects.filter(twilio_sid='IMa').count(), 1)
+
+    def test_read_horizons_are_applied_in_fixed_queries(self):
+        other = Conversation.objects.create(twilio_sid='CHother')
+        other.participants.add(self.user1, self.user2)
+        webhooks.persist_events([self.added(f'IM{i}', i, self.user2) for i in range(3)] + [
+            {**self.added(f'IMo{i}', i, self.user1), 'ConversationSid': 'CHother'} for i in range(3)])
+        horizons = [
+            {'EventType': 'onParticipantUpdated', 'ConversationSid': 'CHhook', 'Identity': f'user_{self.user1.id}_0', 'LastReadMessageIndex': '1'},
+            {'EventType': 'onParticipantUpdated', 'ConversationSid': 'CHother', 'Identity': f'user_{self.user2.id}_0', 'LastReadMessageIndex': '2'},
+        ]
+        # update, newest indexes, target rows, readers, current watermarks, insert-if-missing + conditional update (+ savepoint pair)
+        with self.assertNumQueries(9):
+            webhooks.persist_events(horizons)
+        read = set(Message.objects.filter(is_read=True).values_list('twilio_sid', flat=True))
+        self.assertEqual(read, {'IM0', 'IM1', 'IMo0', 'IMo1', 'IMo2'})
+        states = ConversationReadState.objects.values_list('conversation__twilio_sid', 'user_id', 'last_read_message__twilio_sid')
+        self.assertEqual(set(states), {('CHhook', self.user1.id, 'IM1'), ('CHother', self.user2.id, 'IMo2')})
+
+    def test_staged_events_survive_until_flushed(self):
+        with patch('messaging.webhooks._flush_loop'):
+            webhooks.enqueue(self.added('IMa', 0, self.user1))
+            webhooks.enqueue(self.added('IMb', 1, self.user2))
+        # Acknowledged events are already durable, not held in process memory
+        self.assertEqual(TwilioWebhookEvent.objects.count(), 2)
+        self.assertEqual(webhooks.flush(), 2)
+        self.assertEqual(webhooks.flush(), 0)
+        self.assertFalse(TwilioWebhookEvent.objects.exists())
+        self.assertEqual(Message.objects.filter(twilio_sid__in=['IMa', 'IMb']).count(), 2)
+
+
+class RealtimeChannelTests(TransactionTestCase):
+    def setUp(self):
+        self.user1 = User.objects.create_user(username='user1', email='user1@example.com', password='pass', role='student')
+        self.user2 = User.objects.create_user(username='user2', email='user2@example.com', password='pass', role='landlord')
+        self.convo = Conversation.objects.create(twilio_sid='CHlive')
+        self.convo.participants.add(self.user1, self.user2)
+        self.factory = APIRequestFactory()
+
+    async def connect(self, user=None, token=None):
+        token = token if token is not None else str(JWTAccessToken.for_user(user))
+        socket = ApplicationCommunicator(websocket_application, {
+            'type': 'websocket', 'path': '/ws/messaging/', 'query_string': f'token={token}'.encode(),
+        })
+        await socket.send_input({'type': 'websocket.connect'})
+        return socket, await socket.receive_output(timeout=2)
+
+    async def receive_event(self, socket):
+        return json.loads((await socket.receive_output(timeout=2))['text'])
+
+    def post(self, view, url, user, data, **kwargs):
+        request = self.factory.post(url, data, format='json')
+        force_authenticate(request, user=user)
+        return view.as_view()(request, **kwargs)
+
+    async def test_rejects_sockets_without_a_valid_token(self):
+        _, reply = await self.connect(token='not-a-jwt')
+        self.assertEqual(reply, {'type': 'websocket.close', 'code': CLOSE_UNAUTHORIZED})
+
+    async def test_fans_out_messages_reads_and_typing_to_participants(self):
+        socket1, accepted = await self.connect(self.user1)
+        self.assertEqual(accepted['type'], 'websocket.accept')
+        socket2, _ = await self.connect(self.user2)
+
+        response = await sync_to_async(self.post)(SendMessageView, '/messaging/messages/send/', self.user1,
+                                                  {'conversation_sid': 'CHlive', 'body': 'hello'})
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        for socket in (socket1, socket2):
+            event = await self.receive_event(socket)
+            self.assertEqual((event['type'], event['message']['content']), ('message.created', 'hello'))
+            self.assertEqual(event['message']['sender']['username'], 'user1')
+
+        await socket2.send_input({'type': 'websocket.receive', 'text': json.dumps(
+            {'type': 'typing', 'conversation_id': str(self.convo.id)})})
+        event = await self.receive_event(socket1)
+        self.assertEqual((event['type'], event['user_id']), ('typing', self.user2.id))
+        self.assertTrue(await socket2.receive_nothing())  # typing is not echoed back
+
+        await sync_to_async(self.post)(MarkConversationReadView, f'/messaging/conversations/{self.convo.id}/read/',
+                                       self.user2, {}, conversation_id=self.convo.id)
+        event = await self.receive_event(socket1)
+        self.assertEqual((event['type'], event['user_id']), ('read', self.user2.id))
+
+        for socket in (socket1, socket2):
+            await socket.send_input({'type': 'websocket.disconnect', 'code': 1000})
+            await socket.wait(timeout=2)
+
+    async def test_outsiders_receive_nothing_and_cannot_type(self):
+        outsider = await sync_to_async(User.objects.create_user)(
+            username='outsider', email='o@example.com', password='pass', role='student')
+        socket, _ = await self.connect(outsider)
+        await socket.send_input({'type': 'websocket.receive', 'text': json.dumps(
+            {'type': 'typing', 'conversation_id': str(self.convo.id)})})
+        await sync_to_async(self.post)(SendMessageView, '/messaging/messages/send/', self.user1,
+                                       {'conversation_sid': 'CHlive', 'body': 'private'})
+        self.assertTrue(await socket.receive_nothing())
+        await socket.send_input({'type': 'websocket.disconnect', 'code': 1000})
+        await socket.wait(timeout=2)
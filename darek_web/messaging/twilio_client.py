@@ -0,0 +1,198 @@
+# messaging/twilio_client.py
+"""
+Process-wide Twilio REST client shared by messaging and roommates.
+
+One client per process, backed by a pooled keep-alive requests session with timeouts,
+per-request latency logging and a simple circuit breaker. Setting TWILIO_API_BASE_URL
+(e.g. http://127.0.0.1:8765, see the fake_twilio_server command) sends every call to a
+local stand-in for load tests.
+"""
+import hashlib
+import logging
+import threading
+import time
+from urllib.parse import urlsplit
+from django.conf import settings
+from django.core.cache import cache
+from twilio import rest
+from twilio.http.http_client import TwilioHttpClient
+from twilio.jwt.access_token import AccessToken
+from twilio.jwt.access_token.grants import ChatGrant
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_cached = {"key": None, "client": None}
+
+
+class TwilioCircuitOpenError(Exception):
+  """Raised without calling Twilio while the breaker is open."""
+
+
+def twilio_identity_for_user(user) -> str:
+  """
+  Build a Twilio identity that is unique per *real* user, not just DB id.
+  You can adjust this scheme as you like, but it must be consistent
+  everywhere you talk to Twilio (token, participants, author).
+  """
+  # Example: user_<id>_<unix_timestamp_of_date_joined>
+  ts = int(user.date_joined.timestamp()) if hasattr(user, "date_joined") else 0
+  return f"user_{user.id}_{ts}"
+
+
+def twilio_configured() -> bool:
+  return all([
+    settings.TWILIO_ACCOUNT_SID,
+    settings.TWILIO_AUTH_TOKEN,
+    settings.TWILIO_CONVERSATIONS_SERVICE_SID,
+  ])
+
+
+def _token_cache_key(identity):
+  # Credentials are part of the key (hashed) so rotating them never serves a stale token
+  parts = [
+    identity,
+    settings.TWILIO_ACCOUNT_SID,
+    settings.TWILIO_API_KEY_SID,
+    settings.TWILIO_API_SECRET,
+    settings.TWILIO_CONVERSATIONS_SERVICE_SID,
+    str(settings.TWILIO_TOKEN_TTL),
+  ]
+  return "twilio-token:" + hashlib.sha256("|".join(str(p) for p in parts).encode()).hexdigest()
+
+
+def get_access_token(user):
+  """
+  Return (jwt, seconds_until_expiry) for user's Conversations access token. Signed tokens are
+  cached per identity and reused until TWILIO_TOKEN_REFRESH_MARGIN seconds before expiry.
+  """
+  identity = twilio_identity_for_user(user)
+  key = _token_cache_key(identity)
+  now = time.time()
+  cached = cache.get(key)
+  if cached and cached["expires_at"] - now > settings.TWILIO_TOKEN_REFRESH_MARGIN:
+    return cached["token"], int(cached["expires_at"] - now)
+
+  ttl = settings.TWILIO_TOKEN_TTL
+  token = AccessToken(
+    settings.TWILIO_ACCOUNT_SID,
+    settings.TWILIO_API_KEY_SID,
+    settings.TWILIO_API_SECRET,
+    identity=identity,
+    ttl=ttl,
+  )
+  token.add_grant(ChatGrant(service_sid=settings.TWILIO_CONVERSATIONS_SERVICE_SID))
+  # The JWT's exp is issue time + ttl; take the issue time before signing so ours is never later
+  issued_at = int(time.time())
+  jwt = token.to_jwt()
+  if isinstance(jwt, bytes):
+    jwt = jwt.decode("utf-8")
+  cache.set(key, {"token": jwt, "expires_at": issued_at + ttl}, timeout=max(ttl - settings.TWILIO_TOKEN_REFRESH_MARGIN, 1))
+  return jwt, ttl
+
+
+class InstrumentedTwilioHttpClient(TwilioHttpClient):
+  """Pooled HTTP client that records latency and trips a breaker on repeated failures."""
+
+  def __init__(self, timeout, base_url=None, failure_threshold=5, reset_after=30.0, **kwargs):
+    super().__init__(pool_connections=True, timeout=timeout, **kwargs)
+    self.base_url = base_url.rstrip("/") if base_url else None
+    self.failure_threshold = failure_threshold
+    self.reset_after = reset_after
+    self.consecutive_failures = 0
+    self.opened_at = None
+    self.stats = {"requests": 0, "failures": 0, "total_ms": 0.0, "max_ms": 0.0}
+    self._state_lock = threading.Lock()
+
+  def _rewrite(self, url):
+    if not self.base_url:
+      return url
+    parts = urlsplit(url)
+    return f"{self.base_url}{parts.path}" + (f"?{parts.query}" if parts.query else "")
+
+  def _check_breaker(self):
+    with self._state_lock:
+      if self.opened_at is None:
+        return
+      if time.monotonic() - self.opened_at < self.reset_after:
+        raise TwilioCircuitOpenError("Twilio circuit is open; skipping call")
+      # Half-open: let this call through as a probe
+      self.opened_at = None
+
+  def _record(self, elapsed_ms, failed):
+    with self._state_lock:
+      self.stats["requests"] += 1
+      self.stats["total_ms"] += elapsed_ms
+      self.stats["max_ms"] = max(self.stats["max_ms"], elapsed_ms)
+      if failed:
+        self.stats["failures"] += 1
+        self.consecutive_failures += 1
+        if self.consecutive_failures >= self.failure_threshold:
+          self.opened_at = time.monotonic()
+          logger.error("Twilio circuit opened after %s consecutive failures", self.consecutive_failures)
+      else:
+        self.consecutive_failures = 0
+
+  def request(self, method, url, *args, **kwargs):
+    self._check_breaker()
+    url = self._rewrite(url)
+    start = time.perf_counter()
+    failed = True
+    try:
+      response = super().request(method, url, *args, **kwargs)
+      failed = response.status_code >= 500 or response.status_code == 429
+      return response
+    finally:
+      elapsed_ms = (time.perf_counter() - start) * 1000
+      self._record(elapsed_ms, failed)
+      logger.info("Twilio %s %s %.1fms%s", method, urlsplit(url).path, elapsed_ms, " FAILED" if failed else "")
+
+
+def _config_key():
+  return (
+    settings.TWILIO_ACCOUNT_SID,
+    settings.TWILIO_AUTH_TOKEN,
+    settings.TWILIO_API_BASE_URL,
+    settings.TWILIO_HTTP_TIMEOUT,
+    settings.TWILIO_HTTP_MAX_RETRIES,
+    settings.TWILIO_CIRCUIT_FAILURE_THRESHOLD,
+    settings.TWILIO_CIRCUIT_RESET_SECONDS,
+  )
+
+
+def get_twilio_client():
+  """Return the shared client, rebuilding it only when the Twilio settings change."""
+  key = _config_key()
+  client = _cached["client"]
+  if client is not None and _cached["key"] == key:
+    return client
+  with _lock:
+    if _cached["client"] is None or _cached["key"] != key:
+      http_client = InstrumentedTwilioHttpClient(
+        timeout=settings.TWILIO_HTTP_TIMEOUT,
+        base_url=settings.TWILIO_API_BASE_URL,
+        failure_threshold=settings.TWILIO_CIRCUIT_FAILURE_THRESHOLD,
+        reset_after=settings.TWILIO_CIRCUIT_RESET_SECONDS,
+        max_retries=settings.TWILIO_HTTP_MAX_RETRIES,
+      )
+      _cached["client"] = rest.Client(
+        settings.TWILIO_ACCOUNT_SID, settings.TWILIO_AUTH_TOKEN, http_client=http_client
+      )
+      _cached["key"] = key
+    return _cached["client"]
+
+
+def _reset_client():
+  """Drop the shared client so the next get_twilio_client() builds a new one (test hook)."""
+  with _lock:
+    _cached["client"] = _cached["key"] = None
+
+
+def twilio_stats():
+  """Latency/failure counters of the shared client's HTTP layer (empty before first use)."""
+  client = _cached["client"]
+  http_client = getattr(client, "http_client", None)
+  stats = dict(getattr(http_client, "stats", {}) or {})
+  if stats.get("requests"):
+    stats["avg_ms"] = stats["total_ms"] / stats["requests"]
+  return stats
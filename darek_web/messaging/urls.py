@@ -1,11 +1,19 @@
 # messaging/urls.py
 from django.urls import path
-from .views import TwilioAccessTokenView, CreateConversationView, SendMessageView, MarkMessageReadView
+from .views import (
+    TwilioAccessTokenView, CreateConversationView, SendMessageView, MarkMessageReadView, InboxView,
+    MarkConversationReadView, MessageHistoryView, MessageSearchView, TwilioWebhookView,
+)
 
 urlpatterns = [
     path('twilio-token/', TwilioAccessTokenView.as_view(), name='twilio_token'),
+    path('conversations/', InboxView.as_view(), name='conversation_inbox'),
     path('conversations/create/', CreateConversationView.as_view(), name='create_conversation'),
+    path('conversations/<uuid:conversation_id>/messages/', MessageHistoryView.as_view(), name='message_history'),
+    path('conversations/<uuid:conversation_id>/read/', MarkConversationReadView.as_view(), name='mark_conversation_read'),
+    path('messages/search/', MessageSearchView.as_view(), name='message_search'),
     path('messages/send/', SendMessageView.as_view(), name='send_message'),
     path('messages/mark-read/', MarkMessageReadView.as_view(), name='mark_message_read'),
+    path('webhooks/twilio/', TwilioWebhookView.as_view(), name='twilio_webhook'),
     # Add more endpoints as needed, e.g., for listing conversations or messages
 ]
\ No newline at end of file
@@ -1,36 +1,35 @@
 # messaging/views.py
-import json
+import uuid
+from datetime import datetime, timezone as dt_timezone
 from django.shortcuts import get_object_or_404
+from django.db import transaction
+from django.db.models import F, Count, Exists, OuterRef, Subquery, Prefetch, Window, IntegerField, Value
+from django.db.models.functions import Coalesce, RowNumber
 from rest_framework.views import APIView
+from rest_framework.generics import ListAPIView
+from rest_framework.pagination import CursorPagination
+from rest_framework.utils.urls import remove_query_param, replace_query_param
 from rest_framework.response import Response
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.exceptions import NotFound
+from rest_framework.permissions import IsAuthenticated, AllowAny
 from rest_framework import status
-from twilio.jwt.access_token import AccessToken
-from twilio.jwt.access_token.grants import ChatGrant
-from twilio.rest import Client
+from twilio.request_validator import RequestValidator
 from django.conf import settings
 from users.models import User
-from .models import Conversation, Message
-
-
-def twilio_identity_for_user(user: User) -> str:
-  """
-  Build a Twilio identity that is unique per *real* user, not just DB id.
-  You can adjust this scheme as you like, but it must be consistent
-  everywhere you talk to Twilio (token, participants, author).
-  """
-  # Example: user_<id>_<unix_timestamp_of_date_joined>
-  ts = int(user.date_joined.timestamp()) if hasattr(user, "date_joined") else 0
-  return f"user_{user.id}_{ts}"
+from users.serializers import UserCompactSerializer
+from .models import ArchivedMessage, Conversation, ConversationReadState, Message
+from .serializers import InboxConversationSerializer, InboxMessageSerializer, MessageSearchResultSerializer
+from .outbox import enqueue_message
+from .twilio_client import twilio_identity_for_user, get_access_token
+from .provisioning import provision_conversation, discard_sid, ProvisioningError
+from . import search, webhooks
+from .realtime import publish_read, publish_conversation_created
 
 
 class TwilioAccessTokenView(APIView):
   permission_classes = [IsAuthenticated]
 
   def get(self, request):
-    user = request.user
-    identity = twilio_identity_for_user(user)
-
     if not all([
       settings.TWILIO_ACCOUNT_SID,
       settings.TWILIO_API_KEY_SID,
@@ -42,21 +41,8 @@ class TwilioAccessTokenView(APIView):
         status=status.HTTP_503_SERVICE_UNAVAILABLE,
       )
 
-    token = AccessToken(
-      settings.TWILIO_ACCOUNT_SID,
-      settings.TWILIO_API_KEY_SID,
-      settings.TWILIO_API_SECRET,
-      identity=identity,
-      ttl=3600,
-    )
-
-    chat_grant = ChatGrant(service_sid=settings.TWILIO_CONVERSATIONS_SERVICE_SID)
-    token.add_grant(chat_grant)
-
-    jwt = token.to_jwt()
-    if isinstance(jwt, bytes):
-      jwt = jwt.decode("utf-8")
-    return Response({"token": jwt}, status=status.HTTP_200_OK)
+    token, expires_in = get_access_token(request.user)
+    return Response({"token": token, "ttl": expires_in}, status=status.HTTP_200_OK)
 
 
 class CreateConversationView(APIView):
@@ -86,52 +72,61 @@ class CreateConversationView(APIView):
         status=status.HTTP_400_BAD_REQUEST,
       )
 
-    client = Client(settings.TWILIO_ACCOUNT_SID, settings.TWILIO_AUTH_TOKEN)
-    identity1 = twilio_identity_for_user(user)
-    identity2 = twilio_identity_for_user(other_user)
-
-    existing_convo = (
-      Conversation.objects.filter(participants=user)
-      .filter(participants=other_user)
-      .first()
-    )
-    if existing_convo and existing_convo.twilio_sid:
+    # One row per pair, claimed atomically via the unique participant_key; the participants
+    # are added in the same transaction, so a pair's row never exists without them
+    with transaction.atomic():
+      db_convo, created = Conversation.objects.get_or_create(
+        participant_key=Conversation.pair_key(user.id, other_user.id),
+        defaults={"listing_id": request.data.get("listing") or None},
+      )
+      if created:
+        db_convo.participants.add(user, other_user)
+        publish_conversation_created(db_convo.id, [user.id, other_user.id])
+    if db_convo.twilio_sid:
       return Response(
-        {"conversation_sid": existing_convo.twilio_sid},
+        {"conversation_sid": db_convo.twilio_sid},
         status=status.HTTP_200_OK,
       )
 
+    identity1 = twilio_identity_for_user(user)
+    identity2 = twilio_identity_for_user(other_user)
     try:
-      conversation = client.conversations.services(
-        settings.TWILIO_CONVERSATIONS_SERVICE_SID
-      ).conversations.create(
-        friendly_name=f"Chat between {user.username} and {other_user.username}"
-      )
-
-      svc = client.conversations.services(settings.TWILIO_CONVERSATIONS_SERVICE_SID)
-      svc.conversations(conversation.sid).participants.create(identity=identity1)
-      svc.conversations(conversation.sid).participants.create(identity=identity2)
-
-      attrs = {
-        "usernames": {
-          identity1: user.get_full_name() or user.username,
-          identity2: other_user.get_full_name() or other_user.username,
-        }
-      }
-      svc.conversations(conversation.sid).update(attributes=json.dumps(attrs))
-
-      db_convo = Conversation.objects.create(
-        twilio_sid=conversation.sid,
-        listing=request.data.get("listing"),
+      # Twilio is called outside any transaction, so no row lock is held across HTTP calls
+      sid = provision_conversation(
+        f"Chat between {user.username} and {other_user.username}",
+        [identity1, identity2],
+        attributes={
+          "usernames": {
+            identity1: user.get_full_name() or user.username,
+            identity2: other_user.get_full_name() or other_user.username,
+          }
+        },
       )
-      db_convo.participants.add(user, other_user)
+    except ProvisioningError as e:
+      # The conversation is half set up; make sure the SID is never handed out again
+      discard_sid(e.sid)
+      return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+    except Exception as e:
+      return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+    # Short lock to record the SID: if a concurrent request for the same pair recorded one
+    # first, its conversation is kept and this one is discarded
+    with transaction.atomic():
+      db_convo = Conversation.objects.select_for_update().get(pk=db_convo.pk)
+      existing_sid = db_convo.twilio_sid
+      if not existing_sid:
+        db_convo.twilio_sid = sid
+        db_convo.save(update_fields=["twilio_sid", "updated_at"])
+    if existing_sid:
+      discard_sid(sid)
       return Response(
-        {"conversation_sid": conversation.sid},
-        status=status.HTTP_201_CREATED,
+        {"conversation_sid": existing_sid},
+        status=status.HTTP_200_OK,
       )
-    except Exception as e:
-      return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+    return Response(
+      {"conversation_sid": sid},
+      status=status.HTTP_201_CREATED,
+    )
 
 
 class SendMessageView(APIView):
@@ -154,23 +149,14 @@ class SendMessageView(APIView):
           status=status.HTTP_403_FORBIDDEN,
         )
 
-      client = Client(settings.TWILIO_ACCOUNT_SID, settings.TWILIO_AUTH_TOKEN)
-      author_identity = twilio_identity_for_user(request.user)
-      message = client.conversations.services(
-        settings.TWILIO_CONVERSATIONS_SERVICE_SID
-      ).conversations(convo_sid).messages.create(
-        author=author_identity,
-        body=body,
-      )
+      # Message + outbox row commit together; deliver_outbox pushes to Twilio and
+      # backfills twilio_sid, so slow Twilio responses never hold this request.
+      db_message = enqueue_message(convo, request.user, body)
 
-      db_message = Message.objects.create(
-        conversation=convo,
-        sender=request.user,
-        content=body,
-        twilio_sid=message.sid,
+      return Response(
+        {"id": str(db_message.id), "sid": None, "status": "queued"},
+        status=status.HTTP_202_ACCEPTED,
       )
-
-      return Response({"sid": message.sid}, status=status.HTTP_201_CREATED)
     except Conversation.DoesNotExist:
       return Response(
         {"error": "Conversation not found"},
@@ -180,7 +166,69 @@ class SendMessageView(APIView):
       return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+def advance_read_watermark(conversation_id, user, message_id, read_at):
+  """
+  Move user's watermark in conversation_id up to (message_id, read_at): the two statements of
+  ConversationReadState.advance plus one set-based UPDATE of the legacy is_read flags, however
+  many messages that covers. A call that lost a race to a newer watermark publishes nothing.
+  """
+  with transaction.atomic():
+    moved = ConversationReadState.advance([ConversationReadState(
+      conversation_id=conversation_id, user=user, last_read_at=read_at, last_read_message_id=message_id,
+    )])
+    Message.objects.filter(
+      conversation_id=conversation_id, created_at__lte=read_at, is_read=False,
+    ).exclude(sender=user).update(is_read=True)
+    if moved:
+      publish_read(conversation_id, user.id, read_at, message_id)
+
+
+class MarkConversationReadView(APIView):
+  """
+  Mark a conversation read up to message_id (default: its newest message). The watermark
+  only moves forward, so replays and out-of-order calls are no-ops.
+  """
+  permission_classes = [IsAuthenticated]
+
+  def post(self, request, conversation_id):
+    message_id = request.data.get("message_id")
+    messages = Message.objects.filter(conversation=OuterRef('pk'))
+    if message_id:
+      try:
+        messages = messages.filter(id=uuid.UUID(str(message_id)))
+      except ValueError:
+        return Response({"error": "Invalid message_id"}, status=status.HTTP_400_BAD_REQUEST)
+    messages = messages.order_by('-created_at', '-id')
+    current = ConversationReadState.objects.filter(conversation=OuterRef('pk'), user=request.user)
+
+    # Participation, target message and current watermark in one round trip
+    row = (
+      Conversation.objects.filter(id=conversation_id, participants=request.user)
+      .annotate(
+        target_id=Subquery(messages.values('id')[:1]),
+        target_at=Subquery(messages.values('created_at')[:1]),
+        current_at=Subquery(current.values('last_read_at')[:1]),
+      )
+      .values('target_id', 'target_at', 'current_at')
+      .first()
+    )
+    if row is None:
+      return Response({"error": "Conversation not found"}, status=status.HTTP_404_NOT_FOUND)
+    if message_id and row['target_id'] is None:
+      return Response({"error": "Message not found"}, status=status.HTTP_404_NOT_FOUND)
+
+    last_read_at = row['current_at']
+    if row['target_at'] is not None and (last_read_at is None or row['target_at'] > last_read_at):
+      advance_read_watermark(conversation_id, request.user, row['target_id'], row['target_at'])
+      last_read_at = row['target_at']
+    return Response(
+      {"conversation_id": str(conversation_id), "last_read_at": last_read_at},
+      status=status.HTTP_200_OK,
+    )
+
+
 class MarkMessageReadView(APIView):
+  """Legacy single-message endpoint; now advances the same watermark up to that message."""
   permission_classes = [IsAuthenticated]
 
   def post(self, request):
@@ -192,22 +240,31 @@ class MarkMessageReadView(APIView):
       )
 
     try:
-      db_message = Message.objects.get(twilio_sid=message_sid)
-      if db_message.sender == request.user:
+      db_message = Message.objects.annotate(
+        is_participant=Exists(
+          Conversation.participants.through.objects.filter(
+            conversation_id=OuterRef('conversation_id'), user_id=request.user.id
+          )
+        ),
+        current_at=Subquery(
+          ConversationReadState.objects.filter(
+            conversation_id=OuterRef('conversation_id'), user=request.user
+          ).values('last_read_at')[:1]
+        ),
+      ).get(twilio_sid=message_sid)
+      if db_message.sender_id == request.user.id:
         return Response(
           {"error": "Senders cannot mark their own messages as read"},
           status=status.HTTP_403_FORBIDDEN,
         )
-      if not db_message.conversation.participants.filter(
-        id=request.user.id
-      ).exists():
+      if not db_message.is_participant:
         return Response(
           {"error": "You are not a participant in this conversation"},
           status=status.HTTP_403_FORBIDDEN,
         )
 
-      db_message.is_read = True
-      db_message.save()
+      if db_message.current_at is None or db_message.created_at > db_message.current_at:
+        advance_read_watermark(db_message.conversation_id, request.user, db_message.id, db_message.created_at)
       return Response(
         {"success": "Message marked as read"},
         status=status.HTTP_200_OK,
@@ -219,3 +276,159 @@ class MarkMessageReadView(APIView):
       )
     except Exception as e:
       return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+# Watermark for participants who have never opened a conversation
+NEVER_READ = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+
+class InboxCursorPagination(CursorPagination):
+  ordering = ('-last_activity_at', '-id')
+  page_size = 20
+  page_size_query_param = 'page_size'
+  max_page_size = 100
+
+
+class InboxView(ListAPIView):
+  """
+  The caller's conversations, most recently active first, each with its participants,
+  last message and unread count. A page costs a fixed number of queries: conversations
+  (with activity/unread subqueries), participants, and a windowed latest-message prefetch.
+  """
+  permission_classes = [IsAuthenticated]
+  serializer_class = InboxConversationSerializer
+  pagination_class = InboxCursorPagination
+
+  def get_queryset(self):
+    user = self.request.user
+    latest_at = (
+      Message.objects.filter(conversation=OuterRef('pk'))
+      .order_by(F('created_at').desc(nulls_last=True))
+      .values('created_at')[:1]
+    )
+    # Unread = messages from others past the caller's watermark (range scan on message_convo_created_idx)
+    unread = (
+      Message.objects.filter(conversation=OuterRef('pk'), created_at__gt=OuterRef('read_at'))
+      .exclude(sender=user)
+      .values('conversation')
+      .annotate(total=Count('id'))
+      .values('total')
+    )
+    latest_messages = (
+      Message.objects.select_related('sender')
+      .annotate(row=Window(
+        RowNumber(),
+        partition_by=F('conversation'),
+        order_by=[F('created_at').desc(nulls_last=True), F('id').desc()],
+      ))
+      .filter(row=1)
+    )
+    return (
+      Conversation.objects.filter(participants=user)
+      .annotate(
+        read_at=Coalesce(
+          Subquery(
+            ConversationReadState.objects.filter(conversation=OuterRef('pk'), user=user).values('last_read_at')[:1]
+          ),
+          Value(NEVER_READ),
+        ),
+        last_activity_at=Coalesce(Subquery(latest_at), F('created_at')),
+        unread_count=Coalesce(Subquery(unread, output_field=IntegerField()), 0),
+      )
+      .prefetch_related(
+        'participants',
+        Prefetch('messages', queryset=latest_messages, to_attr='latest_messages'),
+      )
+    )
+
+
+
+class MessageHistoryCursorPagination(CursorPagination):
+  # Newest first; "next" pages scroll back in time
+  ordering = ('-created_at', '-id')
+  page_size = 30
+  page_size_query_param = 'page_size'
+  max_page_size = 100
+
+
+class MessageHistoryView(ListAPIView):
+  """
+  A conversation's messages, newest first, keyset-paginated on message_convo_created_idx so
+  any page costs the same: one participation check and one index range scan of page_size rows.
+  Once the hot table is exhausted, "next" continues into ArchivedMessage (?archive=1), which is
+  paged the same way on archive_convo_created_idx; archived messages are always the older ones.
+  """
+  permission_classes = [IsAuthenticated]
+  serializer_class = InboxMessageSerializer
+  pagination_class = MessageHistoryCursorPagination
+
+  @property
+  def in_archive(self):
+    return self.request.query_params.get('archive') == '1'
+
+  def get_queryset(self):
+    conversation_id = self.kwargs['conversation_id']
+    self.conversation = (
+      Conversation.objects.filter(id=conversation_id, participants=self.request.user)
+      .only('id', 'archived_until')
+      .first()
+    )
+    if self.conversation is None:
+      raise NotFound("Conversation not found")
+    model = ArchivedMessage if self.in_archive else Message
+    sender_fields = [f'sender__{name}' for name in UserCompactSerializer.Meta.fields]
+    return (
+      model.objects.filter(conversation_id=conversation_id)
+      .select_related('sender')
+      .only('id', 'content', 'is_read', 'created_at', 'twilio_sid', 'sender', *sender_fields)
+    )
+
+  def list(self, request, *args, **kwargs):
+    response = super().list(request, *args, **kwargs)
+    if not self.in_archive and response.data['next'] is None and self.conversation.archived_until is not None:
+      url = remove_query_param(request.build_absolute_uri(), self.paginator.cursor_query_param)
+      response.data['next'] = replace_query_param(url, 'archive', '1')
+    return response
+
+
+class MessageSearchView(ListAPIView):
+  """
+  Full-text search of the caller's messages (?q=, websearch syntax, English or Arabic),
+  newest first with cursor pagination. Highlights are computed for the returned page only.
+  """
+  permission_classes = [IsAuthenticated]
+  serializer_class = MessageSearchResultSerializer
+  pagination_class = MessageHistoryCursorPagination
+
+  def get_queryset(self):
+    return search.search_messages(self.request.user, self.query)
+
+  def list(self, request, *args, **kwargs):
+    self.query = (request.query_params.get("q") or "").strip()
+    if len(self.query) < search.MIN_QUERY_LENGTH:
+      return Response(
+        {"error": f"q must be at least {search.MIN_QUERY_LENGTH} characters"},
+        status=status.HTTP_400_BAD_REQUEST,
+      )
+    page = self.paginate_queryset(self.get_queryset())
+    search.attach_highlights(page, self.query)
+    return self.get_paginated_response(self.get_serializer(page, many=True).data)
+
+
+class TwilioWebhookView(APIView):
+  """
+  Twilio Conversations post-event webhook. Verifies X-Twilio-Signature, stages the event
+  and answers immediately; messaging.webhooks persists staged events in batches.
+  """
+  authentication_classes = []
+  permission_classes = [AllowAny]
+
+  def post(self, request):
+    params = {key: request.POST.get(key) for key in request.POST}
+    url = settings.TWILIO_WEBHOOK_URL or request.build_absolute_uri()
+    signature = request.headers.get("X-Twilio-Signature", "")
+    if not settings.TWILIO_AUTH_TOKEN or not RequestValidator(settings.TWILIO_AUTH_TOKEN).validate(url, params, signature):
+      return Response({"error": "Invalid Twilio signature"}, status=status.HTTP_403_FORBIDDEN)
+
+    webhooks.enqueue(params)
+    return Response(status=status.HTTP_200_OK)
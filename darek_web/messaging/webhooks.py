@@ -0,0 +1,258 @@
+# messaging/webhooks.py
+"""
+Batched ingestion of Twilio Conversations webhooks.
+
+TwilioWebhookView verifies the signature and hands the payload to enqueue(), which stages it
+as a TwilioWebhookEvent row before the webhook is acknowledged. A background flusher drains
+staged events every TWILIO_WEBHOOK_FLUSH_SECONDS or as soon as TWILIO_WEBHOOK_BATCH_SIZE
+events were staged by this process, so a burst costs a few set-based statements instead of
+a transaction per event. Staged rows are deleted in the transaction that persists them: a
+crash leaves them in place for the next drain by any process. New messages are bulk
+inserted with ignore_conflicts on the unique Message.twilio_sid, which makes Twilio's
+webhook retries harmless.
+"""
+import json
+import logging
+import threading
+import uuid
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import Max, Q
+from django.utils.dateparse import parse_datetime
+from users.models import User
+from users.serializers import UserCompactSerializer
+from .models import ArchivedMessage, Conversation, ConversationReadState, Message, TwilioWebhookEvent
+from .realtime import publish_message, publish_read
+
+logger = logging.getLogger(__name__)
+
+MESSAGE_EVENTS = {"onMessageAdded", "onMessageUpdated"}
+READ_EVENTS = {"onDeliveryUpdated", "onParticipantUpdated"}
+
+_staged = 0
+_staged_lock = threading.Lock()
+_wakeup = threading.Event()
+_flusher = None
+
+
+def user_id_from_identity(identity):
+  # Identities are built by twilio_identity_for_user: user_<id>_<ts>
+  try:
+    prefix, user_id, _ = (identity or "").split("_", 2)
+    return int(user_id) if prefix == "user" else None
+  except ValueError:
+    return None
+
+
+def _as_int(value):
+  try:
+    return int(value)
+  except (TypeError, ValueError):
+    return None
+
+
+def _idempotency_key(attributes):
+  try:
+    return str(uuid.UUID((json.loads(attributes or "{}") or {}).get("idempotency_key")))
+  except (TypeError, ValueError, AttributeError):
+    return None
+
+
+def enqueue(payload):
+  """Stage one verified webhook payload (a flat dict of Twilio form params)."""
+  global _flusher, _staged
+  TwilioWebhookEvent.objects.create(payload=payload)
+  with _staged_lock:
+    _staged += 1
+    size = _staged
+    if _flusher is None or not _flusher.is_alive():
+      _flusher = threading.Thread(target=_flush_loop, name="twilio-webhook-flusher", daemon=True)
+      _flusher.start()
+  if size >= settings.TWILIO_WEBHOOK_BATCH_SIZE:
+    _wakeup.set()
+
+
+def _flush_loop():
+  while True:
+    _wakeup.wait(settings.TWILIO_WEBHOOK_FLUSH_SECONDS)
+    _wakeup.clear()
+    try:
+      close_old_connections()
+      flush()
+    except Exception:
+      logger.exception("Twilio webhook flush failed")
+    finally:
+      close_old_connections()
+
+
+def flush():
+  """Persist every staged event, a batch per transaction. Returns the number of events processed."""
+  global _staged
+  with _staged_lock:
+    _staged = 0
+  batch_size = settings.TWILIO_WEBHOOK_BATCH_SIZE
+  processed = 0
+  while True:
+    with transaction.atomic():
+      # skip_locked lets flushers of several processes drain side by side
+      staged = list(
+        TwilioWebhookEvent.objects.select_for_update(skip_locked=True).order_by("id").values_list("id", "payload")[:batch_size]
+      )
+      if not staged:
+        return processed
+      persist_events([payload for _, payload in staged])
+      TwilioWebhookEvent.objects.filter(id__in=[pk for pk, _ in staged]).delete()
+    processed += len(staged)
+    if len(staged) < batch_size:
+      return processed
+
+
+def persist_events(events):
+  messages = [e for e in events if e.get("EventType") in MESSAGE_EVENTS and e.get("MessageSid")]
+  reads = [e for e in events if e.get("EventType") in READ_EVENTS]
+  with transaction.atomic():
+    if messages:
+      _persist_messages(messages)
+    if reads:
+      _persist_reads(reads)
+
+
+def _persist_messages(events):
+  # Latest payload per message wins (an update may follow its add in the same batch)
+  by_sid = {}
+  for event in events:
+    by_sid[event["MessageSid"]] = event
+
+  convo_ids = dict(
+    Conversation.objects.filter(twilio_sid__in={e.get("ConversationSid") for e in by_sid.values()})
+    .values_list("twilio_sid", "id")
+  )
+  author_ids = {user_id_from_identity(e.get("Author")) for e in by_sid.values()} - {None}
+  # Loaded with the compact fields so the realtime fan-out can serialize senders without more queries
+  known_users = User.objects.only(*UserCompactSerializer.Meta.fields).in_bulk(author_ids)
+
+  # Messages we sent through the outbox come back carrying their local id: backfill, don't duplicate
+  local_keys = {sid: _idempotency_key(e.get("Attributes")) for sid, e in by_sid.items()}
+  local = {
+    str(pk): message
+    for pk, message in Message.objects.in_bulk([key for key in local_keys.values() if key]).items()
+  }
+  existing = Message.objects.in_bulk(list(by_sid), field_name="twilio_sid")
+  # Late updates for messages already moved to the archive must not recreate them in the hot table
+  unmatched = [sid for sid in by_sid if sid not in existing and local_keys[sid] not in local]
+  archived = set(
+    ArchivedMessage.objects.filter(twilio_sid__in=unmatched).values_list("twilio_sid", flat=True)
+  ) if unmatched else set()
+
+  to_create, to_update = [], {}
+  for sid, event in by_sid.items():
+    message = existing.get(sid) or local.get(local_keys[sid])
+    index = _as_int(event.get("Index"))
+    if message is not None:
+      message.twilio_sid = sid
+      message.content = event.get("Body", message.content)
+      message.twilio_index = index if index is not None else message.twilio_index
+      to_update[message.pk] = message
+      continue
+    conversation_id = convo_ids.get(event.get("ConversationSid"))
+    if conversation_id is None or sid in archived:
+      continue
+    sender_id = user_id_from_identity(event.get("Author"))
+    message = Message(
+      conversation_id=conversation_id,
+      sender=known_users.get(sender_id),
+      content=event.get("Body"),
+      twilio_sid=sid,
+      twilio_index=index,
+    )
+    created_at = parse_datetime(event.get("DateCreated") or "")
+    if created_at is not None:
+      message.created_at = created_at
+    to_create.append(message)
+
+  if to_create:
+    Message.objects.bulk_create(to_create, ignore_conflicts=True, batch_size=500)
+    # ids are generated here, so rows skipped as conflicts (a concurrent insert of the same sid) are absent
+    inserted = set(Message.objects.filter(id__in=[m.id for m in to_create]).values_list("id", flat=True))
+    for message in to_create:
+      if message.id in inserted:
+        publish_message(message)
+  if to_update:
+    Message.objects.bulk_update(list(to_update.values()), ["twilio_sid", "content", "twilio_index"], batch_size=500)
+
+
+def _persist_reads(events):
+  read_sids = [
+    e["MessageSid"] for e in events
+    if e.get("EventType") == "onDeliveryUpdated" and e.get("Status") == "read" and e.get("MessageSid")
+  ]
+  if read_sids:
+    Message.objects.filter(twilio_sid__in=read_sids, is_read=False).update(is_read=True)
+
+  # Participant read horizons: keep the highest index per (conversation, reader)
+  horizons = {}
+  for e in events:
+    if e.get("EventType") != "onParticipantUpdated":
+      continue
+    index = _as_int(e.get("LastReadMessageIndex"))
+    reader_id = user_id_from_identity(e.get("Identity"))
+    if index is None or reader_id is None or not e.get("ConversationSid"):
+      continue
+    key = (e["ConversationSid"], reader_id)
+    horizons[key] = max(index, horizons.get(key, -1))
+  if not horizons:
+    return
+  read_up_to = Q()
+  for (conversation_sid, reader_id), index in horizons.items():
+    read_up_to |= Q(conversation__twilio_sid=conversation_sid, twilio_index__lte=index) & ~Q(sender_id=reader_id)
+  Message.objects.filter(read_up_to, is_read=False).update(is_read=True)
+
+  # Newest message within each horizon: its index in one aggregate, then the rows in one fetch
+  keys = list(horizons)
+  latest = Message.objects.filter(conversation__twilio_sid__in={sid for sid, _ in keys}).aggregate(**{
+    f"h{n}": Max("twilio_index", filter=Q(conversation__twilio_sid=sid, twilio_index__lte=horizons[(sid, reader)]))
+    for n, (sid, reader) in enumerate(keys)
+  })
+  wanted = {(sid, latest[f"h{n}"]) for n, (sid, _) in enumerate(keys) if latest[f"h{n}"] is not None}
+  if not wanted:
+    return
+  targets = {}
+  for sid, index in wanted:
+    targets.setdefault(sid, []).append(index)
+  rows = {
+    (row["conversation__twilio_sid"], row["twilio_index"]): row
+    for row in Message.objects.filter(
+      Q(*[Q(conversation__twilio_sid=sid, twilio_index__in=indexes) for sid, indexes in targets.items()], _connector=Q.OR)
+    ).values("id", "conversation_id", "conversation__twilio_sid", "twilio_index", "created_at")
+  }
+  states = []
+  for n, (sid, reader_id) in enumerate(keys):
+    target = rows.get((sid, latest[f"h{n}"]))
+    if target is not None:
+      states.append(ConversationReadState(
+        conversation_id=target["conversation_id"], user_id=reader_id,
+        last_read_at=target["created_at"], last_read_message_id=target["id"],
+      ))
+  if states:
+    _advance_watermarks(states)
+
+
+def _advance_watermarks(states):
+  # Only readers that exist locally, and only states ahead of what is stored (advance() re-checks in SQL)
+  known_users = set(User.objects.filter(id__in={s.user_id for s in states}).values_list("id", flat=True))
+  current = {
+    (conversation_id, user_id): last_read_at
+    for conversation_id, user_id, last_read_at in ConversationReadState.objects.filter(
+      conversation_id__in={s.conversation_id for s in states}, user_id__in={s.user_id for s in states},
+    ).values_list("conversation_id", "user_id", "last_read_at")
+  }
+  forward = [
+    s for s in states
+    if s.user_id in known_users and (
+      current.get((s.conversation_id, s.user_id)) is None or s.last_read_at > current[(s.conversation_id, s.user_id)]
+    )
+  ]
+  if forward:
+    ConversationReadState.advance(forward)
+    for state in forward:
+      publish_read(state.conversation_id, state.user_id, state.last_read_at, state.last_read_message_id)
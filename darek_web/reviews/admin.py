@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Review
+from .models import Review, ReviewSummary
 
 @admin.register(Review)
 class ReviewAdmin(admin.ModelAdmin):
@@ -14,4 +14,13 @@ class ReviewAdmin(admin.ModelAdmin):
         elif obj.target_type == Review.TargetType.LISTING:
             return obj.target_listing.title if obj.target_listing else 'N/A'
         return 'N/A'
-    get_target.short_description = 'Target'
\ No newline at end of file
+    get_target.short_description = 'Target'
+
+
+@admin.register(ReviewSummary)
+class ReviewSummaryAdmin(admin.ModelAdmin):
+    list_display = ('id', 'target_type', 'target_user', 'target_listing', 'review_count', 'average_rating', 'updated_at')
+    list_filter = ('target_type',)
+    list_select_related = ('target_user', 'target_listing')
+    readonly_fields = [f.name for f in ReviewSummary._meta.fields]
+
@@ -0,0 +1,74 @@
+# Generated by Django 5.2.7 on 2026-10-19 13:08
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+RECENT_COMMENTS_LIMIT = 5
+
+
+def backfill_summaries(apps, schema_editor):
+    # One-off aggregation of existing reviews; afterwards summaries are kept in sync incrementally
+    Review = apps.get_model('reviews', 'Review')
+    ReviewSummary = apps.get_model('reviews', 'ReviewSummary')
+    role_fields = {'student': 'student_reviews', 'landlord': 'landlord_reviews'}
+    summaries = {}
+    for review in Review.objects.select_related('author').order_by('-created_at').iterator():
+        if review.target_type == 'USER':
+            key, lookup = ('USER', review.target_user_id), {'target_user_id': review.target_user_id}
+        else:
+            key, lookup = ('LISTING', review.target_listing_id), {'target_listing_id': review.target_listing_id}
+        if key[1] is None:
+            continue
+        summary = summaries.get(key)
+        if summary is None:
+            summary = summaries[key] = ReviewSummary(target_type=review.target_type, recent_comments=[], **lookup)
+        summary.review_count += 1
+        summary.rating_total += review.rating
+        setattr(summary, f'rating_{review.rating}', getattr(summary, f'rating_{review.rating}') + 1)
+        role_field = role_fields.get(review.author.role, 'other_reviews')
+        setattr(summary, role_field, getattr(summary, role_field) + 1)
+        if review.comment and len(summary.recent_comments) < RECENT_COMMENTS_LIMIT:
+            summary.recent_comments.append({
+                'id': str(review.id),
+                'author': review.author.username,
+                'rating': review.rating,
+                'comment': review.comment,
+                'created_at': review.created_at.isoformat() if review.created_at else None,
+            })
+    ReviewSummary.objects.bulk_create(summaries.values(), batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0005_alter_listingimage_options_and_more'),
+        ('reviews', '0002_review_author_review_target_listing_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReviewSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('target_type', models.CharField(choices=[('USER', 'User'), ('LISTING', 'Listing')], max_length=10)),
+                ('review_count', models.PositiveIntegerField(default=0)),
+                ('rating_total', models.PositiveIntegerField(default=0)),
+                ('rating_1', models.PositiveIntegerField(default=0)),
+                ('rating_2', models.PositiveIntegerField(default=0)),
+                ('rating_3', models.PositiveIntegerField(default=0)),
+                ('rating_4', models.PositiveIntegerField(default=0)),
+                ('rating_5', models.PositiveIntegerField(default=0)),
+                ('student_reviews', models.PositiveIntegerField(default=0)),
+                ('landlord_reviews', models.PositiveIntegerField(default=0)),
+                ('other_reviews', models.PositiveIntegerField(default=0)),
+                ('recent_comments', models.JSONField(blank=True, default=list)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('target_listing', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='review_summary', to='listings.listing')),
+                ('target_user', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='review_summary', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.RunPython(backfill_summaries, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.7 on 2026-10-19 13:09
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0005_alter_listingimage_options_and_more'),
+        ('reviews', '0003_reviewsummary'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='review',
+            options={'ordering': ['-created_at', '-id']},
+        ),
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['target_listing', 'created_at', 'id'], name='review_listing_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['target_user', 'created_at', 'id'], name='review_user_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['author', 'created_at', 'id'], name='review_author_created_idx'),
+        ),
+    ]
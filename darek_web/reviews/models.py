@@ -24,6 +24,19 @@ class Review(models.Model):
     def __str__(self):
         return f"Review by {self.author.username} for {self.target_type} {self.id}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored rating/comment/target so summary maintenance can apply deltas on update
+        loaded = dict(zip(field_names, values))
+        instance._loaded_rating = loaded.get('rating')
+        instance._loaded_comment = loaded.get('comment')
+        target_fields = ('target_type', 'target_user_id', 'target_listing_id')
+        instance._loaded_target = (
+            tuple(loaded[name] for name in target_fields) if all(name in loaded for name in target_fields) else None
+        )
+        return instance
+
     def clean(self):
         if self.target_type == self.TargetType.USER:
             if not self.target_user:
@@ -41,7 +54,13 @@ class Review(models.Model):
             raise ValidationError("Invalid target type.")
 
     class Meta:
-        ordering = ['-created_at']
+        ordering = ['-created_at', '-id']
+        # Keyset pagination walks (created_at, id) within each filter the viewset uses
+        indexes = [
+            models.Index(fields=['target_listing', 'created_at', 'id'], name='review_listing_created_idx'),
+            models.Index(fields=['target_user', 'created_at', 'id'], name='review_user_created_idx'),
+            models.Index(fields=['author', 'created_at', 'id'], name='review_author_created_idx'),
+        ]
         constraints = [
             models.UniqueConstraint(
                 fields=['author', 'target_user'],
@@ -53,4 +72,47 @@ class Review(models.Model):
                 condition=models.Q(target_user__isnull=True),
                 name='unique_listing_review'
             ),
-        ]
\ No newline at end of file
+        ]
+
+
+class ReviewSummary(models.Model):
+    """Per-target rating statistics, maintained incrementally by reviews.signals."""
+    RECENT_COMMENTS_LIMIT = 5
+
+    target_type = models.CharField(max_length=10, choices=Review.TargetType.choices)
+    target_user = models.OneToOneField(settings.AUTH_USER_MODEL, related_name='review_summary', on_delete=models.CASCADE, null=True, blank=True)
+    target_listing = models.OneToOneField('listings.Listing', related_name='review_summary', on_delete=models.CASCADE, null=True, blank=True)
+    review_count = models.PositiveIntegerField(default=0)
+    rating_total = models.PositiveIntegerField(default=0)
+    rating_1 = models.PositiveIntegerField(default=0)
+    rating_2 = models.PositiveIntegerField(default=0)
+    rating_3 = models.PositiveIntegerField(default=0)
+    rating_4 = models.PositiveIntegerField(default=0)
+    rating_5 = models.PositiveIntegerField(default=0)
+    student_reviews = models.PositiveIntegerField(default=0)
+    landlord_reviews = models.PositiveIntegerField(default=0)
+    other_reviews = models.PositiveIntegerField(default=0)
+    # Newest-first list of {id, author, rating, comment, created_at}, capped at RECENT_COMMENTS_LIMIT
+    recent_comments = models.JSONField(default=list, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Summary for {self.target_type} {self.target_user_id or self.target_listing_id}"
+
+    @property
+    def average_rating(self):
+        if not self.review_count:
+            return None
+        return round(self.rating_total / self.review_count, 2)
+
+    @property
+    def distribution(self):
+        return {str(star): getattr(self, f'rating_{star}') for star in range(1, 6)}
+
+    @property
+    def reviewer_roles(self):
+        return {
+            'student': self.student_reviews,
+            'landlord': self.landlord_reviews,
+            'other': self.other_reviews,
+        }
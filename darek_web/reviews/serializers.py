@@ -1,9 +1,10 @@
 from rest_framework import serializers
-from .models import Review
+from django.core.exceptions import ValidationError as DjangoValidationError
+from .models import Review, ReviewSummary
 from users.models import User
 from users.serializers import UserSerializer
 from listings.models import Listing
-from listings.serializers import ListingSerializer
+from listings.serializers import ListingCompactSerializer
 
 class ReviewSerializer(serializers.ModelSerializer):
     author = UserSerializer(read_only=True)
@@ -19,7 +20,8 @@ class ReviewSerializer(serializers.ModelSerializer):
         required=False,
         allow_null=True
     )
-    target_listing_detail = ListingSerializer(source='target_listing', read_only=True)
+    # Compact projection: embedding the full ListingSerializer cost owner + image queries per review
+    target_listing_detail = ListingCompactSerializer(source='target_listing', read_only=True)
 
     class Meta:
         model = Review
@@ -38,6 +40,15 @@ class ReviewSerializer(serializers.ModelSerializer):
         request = self.context['request']
         # For updates (PATCH), derive target_type and targets from instance when not provided
         instance = getattr(self, 'instance', None)
+        if instance is not None:
+            # A review stays with its target; moving it would mean rewriting two summaries
+            changed = (
+                ('target_type' in data and data['target_type'] != instance.target_type)
+                or ('target_user' in data and getattr(data['target_user'], 'pk', None) != instance.target_user_id)
+                or ('target_listing' in data and getattr(data['target_listing'], 'pk', None) != instance.target_listing_id)
+            )
+            if changed:
+                raise serializers.ValidationError({"non_field_errors": ["The review target cannot be changed."]})
         target_type = (
             data.get('target_type')
             or self.context.get('target_type')
@@ -49,60 +60,49 @@ class ReviewSerializer(serializers.ModelSerializer):
         target_user = data.get('target_user') or (instance.target_user if instance else None)
         target_listing = data.get('target_listing') or (instance.target_listing if instance else None)
 
-        # Handle LISTING reviews
+        # Duplicate reviews are rejected by the unique_user_review / unique_listing_review
+        # constraints at insert time (see ReviewViewSet.perform_create), not pre-checked here.
         if target_type == Review.TargetType.LISTING:
             listing_id = self.context.get('listing_id')
-            if listing_id and not target_listing:
+            if target_user:
+                raise serializers.ValidationError({"target_user": "Must be null for LISTING reviews."})
+            if target_listing:
+                owner_id = target_listing.owner_id
+            elif listing_id:
+                # Single narrow read: existence and owner in one go; the insert uses the raw id
                 try:
-                    target_listing = Listing.objects.get(pk=listing_id)
-                    data['target_listing'] = target_listing
-                except Listing.DoesNotExist:
-                    raise serializers.ValidationError({"target_listing": "Listing does not exist."})
-                except ValueError:
+                    owner_ids = list(Listing.objects.filter(pk=listing_id).values_list('owner_id', flat=True)[:1])
+                except (ValueError, DjangoValidationError):
                     raise serializers.ValidationError({"target_listing": "Invalid listing ID format."})
-
-            if not target_listing:
+                if not owner_ids:
+                    raise serializers.ValidationError({"target_listing": "Listing does not exist."})
+                owner_id = owner_ids[0]
+                data['target_listing_id'] = listing_id
+            else:
                 raise serializers.ValidationError({"target_listing": "Required for LISTING reviews."})
-            if target_user:
-                raise serializers.ValidationError({"target_user": "Must be null for LISTING reviews."})
             # Prevent owners from reviewing their own listings
-            try:
-                owner = getattr(target_listing, 'owner', None)
-                if owner and owner == request.user:
-                    raise serializers.ValidationError({"non_field_errors": ["You cannot review your own listing."]})
-            except Exception:
-                pass
-            # Check for duplicate listing review
-            dup_qs = Review.objects.filter(author=request.user, target_listing=target_listing)
-            if self.instance:
-                dup_qs = dup_qs.exclude(pk=self.instance.pk)
-            if dup_qs.exists():
-                raise serializers.ValidationError({"non_field_errors": ["You have already reviewed this listing."]})
+            if owner_id == request.user.pk:
+                raise serializers.ValidationError({"non_field_errors": ["You cannot review your own listing."]})
         elif target_type == Review.TargetType.USER:
             # Allow target_user to come from context when using /reviews/users/<user_id>/ endpoint
-            if not target_user:
-                user_id = self.context.get('user_id')
-                if user_id:
-                    try:
-                        target_user = User.objects.get(pk=user_id)
-                        data['target_user'] = target_user
-                    except User.DoesNotExist:
-                        raise serializers.ValidationError({"target_user": "User does not exist."})
-                    except ValueError:
-                        raise serializers.ValidationError({"target_user": "Invalid user ID format."})
-            if not target_user:
-                raise serializers.ValidationError({"target_user": "Required for USER reviews."})
             if target_listing:
                 raise serializers.ValidationError({"target_listing": "Must be null for USER reviews."})
+            if target_user:
+                target_user_id = target_user.pk
+            elif self.context.get('user_id'):
+                try:
+                    target_user_id = int(self.context['user_id'])
+                except (TypeError, ValueError):
+                    raise serializers.ValidationError({"target_user": "Invalid user ID format."})
+                # Existence only: the insert uses the raw id
+                if not User.objects.filter(pk=target_user_id).exists():
+                    raise serializers.ValidationError({"target_user": "User does not exist."})
+                data['target_user_id'] = target_user_id
+            else:
+                raise serializers.ValidationError({"target_user": "Required for USER reviews."})
             # Prevent reviewing yourself
-            if target_user == request.user:
+            if target_user_id == request.user.pk:
                 raise serializers.ValidationError({"non_field_errors": ["You cannot review yourself."]})
-            # Check for duplicate user review
-            dup_qs = Review.objects.filter(author=request.user, target_user=target_user)
-            if self.instance:
-                dup_qs = dup_qs.exclude(pk=self.instance.pk)
-            if dup_qs.exists():
-                raise serializers.ValidationError({"non_field_errors": ["You have already reviewed this user."]})
         else:
             raise serializers.ValidationError({"target_type": "Invalid target type."})
 
@@ -111,3 +111,21 @@ class ReviewSerializer(serializers.ModelSerializer):
     def create(self, validated_data):
         validated_data['author'] = self.context['request'].user
         return super().create(validated_data)
+
+
+class ReviewSummarySerializer(serializers.ModelSerializer):
+    average = serializers.FloatField(source='average_rating', read_only=True)
+    count = serializers.IntegerField(source='review_count', read_only=True)
+    distribution = serializers.DictField(read_only=True)
+    reviewer_roles = serializers.DictField(read_only=True)
+    recent_comments = serializers.SerializerMethodField()
+
+    class Meta:
+        model = ReviewSummary
+        fields = ['target_type', 'average', 'count', 'distribution', 'reviewer_roles', 'recent_comments']
+        read_only_fields = fields
+
+    def get_recent_comments(self, obj):
+        limit = self.context.get('comments_limit', ReviewSummary.RECENT_COMMENTS_LIMIT)
+        return list(obj.recent_comments)[:limit]
+
@@ -0,0 +1,133 @@
+import copy
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from .models import Review, ReviewSummary
+
+ROLE_FIELDS = {
+    'student': 'student_reviews',
+    'landlord': 'landlord_reviews',
+}
+
+
+def _target_filter(review):
+    if review.target_type == Review.TargetType.USER:
+        return {'target_user_id': review.target_user_id}
+    return {'target_listing_id': review.target_listing_id}
+
+
+def _role_field(review):
+    role = getattr(review.author, 'role', None)
+    return ROLE_FIELDS.get(role, 'other_reviews')
+
+
+def _comment_entry(review):
+    return {
+        'id': str(review.id),
+        'author': review.author.username,
+        'rating': review.rating,
+        'comment': review.comment,
+        'created_at': review.created_at.isoformat() if review.created_at else None,
+    }
+
+
+def _refill_recent_comments(summary, review):
+    # Bounded, index-backed read used only when a listed comment disappears
+    recent = (
+        Review.objects.filter(target_type=review.target_type, **_target_filter(review))
+        .exclude(comment__isnull=True).exclude(comment='')
+        .select_related('author')
+        .order_by('-created_at')[:ReviewSummary.RECENT_COMMENTS_LIMIT]
+    )
+    summary.recent_comments = [_comment_entry(r) for r in recent]
+
+
+def _locked_summary(review, create=False):
+    lookup = _target_filter(review)
+    if None in lookup.values():
+        return None
+    if create:
+        ReviewSummary.objects.get_or_create(target_type=review.target_type, **lookup)
+    return ReviewSummary.objects.select_for_update().filter(**lookup).first()
+
+
+def _target_of(review):
+    return (review.target_type, review.target_user_id, review.target_listing_id)
+
+
+def _add(summary, review):
+    summary.review_count += 1
+    summary.rating_total += review.rating
+    setattr(summary, f'rating_{review.rating}', getattr(summary, f'rating_{review.rating}') + 1)
+    role_field = _role_field(review)
+    setattr(summary, role_field, getattr(summary, role_field) + 1)
+    if review.comment:
+        summary.recent_comments = (
+            [_comment_entry(review)] + list(summary.recent_comments)
+        )[:ReviewSummary.RECENT_COMMENTS_LIMIT]
+
+
+def _remove(summary, review):
+    rating = getattr(review, '_loaded_rating', None) or review.rating
+    summary.review_count = max(summary.review_count - 1, 0)
+    summary.rating_total = max(summary.rating_total - rating, 0)
+    setattr(summary, f'rating_{rating}', max(getattr(summary, f'rating_{rating}') - 1, 0))
+    role_field = _role_field(review)
+    setattr(summary, role_field, max(getattr(summary, role_field) - 1, 0))
+    if any(entry.get('id') == str(review.id) for entry in summary.recent_comments):
+        _refill_recent_comments(summary, review)
+
+
+def _apply_edit(summary, review):
+    old_rating = getattr(review, '_loaded_rating', review.rating)
+    if old_rating != review.rating:
+        summary.rating_total += review.rating - old_rating
+        setattr(summary, f'rating_{old_rating}', max(getattr(summary, f'rating_{old_rating}') - 1, 0))
+        setattr(summary, f'rating_{review.rating}', getattr(summary, f'rating_{review.rating}') + 1)
+    review_id = str(review.id)
+    listed = any(entry.get('id') == review_id for entry in summary.recent_comments)
+    if listed and review.comment:
+        summary.recent_comments = [
+            _comment_entry(review) if entry.get('id') == review_id else entry
+            for entry in summary.recent_comments
+        ]
+    elif listed or (review.comment and not getattr(review, '_loaded_comment', None)):
+        _refill_recent_comments(summary, review)
+
+
+@receiver(post_save, sender=Review)
+def update_summary_on_save(sender, instance, created, **kwargs):
+    loaded_target = getattr(instance, '_loaded_target', None)
+    # The API keeps targets read-only, but an admin or ORM save can still move a review
+    moved = not created and loaded_target is not None and loaded_target != _target_of(instance)
+    with transaction.atomic():
+        if moved:
+            previous = copy.copy(instance)
+            previous.target_type, previous.target_user_id, previous.target_listing_id = loaded_target
+            old_summary = _locked_summary(previous)
+            if old_summary is not None:
+                _remove(old_summary, previous)
+                old_summary.save()
+        summary = _locked_summary(instance, create=created or moved)
+        if summary is not None:
+            if created or moved:
+                _add(summary, instance)
+                if moved and instance.comment:
+                    # An older review joining this target may not belong at the head of the list
+                    _refill_recent_comments(summary, instance)
+            else:
+                _apply_edit(summary, instance)
+            summary.save()
+    instance._loaded_rating = instance.rating
+    instance._loaded_comment = instance.comment
+    instance._loaded_target = _target_of(instance)
+
+
+@receiver(post_delete, sender=Review)
+def update_summary_on_delete(sender, instance, **kwargs):
+    with transaction.atomic():
+        summary = _locked_summary(instance)
+        if summary is None:
+            return
+        _remove(summary, instance)
+        summary.save()
@@ -14,8 +14,11 @@ URL Examples
 
 All reviews: GET /reviews/
 Filter by target: GET /reviews/?target_type=USER&target_id=2
-My reviews (by me): GET /reviews/my/
+My reviews (by me): GET /reviews/my/ (narrow with ?target_type=LISTING&target_id=<uuid>)
 Reviews of a user: GET /reviews/users/2/ (also POST to create)
 Reviews of a listing: GET /reviews/listings/uuid-here/ (also POST to create)
+Rating summary of a user: GET /reviews/users/2/summary/?comments=3
+Rating summary of a listing: GET /reviews/listings/uuid-here/summary/
+Batch ratings: GET /reviews/ratings/?listings=uuid1,uuid2&users=2,3 (ETag / If-None-Match)
 Specific review: GET/PATCH/DELETE /reviews/<review_uuid>/
 '''
\ No newline at end of file
@@ -3,17 +3,61 @@ from rest_framework.permissions import IsAuthenticated
 from rest_framework.exceptions import PermissionDenied, ValidationError
 from rest_framework.decorators import action
 from rest_framework.response import Response
+from rest_framework.pagination import CursorPagination
 from django_filters.rest_framework import DjangoFilterBackend
+import hashlib
+import uuid
 from django.db.models import Q
-from django.db import IntegrityError
-from .models import Review
-from .serializers import ReviewSerializer
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import IntegrityError, transaction
+from .models import Review, ReviewSummary
+from .serializers import ReviewSerializer, ReviewSummarySerializer
 from users.models import User
 from listings.models import Listing
 
+DUPLICATE_REVIEW_ERRORS = {
+    Review.TargetType.USER: ('target_user', "You have already reviewed this user."),
+    Review.TargetType.LISTING: ('target_listing', "You have already reviewed this listing."),
+}
+
+
+def duplicate_review_error(author, data):
+    """The 400 for a rejected insert that duplicates one of author's reviews, else None."""
+    field, message = DUPLICATE_REVIEW_ERRORS[data['target_type']]
+    target_id = data.get(f'{field}_id') or data[field].pk
+    if Review.objects.filter(author=author, **{f'{field}_id': target_id}).exists():
+        return ValidationError({"non_field_errors": [message]})
+    return None
+
+
+MAX_BATCH_RATING_TARGETS = 100
+
+
+def parse_id_list(raw, cast, field):
+    if not raw:
+        return []
+    try:
+        ids = list(dict.fromkeys(cast(part.strip()) for part in raw.split(',') if part.strip()))
+    except (TypeError, ValueError):
+        raise ValidationError({field: "Provide a comma-separated list of valid IDs."})
+    if len(ids) > MAX_BATCH_RATING_TARGETS:
+        raise ValidationError({field: f"At most {MAX_BATCH_RATING_TARGETS} IDs per request."})
+    return ids
+
+
+class ReviewCursorPagination(CursorPagination):
+    # Newest first, as Review.Meta.ordering. The cursor keysets on created_at and pages reviews
+    # sharing a timestamp by an offset; -id only makes that offset run over a stable order.
+    ordering = ('-created_at', '-id')
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+
 class ReviewViewSet(ModelViewSet):
     queryset = Review.objects.all()
     serializer_class = ReviewSerializer
+    pagination_class = ReviewCursorPagination
     permission_classes = [IsAuthenticated]
     filter_backends = [DjangoFilterBackend]
     filterset_fields = ['target_type', 'rating']
@@ -29,10 +73,14 @@ class ReviewViewSet(ModelViewSet):
         return context
 
     def get_queryset(self):
-        queryset = super().get_queryset()
+        # Eager-load everything the serializer touches so a page costs a fixed number of queries
+        queryset = super().get_queryset().select_related(
+            'author', 'target_user', 'target_listing'
+        ).prefetch_related('target_listing__images')
         user = self.request.user
         if self.action == 'my_reviews':
-            return queryset.filter(author=user)
+            # Narrowed by target_type/target_id below to find the caller's review of one target
+            queryset = queryset.filter(author=user)
         elif self.action == 'reviews_for_user':
             user_id = self.kwargs.get('user_id')
             return queryset.filter(target_type=Review.TargetType.USER, target_user_id=user_id)
@@ -49,14 +97,21 @@ class ReviewViewSet(ModelViewSet):
         return queryset
 
     def perform_create(self, serializer):
+        # Uniqueness is enforced by the database constraints; the savepoint keeps an
+        # outer transaction usable when the insert is rejected. Targets were validated to
+        # exist, so a rejection is reported as a duplicate only once one is found.
         try:
-            serializer.save(author=self.request.user)
-        except IntegrityError as e:
-            # Handle any IntegrityError with a generic message
-            raise ValidationError({"non_field_errors": ["A review for this target already exists."]})
+            with transaction.atomic():
+                serializer.save(author=self.request.user)
+        except IntegrityError:
+            error = duplicate_review_error(self.request.user, serializer.validated_data)
+            if error is None:
+                raise
+            raise error
 
     def perform_update(self, serializer):
-        if self.request.user != self.get_object().author:
+        # The target is fixed on update (see ReviewSerializer.validate), so no constraint can trip
+        if self.request.user.pk != serializer.instance.author_id:
             raise PermissionDenied("You can only update your own reviews.")
         serializer.save()
 
@@ -71,33 +126,89 @@ class ReviewViewSet(ModelViewSet):
 
     @action(detail=False, methods=['get', 'post'], url_path='users/(?P<user_id>[^/.]+)')
     def reviews_for_user(self, request, user_id=None):
-        try:
-            User.objects.get(pk=user_id)
-        except User.DoesNotExist:
-            raise PermissionDenied("User not found.")
         if request.method == 'POST':
+            # The target id comes from the URL via serializer context; no pre-fetch needed
             mutable_data = request.data.copy()
             mutable_data['target_type'] = Review.TargetType.USER
-            mutable_data['target_user'] = user_id
+            mutable_data.pop('target_user', None)
             serializer = self.get_serializer(data=mutable_data, context=self.get_serializer_context())
             serializer.is_valid(raise_exception=True)
             self.perform_create(serializer)
             headers = self.get_success_headers(serializer.data)
             return Response(serializer.data, status=201, headers=headers)
+        if not User.objects.filter(pk=user_id).exists():
+            raise PermissionDenied("User not found.")
         return self.list(request)
 
     @action(detail=False, methods=['get', 'post'], url_path='listings/(?P<listing_id>[^/.]+)')
     def reviews_for_listing(self, request, listing_id=None):
-        try:
-            Listing.objects.get(pk=listing_id)
-        except Listing.DoesNotExist:
-            raise PermissionDenied("Listing not found.")
         if request.method == 'POST':
+            # Existence and ownership are checked by the serializer with a single read
             mutable_data = request.data.copy()
             mutable_data['target_type'] = Review.TargetType.LISTING
+            mutable_data.pop('target_listing', None)
             serializer = self.get_serializer(data=mutable_data, context=self.get_serializer_context())
             serializer.is_valid(raise_exception=True)
             self.perform_create(serializer)
             headers = self.get_success_headers(serializer.data)
             return Response(serializer.data, status=201, headers=headers)
-        return self.list(request)
\ No newline at end of file
+        try:
+            listing_exists = Listing.objects.filter(pk=listing_id).exists()
+        except (ValueError, DjangoValidationError):
+            listing_exists = False
+        if not listing_exists:
+            raise PermissionDenied("Listing not found.")
+        return self.list(request)
+
+    def _summary_response(self, request, target_type, **lookup):
+        # Served from the precomputed ReviewSummary row; never aggregates Review
+        try:
+            summary = ReviewSummary.objects.filter(**lookup).first()
+        except (ValueError, DjangoValidationError):
+            summary = None
+        if summary is None:
+            summary = ReviewSummary(target_type=target_type)
+        try:
+            limit = int(request.query_params.get('comments', ReviewSummary.RECENT_COMMENTS_LIMIT))
+        except ValueError:
+            limit = ReviewSummary.RECENT_COMMENTS_LIMIT
+        limit = max(0, min(limit, ReviewSummary.RECENT_COMMENTS_LIMIT))
+        serializer = ReviewSummarySerializer(summary, context={'request': request, 'comments_limit': limit})
+        return Response(serializer.data)
+
+    @action(detail=False, methods=['get'], url_path='users/(?P<user_id>[^/.]+)/summary')
+    def user_summary(self, request, user_id=None):
+        return self._summary_response(request, Review.TargetType.USER, target_user_id=user_id)
+
+    @action(detail=False, methods=['get'], url_path='listings/(?P<listing_id>[^/.]+)/summary')
+    def listing_summary(self, request, listing_id=None):
+        return self._summary_response(request, Review.TargetType.LISTING, target_listing_id=listing_id)
+
+    @action(detail=False, methods=['get'], url_path='ratings')
+    def batch_ratings(self, request):
+        """Rating aggregates for many targets: ?listings=<uuid>,<uuid>&users=<id>,<id>"""
+        listing_ids = parse_id_list(request.query_params.get('listings'), uuid.UUID, 'listings')
+        user_ids = parse_id_list(request.query_params.get('users'), int, 'users')
+        if not listing_ids and not user_ids:
+            raise ValidationError({"non_field_errors": ["Provide listings and/or users IDs."]})
+
+        # One read over the denormalized summaries; targets without reviews report zero
+        rows = ReviewSummary.objects.filter(
+            Q(target_listing_id__in=listing_ids) | Q(target_user_id__in=user_ids)
+        ).values_list('target_listing_id', 'target_user_id', 'review_count', 'rating_total', 'updated_at')
+        empty = {'average': None, 'count': 0}
+        listings = {str(pk): dict(empty) for pk in listing_ids}
+        users = {str(pk): dict(empty) for pk in user_ids}
+        fingerprint = hashlib.sha1()
+        for listing_id, user_id, count, total, updated_at in sorted(rows, key=lambda r: str(r[0] or r[1])):
+            bucket, key = (listings, str(listing_id)) if listing_id else (users, str(user_id))
+            bucket[key] = {'average': round(total / count, 2) if count else None, 'count': count}
+            fingerprint.update(f'{key}:{count}:{total}:{updated_at.isoformat()};'.encode())
+        fingerprint.update(','.join(sorted(listings) + sorted(users)).encode())
+
+        etag = f'"{fingerprint.hexdigest()}"'
+        headers = {'ETag': etag, 'Cache-Control': 'private, no-cache'}
+        if etag in [tag.strip() for tag in request.headers.get('If-None-Match', '').split(',')]:
+            return Response(status=304, headers=headers)
+        return Response({'listings': listings, 'users': users}, headers=headers)
+
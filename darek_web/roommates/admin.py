@@ -1,6 +1,6 @@
 # roommates/admin.py
 from django.contrib import admin
-from .models import RoommatePost, RoommateRequest, RoommateGroup
+from .models import RoommatePost, RoommateRequest, RoommateGroup, RoommateMembership
 
 @admin.register(RoommatePost)
 class RoommatePostAdmin(admin.ModelAdmin):
@@ -16,10 +16,12 @@ class RoommateRequestAdmin(admin.ModelAdmin):
 
 @admin.register(RoommateGroup)
 class RoommateGroupAdmin(admin.ModelAdmin):
-    list_display = ('id', 'name', 'leader', 'get_members_count', 'status', 'created_at')
+    list_display = ('id', 'name', 'leader', 'member_count', 'cost_per_member', 'status', 'created_at')
     list_filter = ('status', 'female_only', 'created_at')
     search_fields = ('name', 'university', 'members__username')
 
-    def get_members_count(self, obj):
-        return obj.members.count()
-    get_members_count.short_description = 'Members'
\ No newline at end of file
+@admin.register(RoommateMembership)
+class RoommateMembershipAdmin(admin.ModelAdmin):
+    list_display = ('id', 'group', 'user', 'joined_at')
+    search_fields = ('group__name', 'user__username')
+    raw_id_fields = ('group', 'user')
\ No newline at end of file
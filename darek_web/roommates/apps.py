@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class RoommatesConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'roommates'
+
+    def ready(self):
+        import roommates.matching  # Keep the matching index in sync with RoommatePost writes
+        import roommates.signals  # Keep post visibility and group member_count/cost_per_member in sync
@@ -0,0 +1,269 @@
+# roommates/matching.py
+"""
+Ranks RoommatePost candidates for a seeker in one vectorized pass.
+
+Every post's features (budget, university, district, preferred type, female_only and the
+author's gender) live in numpy arrays held per process. The arrays are built once and then
+refreshed incrementally: post_save/post_delete mark changed posts of this process, other
+processes' edits are picked up through RoommatePost.updated_at every
+ROOMMATE_MATCHING_REFRESH_SECONDS, and a full rebuild every ROOMMATE_MATCHING_REBUILD_SECONDS
+drops posts deleted elsewhere. Text features are compared as integer codes, so scoring is a
+handful of array operations however many posts there are.
+
+Districts carry no coordinates, so district proximity means the same district.
+"""
+import threading
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+import numpy as np
+from django.conf import settings
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import RoommatePost
+
+WEIGHTS = {
+    'budget': 0.4,
+    'university': 0.25,
+    'district': 0.15,
+    'preferred_type': 0.2,
+}
+# Credit for preferred type when either side did not state one
+OPEN_TYPE_CREDIT = 0.5
+MISSING = 0
+
+FEATURE_FIELDS = (
+    'id', 'author_id', 'max_budget', 'university', 'district', 'preferred_type',
+    'female_only', 'author__gender', 'is_visible', 'updated_at',
+)
+
+
+@dataclass
+class Seeker:
+    """What the caller is looking for; unset fields score nothing for that component."""
+    user_id: int
+    gender: Optional[str]
+    max_budget: Optional[float] = None
+    university: Optional[str] = None
+    district: Optional[str] = None
+    preferred_type: Optional[str] = None
+    female_only: bool = False
+
+
+def _normalize(value):
+    return ' '.join(str(value).split()).casefold() if value else None
+
+
+class CandidateIndex:
+    """Column arrays of every candidate post plus the bookkeeping to refresh them in place."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._vocab = {}
+        self._position = {}
+        self._ids = []
+        self._columns = {}
+        self._dirty = set()
+        self._watermark = None
+        self._refreshed_at = 0.0
+        self._built_at = None
+
+    def _code(self, value):
+        value = _normalize(value)
+        if value is None:
+            return MISSING
+        return self._vocab.setdefault(value, len(self._vocab) + 1)
+
+    def _encode(self, row):
+        return (
+            row['author_id'],
+            float(row['max_budget']),
+            self._code(row['university']),
+            self._code(row['district']),
+            self._code(row['preferred_type']),
+            row['female_only'],
+            row['author__gender'] == 'female',
+        )
+
+    @staticmethod
+    def _candidates():
+        # Hidden posts are loaded too, so a post that becomes hidden is deactivated on the next poll
+        return RoommatePost.objects.values(*FEATURE_FIELDS)
+
+    def _rebuild(self):
+        rows = list(self._candidates())
+        self._vocab = {}
+        self._ids = [row['id'] for row in rows]
+        self._position = {pk: i for i, pk in enumerate(self._ids)}
+        encoded = [self._encode(row) for row in rows]
+        author, budget, university, district, preferred_type, female_only, female_author = (
+            zip(*encoded) if encoded else ((),) * 7
+        )
+        self._columns = {
+            'author': np.array(author, dtype=np.int64),
+            'budget': np.array(budget, dtype=np.float64),
+            'university': np.array(university, dtype=np.int32),
+            'district': np.array(district, dtype=np.int32),
+            'preferred_type': np.array(preferred_type, dtype=np.int32),
+            'female_only': np.array(female_only, dtype=bool),
+            'female_author': np.array(female_author, dtype=bool),
+            'active': np.array([row['is_visible'] for row in rows], dtype=bool),
+        }
+        self._watermark = max((row['updated_at'] for row in rows if row['updated_at']), default=None)
+        self._dirty.clear()
+        self._built_at = self._refreshed_at = time.monotonic()
+
+    def _apply(self, rows, removed=()):
+        columns = self._columns
+        appended = []
+        for row in rows:
+            values = self._encode(row)
+            i = self._position.get(row['id'])
+            if i is None:
+                appended.append((row['id'], values, row['is_visible']))
+                continue
+            for name, value in zip(('author', 'budget', 'university', 'district', 'preferred_type',
+                                    'female_only', 'female_author'), values):
+                columns[name][i] = value
+            columns['active'][i] = row['is_visible']
+            if row['updated_at'] and (self._watermark is None or row['updated_at'] > self._watermark):
+                self._watermark = row['updated_at']
+        for pk in removed:
+            i = self._position.get(pk)
+            if i is not None:
+                columns['active'][i] = False
+        if appended:
+            start = len(self._ids)
+            for offset, (pk, _, _) in enumerate(appended):
+                self._ids.append(pk)
+                self._position[pk] = start + offset
+            new = list(zip(*(values for _, values, _ in appended)))
+            for name, values in zip(('author', 'budget', 'university', 'district', 'preferred_type',
+                                     'female_only', 'female_author'), new):
+                columns[name] = np.concatenate([columns[name], np.array(values, dtype=columns[name].dtype)])
+            visible = np.array([is_visible for _, _, is_visible in appended], dtype=bool)
+            columns['active'] = np.concatenate([columns['active'], visible])
+            latest = max((row['updated_at'] for row in rows if row['updated_at']), default=None)
+            if latest and (self._watermark is None or latest > self._watermark):
+                self._watermark = latest
+
+    def _refresh(self):
+        now = time.monotonic()
+        if self._built_at is None or now - self._built_at >= settings.ROOMMATE_MATCHING_REBUILD_SECONDS:
+            self._rebuild()
+            return
+        changed = set(self._dirty)
+        poll = now - self._refreshed_at >= settings.ROOMMATE_MATCHING_REFRESH_SECONDS
+        if not changed and not poll:
+            return
+        candidates = self._candidates()
+        rows = []
+        if poll:
+            recent = candidates.filter(updated_at__gte=self._watermark) if self._watermark else candidates
+            rows = list(recent)
+            self._refreshed_at = now
+        pending = changed - {row['id'] for row in rows}
+        if pending:
+            rows += list(candidates.filter(id__in=pending))
+        self._apply(rows, removed=changed - {row['id'] for row in rows})
+        self._dirty.clear()
+
+    def mark_changed(self, post_id):
+        with self._lock:
+            if self._built_at is not None:
+                self._dirty.add(post_id)
+
+    def discard(self, post_ids):
+        """Drop posts found missing when their page was loaded (deleted by another process)."""
+        with self._lock:
+            self._apply([], removed=post_ids)
+
+    def score(self, seeker):
+        """Scores (0..1) for every post plus a mask of the posts the seeker may match."""
+        with self._lock:
+            self._refresh()
+            c = self._columns
+            eligible = c['active'] & (c['author'] != seeker.user_id)
+            # Female-only posts only admit women; a female-only seeker only wants women
+            if seeker.gender != 'female':
+                eligible &= ~c['female_only']
+            if seeker.female_only:
+                eligible &= c['female_author']
+
+            score = np.zeros(len(self._ids), dtype=np.float64)
+            if seeker.max_budget:
+                budget = c['budget']
+                gap = np.abs(budget - seeker.max_budget) / np.maximum(np.maximum(budget, seeker.max_budget), 1.0)
+                score += WEIGHTS['budget'] * np.clip(1.0 - gap, 0.0, 1.0)
+            for name in ('university', 'district'):
+                code = self._vocab.get(_normalize(getattr(seeker, name)))
+                if code is not None:
+                    score += WEIGHTS[name] * (c[name] == code)
+            wanted = _normalize(seeker.preferred_type)
+            wanted = MISSING if wanted is None else self._vocab.get(wanted, -1)
+            preferred = c['preferred_type']
+            type_match = np.where(
+                (preferred == MISSING) | (wanted == MISSING), OPEN_TYPE_CREDIT, (preferred == wanted).astype(np.float64)
+            )
+            score += WEIGHTS['preferred_type'] * type_match
+            return self._ids, score, eligible
+
+    def top(self, seeker, limit):
+        """(post_id, score) pairs of the best limit eligible posts, best first."""
+        ids, score, eligible = self.score(seeker)
+        candidates = np.flatnonzero(eligible)
+        if limit < len(candidates):
+            candidates = candidates[np.argpartition(-score[candidates], limit - 1)[:limit]]
+        ordered = candidates[np.argsort(-score[candidates], kind='stable')]
+        return [(ids[i], float(score[i])) for i in ordered]
+
+
+_index = CandidateIndex()
+
+
+def get_index():
+    return _index
+
+
+def seeker_for(user, params):
+    """Seeker from query params, defaulting to the caller's latest roommate post."""
+    own = RoommatePost.objects.filter(author=user).order_by('-created_at').first()
+    seeker = Seeker(user_id=user.id, gender=user.gender)
+    if own is not None:
+        seeker.max_budget = float(own.max_budget)
+        seeker.university = own.university
+        seeker.district = own.district
+        seeker.preferred_type = own.preferred_type
+        seeker.female_only = own.female_only
+    if params.get('max_budget'):
+        seeker.max_budget = float(params['max_budget'])
+    for name in ('university', 'district', 'preferred_type'):
+        if params.get(name):
+            setattr(seeker, name, params[name])
+    if 'female_only' in params:
+        seeker.female_only = str(params['female_only']).lower() in ('1', 'true', 'yes')
+    return seeker
+
+
+def match_posts(user, params, limit):
+    """Best matching posts for user, each with a .match_score, best first."""
+    ranked = get_index().top(seeker_for(user, params), limit)
+    posts = RoommatePost.objects.select_related('author').in_bulk([pk for pk, _ in ranked])
+    missing = [pk for pk, _ in ranked if pk not in posts]
+    if missing:
+        get_index().discard(missing)
+    results = []
+    for pk, score in ranked:
+        post = posts.get(pk)
+        if post is not None:
+            post.match_score = round(score, 4)
+            results.append(post)
+    return results
+
+
+@receiver(post_save, sender=RoommatePost)
+@receiver(post_delete, sender=RoommatePost)
+def _post_changed(sender, instance, **kwargs):
+    _index.mark_changed(instance.pk)
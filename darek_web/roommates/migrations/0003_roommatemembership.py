@@ -0,0 +1,94 @@
+# Generated by Django 5.2.7 on 2026-10-19 15:02
+
+import logging
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, F, Min, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Greatest
+
+logger = logging.getLogger(__name__)
+
+
+def keep_first_membership(apps, schema_editor):
+    # Before the unique user constraint: a user found in several groups keeps the oldest membership.
+    # Destructive: the other memberships are deleted, so each one is logged first.
+    Membership = apps.get_model('roommates', 'RoommateGroup').members.through
+    keep = Membership.objects.values('user_id').annotate(first=Min('id')).values('first')
+    extra = Membership.objects.exclude(id__in=Subquery(keep))
+    removed = list(extra.values_list('id', 'user_id', 'roommategroup_id').order_by('user_id', 'id'))
+    for membership_id, user_id, group_id in removed:
+        logger.warning(
+            "Removing membership %s: user %s is already in an older group, dropped from group %s",
+            membership_id, user_id, group_id,
+        )
+    if removed:
+        extra.delete()
+        logger.warning("Removed %s duplicate roommate group memberships", len(removed))
+
+
+def backfill_member_count(apps, schema_editor):
+    RoommateGroup = apps.get_model('roommates', 'RoommateGroup')
+    RoommateMembership = apps.get_model('roommates', 'RoommateMembership')
+    counts = (
+        RoommateMembership.objects.filter(group_id=OuterRef('pk'))
+        .values('group_id').annotate(total=Count('id')).values('total')
+    )
+    RoommateGroup.objects.update(member_count=Coalesce(Subquery(counts), 0))
+    RoommateGroup.objects.filter(member_count__gt=F('max_members')).update(
+        max_members=Greatest(F('member_count'), F('max_members'))
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('roommates', '0002_roommategroup_leader_roommategroup_listing_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(keep_first_membership, migrations.RunPython.noop),
+        # The auto-created members table becomes RoommateMembership without moving any rows
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.CreateModel(
+                    name='RoommateMembership',
+                    fields=[
+                        ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                        ('group', models.ForeignKey(db_column='roommategroup_id', on_delete=django.db.models.deletion.CASCADE, related_name='memberships', to='roommates.roommategroup')),
+                        ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='roommate_memberships', to=settings.AUTH_USER_MODEL)),
+                    ],
+                    options={
+                        'db_table': 'roommates_roommategroup_members',
+                    },
+                ),
+                migrations.AlterField(
+                    model_name='roommategroup',
+                    name='members',
+                    field=models.ManyToManyField(limit_choices_to={'role__in': ['student', 'other']}, related_name='roommate_groups', through='roommates.RoommateMembership', to=settings.AUTH_USER_MODEL),
+                ),
+            ],
+        ),
+        migrations.AddField(
+            model_name='roommatemembership',
+            name='joined_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddConstraint(
+            model_name='roommatemembership',
+            constraint=models.UniqueConstraint(fields=('user',), name='roommate_membership_one_group_per_user'),
+        ),
+        migrations.AddField(
+            model_name='roommategroup',
+            name='member_count',
+            field=models.PositiveSmallIntegerField(default=0, help_text='Number of members, maintained by RoommateMembership.join/leave'),
+        ),
+        migrations.RunPython(backfill_member_count, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='roommategroup',
+            constraint=models.CheckConstraint(condition=models.Q(('member_count__lte', models.F('max_members'))), name='roommate_group_member_count_within_max'),
+        ),
+    ]
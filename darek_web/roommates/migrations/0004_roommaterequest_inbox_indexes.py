@@ -0,0 +1,23 @@
+# Generated by Django 5.2.7 on 2026-10-19 13:45
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('roommates', '0003_roommatemembership'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='roommaterequest',
+            index=models.Index(fields=['receiver', 'status', 'created_at'], name='rmreq_receiver_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='roommaterequest',
+            index=models.Index(fields=['sender', 'created_at'], name='rmreq_sender_created_idx'),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.7 on 2026-10-19 13:46
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_is_visible(apps, schema_editor):
+    RoommatePost = apps.get_model('roommates', 'RoommatePost')
+    RoommatePost.objects.exclude(author__role__in=['student', 'other']).update(is_visible=False)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('roommates', '0004_roommaterequest_inbox_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='roommatepost',
+            name='is_visible',
+            field=models.BooleanField(default=True, editable=False, help_text="Author's role may post; kept in sync with the author's role so feeds skip the user join"),
+        ),
+        migrations.RunPython(backfill_is_visible, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='roommatepost',
+            index=models.Index(condition=models.Q(('is_visible', True)), fields=['-created_at', '-id'], name='rmpost_feed_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='roommatepost',
+            index=models.Index(condition=models.Q(('is_visible', True)), fields=['university', 'max_budget'], name='rmpost_uni_budget_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='roommatepost',
+            index=models.Index(condition=models.Q(('is_visible', True)), fields=['district', 'max_budget'], name='rmpost_district_budget_idx'),
+        ),
+    ]
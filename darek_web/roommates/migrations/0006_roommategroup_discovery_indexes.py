@@ -0,0 +1,25 @@
+# Generated by Django 5.2.7 on 2026-10-19 13:52
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0005_alter_listingimage_options_and_more'),
+        ('messaging', '0010_message_archive'),
+        ('roommates', '0005_roommatepost_feed'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='roommategroup',
+            index=models.Index(condition=models.Q(('member_count__lt', models.F('max_members')), ('status', 'OPEN')), fields=['-created_at', '-id'], name='rmgroup_open_feed_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='roommategroup',
+            index=models.Index(condition=models.Q(('member_count__lt', models.F('max_members')), ('status', 'OPEN')), fields=['university', 'cost_per_member'], name='rmgroup_open_uni_cost_idx'),
+        ),
+    ]
@@ -1,9 +1,17 @@
 # roommates/models.py
 import uuid
-from django.db import models
+from django.db import models, transaction
 from django.conf import settings
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.core.exceptions import ValidationError
+from django.db.models import DecimalField, ExpressionWrapper, F, FloatField, OuterRef, Subquery, Value
+from django.db.models.functions import Cast, NullIf
+from django.utils import timezone
+from listings.models import Listing
+
+# Roles allowed to post, request and join groups
+ROOMMATE_ROLES = ['student', 'other']
+
 
 class RoommatePost(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
@@ -29,18 +37,39 @@ class RoommatePost(models.Model):
     female_only = models.BooleanField(default=False)
     university = models.CharField(max_length=255, blank=True, null=True)
     district = models.CharField(max_length=100, blank=True, null=True)
+    is_visible = models.BooleanField(
+        default=True,
+        editable=False,
+        help_text="Author's role may post; kept in sync with the author's role so feeds skip the user join"
+    )
     created_at = models.DateTimeField(auto_now_add=True, null=True, blank=True)  # <-- only change
     updated_at = models.DateTimeField(auto_now=True, null=True, blank=True)      # <-- only change
 
     def __str__(self):
         return f"Post by {self.author.username} (Budget: {self.max_budget})"
 
+    def save(self, *args, **kwargs):
+        self.is_visible = self.author.role in ROOMMATE_ROLES
+        super().save(*args, **kwargs)
+
     def clean(self):
-        if self.author.role not in ['student', 'other']:
+        if self.author.role not in ROOMMATE_ROLES:
             raise ValidationError("Only students or others can create roommate posts.")
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Feed pages (RoommatePostViewSet.feed), unfiltered and by university/district with a budget range
+            models.Index(
+                fields=['-created_at', '-id'], condition=models.Q(is_visible=True), name='rmpost_feed_idx'
+            ),
+            models.Index(
+                fields=['university', 'max_budget'], condition=models.Q(is_visible=True), name='rmpost_uni_budget_idx'
+            ),
+            models.Index(
+                fields=['district', 'max_budget'], condition=models.Q(is_visible=True), name='rmpost_district_budget_idx'
+            ),
+        ]
 
 
 class RoommateRequest(models.Model):
@@ -77,6 +106,11 @@ class RoommateRequest(models.Model):
     class Meta:
         unique_together = ['sender', 'receiver']
         ordering = ['-created_at']
+        indexes = [
+            # Incoming and outgoing inbox pages (RoommateRequestViewSet.incoming/outgoing)
+            models.Index(fields=['receiver', 'status', 'created_at'], name='rmreq_receiver_status_idx'),
+            models.Index(fields=['sender', 'created_at'], name='rmreq_sender_created_idx'),
+        ]
 
 
 class RoommateGroup(models.Model):
@@ -88,6 +122,7 @@ class RoommateGroup(models.Model):
     name = models.CharField(max_length=255, db_index=True)
     members = models.ManyToManyField(
         settings.AUTH_USER_MODEL,
+        through='RoommateMembership',
         related_name='roommate_groups',
         limit_choices_to={'role__in': ['student', 'other']}
     )
@@ -106,6 +141,10 @@ class RoommateGroup(models.Model):
         validators=[MinValueValidator(2), MaxValueValidator(10)],
         help_text="Maximum number of members allowed"
     )
+    member_count = models.PositiveSmallIntegerField(
+        default=0,
+        help_text="Number of members, maintained by RoommateMembership.join/leave"
+    )
     cost_per_member = models.DecimalField(
         max_digits=10,
         decimal_places=2,
@@ -119,18 +158,122 @@ class RoommateGroup(models.Model):
     updated_at = models.DateTimeField(auto_now=True, null=True, blank=True)      # <-- only change
 
     def __str__(self):
-        return f"{self.name} ({self.members.count()} members)"
+        return f"{self.name} ({self.member_count} members)"
+
+    @staticmethod
+    def cost_per_member_expression(member_count, price=None):
+        """Listing price / member_count as an update() expression; null without a listing or members."""
+        if price is None:
+            price = Subquery(Listing.objects.filter(pk=OuterRef('listing_id')).values('price')[:1])
+        # Float divisor: SQLite keeps whole-number decimals as integers and would truncate
+        return ExpressionWrapper(
+            price / Cast(NullIf(member_count, 0), FloatField()),
+            output_field=DecimalField(max_digits=10, decimal_places=2),
+        )
 
     def save(self, *args, **kwargs):
-        if self.listing and self.members.count() > 0:
-            self.cost_per_member = self.listing.price / self.members.count()
+        # Membership and price changes update cost_per_member in place; a full save covers listing changes
+        if kwargs.get('update_fields') is not None:
+            super().save(*args, **kwargs)
+            return
+        if self._state.adding or kwargs.get('force_insert'):
+            if self.listing_id and self.member_count:
+                self.cost_per_member = self.listing.price / self.member_count
+            else:
+                self.cost_per_member = None
+            super().save(*args, **kwargs)
+            return
+        # The in-memory member_count may predate joins/leaves: it is never written back, and
+        # cost_per_member is computed in SQL from the stored count (the listing's price may be new)
+        kwargs['update_fields'] = [
+            f.name for f in self._meta.concrete_fields if not f.primary_key and f.name != 'member_count'
+        ]
+        self.cost_per_member = (
+            self.cost_per_member_expression(F('member_count'), price=Value(self.listing.price))
+            if self.listing_id else None
+        )
         super().save(*args, **kwargs)
+        self.refresh_from_db(fields=['member_count', 'cost_per_member'])
 
     def clean(self):
-        if self.members.count() > self.max_members:
+        if self.member_count > self.max_members:
             raise ValidationError(f"Group cannot exceed {self.max_members} members.")
         if self.female_only and any(m.gender != 'female' for m in self.members.all()):
             raise ValidationError("Female-only group cannot have non-female members.")
 
     class Meta:
         ordering = ['-created_at']
+        constraints = [
+            models.CheckConstraint(
+                condition=models.Q(member_count__lte=F('max_members')),
+                name='roommate_group_member_count_within_max',
+            ),
+        ]
+        indexes = [
+            # Discovery (RoommateGroupViewSet.discover) only ever reads open groups with a free seat
+            models.Index(
+                fields=['-created_at', '-id'],
+                condition=models.Q(status='OPEN', member_count__lt=F('max_members')),
+                name='rmgroup_open_feed_idx',
+            ),
+            models.Index(
+                fields=['university', 'cost_per_member'],
+                condition=models.Q(status='OPEN', member_count__lt=F('max_members')),
+                name='rmgroup_open_uni_cost_idx',
+            ),
+        ]
+
+
+class RoommateMembership(models.Model):
+    """
+    One row per group member. The unique user constraint makes "one group per user" a database
+    invariant, and the group's member_count (checked against max_members) caps group size, so
+    concurrent joins fail with IntegrityError instead of racing past application checks.
+    """
+    group = models.ForeignKey(
+        RoommateGroup,
+        on_delete=models.CASCADE,
+        db_column='roommategroup_id',
+        related_name='memberships'
+    )
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='roommate_memberships'
+    )
+    joined_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"{self.user_id} in {self.group_id}"
+
+    @classmethod
+    def join(cls, group, users):
+        """Add users to group. Raises IntegrityError if one is already in a group or the group would overflow."""
+        # Rows and count change together or not at all
+        with transaction.atomic():
+            cls.objects.bulk_create([cls(group=group, user=user) for user in users])
+            count = F('member_count') + len(users)
+            RoommateGroup.objects.filter(pk=group.pk).update(
+                member_count=count, cost_per_member=RoommateGroup.cost_per_member_expression(count)
+            )
+        group.member_count += len(users)
+
+    @classmethod
+    def leave(cls, group, user_ids):
+        """Remove user_ids from group; returns how many of them were members and re-reads group's stored count."""
+        with transaction.atomic():
+            removed, _ = cls.objects.filter(group=group, user_id__in=user_ids).delete()
+            if removed:
+                count = F('member_count') - removed
+                RoommateGroup.objects.filter(pk=group.pk).update(
+                    member_count=count, cost_per_member=RoommateGroup.cost_per_member_expression(count)
+                )
+                # Concurrent leaves make any in-memory arithmetic stale; callers decide on the stored value
+                group.refresh_from_db(fields=['member_count', 'cost_per_member'])
+        return removed
+
+    class Meta:
+        db_table = 'roommates_roommategroup_members'
+        constraints = [
+            models.UniqueConstraint(fields=['user'], name='roommate_membership_one_group_per_user'),
+        ]
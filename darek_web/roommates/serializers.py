@@ -1,9 +1,11 @@
 # roommates/serializers.py
+from django.db import IntegrityError, transaction
 from rest_framework import serializers
-from .models import RoommatePost, RoommateRequest, RoommateGroup
-from users.serializers import UserSerializer
-from listings.serializers import ListingSerializer
-from messaging.serializers import ConversationSerializer
+from .models import RoommatePost, RoommateRequest, RoommateGroup, RoommateMembership
+from users.serializers import UserSerializer, UserCompactSerializer
+from listings.serializers import ListingSerializer, ListingCompactSerializer
+from messaging.models import Conversation
+from messaging.serializers import InboxMessageSerializer
 from users.models import User
 
 
@@ -27,6 +29,13 @@ class RoommatePostSerializer(serializers.ModelSerializer):
         validated_data['author'] = self.context['request'].user
         return super().create(validated_data)
 
+class RoommateMatchSerializer(RoommatePostSerializer):
+    match_score = serializers.FloatField(read_only=True)
+
+    class Meta(RoommatePostSerializer.Meta):
+        fields = RoommatePostSerializer.Meta.fields + ['match_score']
+
+
 class RoommateRequestSerializer(serializers.ModelSerializer):
     sender = UserSerializer(read_only=True)
     receiver = serializers.PrimaryKeyRelatedField(queryset=User.objects.all())
@@ -64,28 +73,99 @@ class RoommateRequestSerializer(serializers.ModelSerializer):
                 pass
         return super().create(validated_data)
 
+GROUP_EXPANSIONS = ('members', 'listing', 'conversation')
+
+
+def group_expansions(request):
+    """Relations named in ?expand=members,listing,conversation (unknown names are ignored)."""
+    raw = request.query_params.get('expand', '') if request is not None else ''
+    return {name.strip() for name in raw.split(',')} & set(GROUP_EXPANSIONS)
+
+
+class GroupConversationSerializer(serializers.ModelSerializer):
+    """Group chat summary; last_message relies on the latest_messages prefetch of RoommateGroupViewSet."""
+    last_message = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Conversation
+        fields = ['id', 'twilio_sid', 'last_message', 'created_at', 'updated_at']
+        read_only_fields = fields
+
+    def get_last_message(self, obj):
+        latest = getattr(obj, 'latest_messages', None)
+        return InboxMessageSerializer(latest[0]).data if latest else None
+
+
 class RoommateGroupSerializer(serializers.ModelSerializer):
-    members = UserSerializer(many=True, read_only=True)
-    leader = UserSerializer(read_only=True)
-    listing = ListingSerializer(read_only=True)
-    conversation = ConversationSerializer(read_only=True)
+    """Compact members and listing and a conversation id unless expanded with ?expand=members,listing,conversation."""
+    members = UserCompactSerializer(many=True, read_only=True)
+    leader = UserCompactSerializer(read_only=True)
+    listing = ListingCompactSerializer(read_only=True)
+    conversation = serializers.PrimaryKeyRelatedField(read_only=True)
 
     class Meta:
         model = RoommateGroup
         fields = [
             'id', 'name', 'members', 'leader', 'listing', 'conversation', 'address',
-            'university', 'max_members', 'cost_per_member', 'female_only', 'status',
+            'university', 'max_members', 'member_count', 'cost_per_member', 'female_only', 'status',
             'created_at', 'updated_at'
         ]
-        read_only_fields = ['id', 'members', 'leader', 'cost_per_member', 'created_at', 'updated_at']
+        read_only_fields = ['id', 'members', 'leader', 'member_count', 'cost_per_member', 'created_at', 'updated_at']
+
+    def get_fields(self):
+        fields = super().get_fields()
+        expand = group_expansions(self.context.get('request'))
+        if 'members' in expand:
+            fields['members'] = UserSerializer(many=True, read_only=True)
+        if 'listing' in expand:
+            fields['listing'] = ListingSerializer(read_only=True)
+        if 'conversation' in expand:
+            fields['conversation'] = GroupConversationSerializer(read_only=True)
+        return fields
 
     def validate(self, data):
         if self.context['request'].user.role not in ['student', 'other']:
             raise serializers.ValidationError("Only students or others can create groups.")
         return data
 
+    def validate_max_members(self, value):
+        if self.instance is not None and value < self.instance.member_count:
+            raise serializers.ValidationError(f"The group already has {self.instance.member_count} members.")
+        return value
+
+    def update(self, instance, validated_data):
+        try:
+            with transaction.atomic():
+                return super().update(instance, validated_data)
+        except IntegrityError:
+            # Members joined after validate_max_members read the count
+            raise serializers.ValidationError({'max_members': "Cannot be lower than the current number of members."})
+
     def create(self, validated_data):
         validated_data['leader'] = self.context['request'].user
-        group = super().create(validated_data)
-        group.members.add(self.context['request'].user)
+        try:
+            with transaction.atomic():
+                group = super().create(validated_data)
+                RoommateMembership.join(group, [self.context['request'].user])
+        except IntegrityError:
+            raise serializers.ValidationError("You are already in a group.")
         return group
+
+
+class RoommateGroupDiscoverySerializer(serializers.ModelSerializer):
+    """Open group as shown to non-members: compact people and listing, no chat."""
+    members = UserCompactSerializer(many=True, read_only=True)
+    leader = UserCompactSerializer(read_only=True)
+    listing = ListingCompactSerializer(read_only=True)
+    open_seats = serializers.SerializerMethodField()
+
+    class Meta:
+        model = RoommateGroup
+        fields = [
+            'id', 'name', 'members', 'leader', 'listing', 'university', 'max_members', 'member_count',
+            'open_seats', 'cost_per_member', 'female_only', 'created_at'
+        ]
+        read_only_fields = fields
+
+    def get_open_seats(self, obj):
+        return obj.max_members - obj.member_count
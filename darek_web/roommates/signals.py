@@ -0,0 +1,63 @@
+from django.contrib.auth import get_user_model
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.db.models.signals import m2m_changed, post_save, pre_delete
+from django.dispatch import receiver
+from django.utils import timezone
+from listings.models import Listing
+from .models import ROOMMATE_ROLES, RoommateGroup, RoommateMembership, RoommatePost
+
+User = get_user_model()
+
+
+@receiver(post_save, sender=User)
+def sync_post_visibility(sender, instance, created, update_fields=None, **kwargs):
+    # Keep RoommatePost.is_visible in step with the author's role (e.g. a student turned landlord)
+    if created or (update_fields is not None and 'role' not in update_fields):
+        return
+    visible = instance.role in ROOMMATE_ROLES
+    # Bumping updated_at lets the matching index pick the change up on its next poll
+    RoommatePost.objects.filter(author=instance).exclude(is_visible=visible).update(
+        is_visible=visible, updated_at=timezone.now()
+    )
+
+
+@receiver(m2m_changed, sender=RoommateGroup.members.through)
+def sync_member_count(sender, instance, action, reverse, pk_set, **kwargs):
+    # group.members.add/remove/clear (and user.roommate_groups...) bypass RoommateMembership.join/leave
+    if action == 'pre_clear' and reverse:
+        instance._cleared_group_ids = list(instance.roommate_memberships.values_list('group_id', flat=True))
+        return
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        group_ids = [instance.pk]
+    elif action == 'post_clear':
+        group_ids = getattr(instance, '_cleared_group_ids', [])
+    else:
+        group_ids = list(pk_set)
+    if not group_ids:
+        return
+    # Recounted rather than offset by len(pk_set): pk_set may name users that were not members
+    count = Coalesce(Subquery(
+        RoommateMembership.objects.filter(group_id=OuterRef('pk'))
+        .values('group_id').annotate(total=Count('id')).values('total')
+    ), 0)
+    RoommateGroup.objects.filter(pk__in=group_ids).update(
+        member_count=count, cost_per_member=RoommateGroup.cost_per_member_expression(count)
+    )
+
+
+@receiver(post_save, sender=Listing)
+def sync_cost_per_member(sender, instance, created, update_fields=None, **kwargs):
+    if created or (update_fields is not None and 'price' not in update_fields):
+        return
+    RoommateGroup.objects.filter(listing=instance).update(
+        cost_per_member=RoommateGroup.cost_per_member_expression(F('member_count'))
+    )
+
+
+@receiver(pre_delete, sender=Listing)
+def clear_cost_per_member(sender, instance, **kwargs):
+    # The listing FK is SET_NULL, which bypasses RoommateGroup.save
+    RoommateGroup.objects.filter(listing=instance).update(cost_per_member=None)
@@ -1,10 +1,15 @@
 # roommates/tests.py
+from decimal import Decimal
 from django.test import TestCase
 from django.contrib.auth import get_user_model
 from rest_framework.test import APIRequestFactory, force_authenticate
-from .models import RoommatePost, RoommateRequest, RoommateGroup
-from .views import RoommatePostViewSet, RoommateRequestViewSet
+from .models import RoommatePost, RoommateRequest, RoommateGroup, RoommateMembership
+from .views import RoommatePostViewSet, RoommateRequestViewSet, RoommateGroupViewSet
+from listings.models import Listing, ListingImage
+from messaging.models import Conversation, Message
+from .matching import CandidateIndex
 from unittest.mock import patch
+from django.db import IntegrityError, transaction
 
 User = get_user_model()
 
@@ -23,18 +28,339 @@ class RoommatesTests(TestCase):
         self.assertEqual(response.status_code, 201)
         self.assertTrue(RoommatePost.objects.filter(author=self.student1).exists())
 
-    @patch('twilio.rest.Client')  # Mock for group convo creation
-    def test_accept_request(self, mock_client):
-        # Setup mock Twilio
-        mock_convo = mock_client.return_value.conversations.services.return_value.conversations.create.return_value
-        mock_convo.sid = 'CHtest'
-        mock_client.return_value.conversations.services.return_value.conversations.return_value.participants.create.return_value = None
-
-        req = RoommateRequest.objects.create(sender=self.student1, receiver=self.student2)
+    @patch('roommates.views.twilio_configured', return_value=True)
+    @patch('roommates.views.provision_conversation', return_value='CHgroup')
+    def test_accept_request(self, mock_provision, _configured):
+        post = RoommatePost.objects.create(author=self.student2, max_budget=1000, university='KSU')
+        req = RoommateRequest.objects.create(sender=self.student1, receiver=self.student2, post=post)
         request = self.factory.post(f'/roommates/requests/{req.id}/accept/')
         force_authenticate(request, user=self.student2)
         view = RoommateRequestViewSet.as_view({'post': 'accept'})
-        response = view(request, pk=req.id)
+        # Request lock, membership check, conversation + participants, group, memberships,
+        # post delete (load, unlink requests, delete), request update, and the savepoint pair
+        with self.captureOnCommitCallbacks() as callbacks, self.assertNumQueries(12):
+            response = view(request, pk=req.id)
         self.assertEqual(response.status_code, 200)
+        # Twilio is only called once the accept has committed
+        mock_provision.assert_not_called()
+        for callback in callbacks:
+            callback()
         self.assertEqual(RoommateRequest.objects.get(id=req.id).status, 'ACCEPTED')
-        self.assertTrue(RoommateGroup.objects.filter(members__in=[self.student1, self.student2]).exists())
\ No newline at end of file
+        group = RoommateGroup.objects.get(members=self.student1)
+        self.assertEqual((group.member_count, group.leader, group.university), (2, self.student2, 'KSU'))
+        self.assertEqual(group.conversation.twilio_sid, 'CHgroup')
+        self.assertEqual(set(group.conversation.participants.all()), {self.student1, self.student2})
+        self.assertFalse(RoommatePost.objects.filter(id=post.id).exists())
+
+        # A second accept involving either user is refused and writes nothing
+        student3 = User.objects.create_user(username='student3', email='s3@edu.sa', password='pass', role='student', gender='male')
+        req = RoommateRequest.objects.create(sender=student3, receiver=self.student2)
+        request = self.factory.post(f'/roommates/requests/{req.id}/accept/')
+        force_authenticate(request, user=self.student2)
+        response = view(request, pk=req.id)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(RoommateGroup.objects.count(), 1)
+        self.assertEqual(RoommateRequest.objects.get(id=req.id).status, 'PENDING')
+
+class RoommatePostFeedTests(TestCase):
+    def setUp(self):
+        self.viewer = User.objects.create_user(username='viewer', email='viewer@edu.sa', password='pass', role='student', gender='male')
+        self.authors = []
+        for i, budget in enumerate([800, 1200, 1500, 2500]):
+            author = User.objects.create_user(username=f'author{i}', email=f'author{i}@edu.sa', password='pass', role='student', gender='male')
+            RoommatePost.objects.create(author=author, max_budget=budget, university='KSU' if i % 2 else 'PNU', district='Al Malqa')
+            self.authors.append(author)
+        self.factory = APIRequestFactory()
+
+    def feed(self, **params):
+        request = self.factory.get('/roommates/posts/feed/', params)
+        force_authenticate(request, user=self.viewer)
+        return RoommatePostViewSet.as_view({'get': 'feed'})(request)
+
+    def test_feed_filters_paginates_and_hides_non_student_authors(self):
+        with self.assertNumQueries(1):
+            response = self.feed(min_budget=1000, max_budget=2000, page_size=1)
+        self.assertEqual([p['max_budget'] for p in response.data['results']], ['1500.00'])
+        self.assertIsNotNone(response.data['next'])
+        budgets = [p['max_budget'] for p in self.feed(university='KSU', district='Al Malqa').data['results']]
+        self.assertEqual(budgets, ['2500.00', '1200.00'])
+
+        self.authors[3].role = 'landlord'
+        self.authors[3].save()
+        budgets = [p['max_budget'] for p in self.feed().data['results']]
+        self.assertEqual(budgets, ['1500.00', '1200.00', '800.00'])
+
+
+class RoommateRequestInboxTests(TestCase):
+    def setUp(self):
+        self.me = User.objects.create_user(username='me', email='me@edu.sa', password='pass', role='student', gender='male')
+        self.factory = APIRequestFactory()
+        for i in range(3):
+            other = User.objects.create_user(username=f'peer{i}', email=f'peer{i}@edu.sa', password='pass', role='student', gender='male')
+            post = RoommatePost.objects.create(author=self.me, max_budget=1000 + i)
+            RoommateRequest.objects.create(sender=other, receiver=self.me, post=post)
+            RoommateRequest.objects.create(sender=self.me, receiver=other, status='ACCEPTED' if i else 'PENDING')
+
+    def inbox(self, box, **params):
+        request = self.factory.get(f'/roommates/requests/{box}/', params)
+        force_authenticate(request, user=self.me)
+        return RoommateRequestViewSet.as_view({'get': box})(request)
+
+    def test_incoming_and_outgoing_pages(self):
+        # Page (with sender, receiver and post author joined in) and the pending counts
+        with self.assertNumQueries(2):
+            response = self.inbox('incoming', page_size=2)
+        self.assertEqual(len(response.data['results']), 2)
+        self.assertIsNotNone(response.data['next'])
+        self.assertEqual(response.data['results'][0]['post']['author']['username'], 'me')
+        self.assertEqual(response.data['pending_counts'], {'incoming': 3, 'outgoing': 1})
+
+        response = self.inbox('outgoing', status='PENDING')
+        self.assertEqual([r['receiver'] for r in response.data['results']], [User.objects.get(username='peer0').id])
+
+
+class RoommateMembershipTests(TestCase):
+    def setUp(self):
+        self.leader = User.objects.create_user(username='leader', email='leader@edu.sa', password='pass', role='student', gender='male')
+        self.member = User.objects.create_user(username='member', email='member@edu.sa', password='pass', role='student', gender='male')
+        self.outsider = User.objects.create_user(username='outsider', email='outsider@edu.sa', password='pass', role='student', gender='male')
+        self.group = RoommateGroup.objects.create(name='pair', leader=self.leader, max_members=2)
+        RoommateMembership.join(self.group, [self.leader, self.member])
+        self.factory = APIRequestFactory()
+
+    def test_database_enforces_one_group_and_capacity(self):
+        self.group.refresh_from_db()
+        self.assertEqual(self.group.member_count, 2)
+        other = RoommateGroup.objects.create(name='other', leader=self.outsider, max_members=2)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            RoommateMembership.join(other, [self.member])
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            RoommateMembership.join(self.group, [self.outsider])
+
+        request = self.factory.post('/roommates/requests/', {'receiver': self.outsider.id})
+        force_authenticate(request, user=self.member)
+        response = RoommateRequestViewSet.as_view({'post': 'create'})(request)
+        self.assertEqual(response.status_code, 400)
+
+    def test_leave_and_kick_keep_count_and_leader(self):
+        request = self.factory.post(f'/roommates/groups/{self.group.id}/kick/', {'member_id': self.outsider.id})
+        force_authenticate(request, user=self.leader)
+        response = RoommateGroupViewSet.as_view({'post': 'kick'})(request, pk=self.group.id)
+        self.assertEqual(response.status_code, 404)
+
+        request = self.factory.post(f'/roommates/groups/{self.group.id}/leave/')
+        force_authenticate(request, user=self.leader)
+        response = RoommateGroupViewSet.as_view({'post': 'leave'})(request, pk=self.group.id)
+        self.assertEqual(response.status_code, 200)
+        self.group.refresh_from_db()
+        self.assertEqual((self.group.member_count, self.group.leader), (1, self.member))
+
+        request = self.factory.post(f'/roommates/groups/{self.group.id}/leave/')
+        force_authenticate(request, user=self.member)
+        RoommateGroupViewSet.as_view({'post': 'leave'})(request, pk=self.group.id)
+        self.assertFalse(RoommateGroup.objects.filter(id=self.group.id).exists())
+        self.assertFalse(RoommateMembership.objects.exists())
+
+
+class RoommateGroupSerializationTests(TestCase):
+    def setUp(self):
+        self.leader = User.objects.create_user(username='lead', email='lead@edu.sa', password='pass', role='student', gender='male')
+        self.member = User.objects.create_user(username='mate', email='mate@edu.sa', password='pass', role='student', gender='male')
+        owner = User.objects.create_user(username='owner', email='owner@x.sa', password='pass', role='landlord', gender='male')
+        listing = Listing.objects.create(
+            owner=owner, id_type='National_ID', owner_identification_id='0000000000',
+            deed_number='0000000000', title='Flat', price=3000, type='APARTMENT',
+            status='AVAILABLE', district='AL_OLAYA', location_link='https://maps.example.com/x',
+        )
+        for i in range(3):
+            ListingImage.objects.create(listing=listing, image=f'listings/{i}.jpg', is_primary=i == 0)
+        self.convo = convo = Conversation.objects.create()
+        convo.participants.add(self.leader, self.member)
+        Message.objects.create(conversation=convo, sender=self.member, content='first')
+        self.last = Message.objects.create(conversation=convo, sender=self.leader, content='hello')
+        group = RoommateGroup.objects.create(name='pair', leader=self.leader, max_members=2, listing=listing, conversation=convo)
+        RoommateMembership.join(group, [self.leader, self.member])
+        self.factory = APIRequestFactory()
+
+    def groups(self, **params):
+        request = self.factory.get('/roommates/groups/', params)
+        force_authenticate(request, user=self.member)
+        return RoommateGroupViewSet.as_view({'get': 'list'})(request)
+
+    def test_compact_by_default_and_expandable_in_fixed_queries(self):
+        # Groups with leader/listing owner/conversation joined, members, listing images
+        with self.assertNumQueries(3):
+            group = self.groups().data[0]
+        self.assertEqual(set(group['listing']), {'id', 'title', 'district', 'primary_image'})
+        self.assertEqual(str(group['conversation']), str(self.convo.id))
+        self.assertEqual(group['leader']['username'], 'lead')
+        self.assertTrue(group['members'])
+        self.assertNotIn('email', group['members'][0])
+
+        # ... plus the latest message of each group chat
+        with self.assertNumQueries(4):
+            group = self.groups(expand='listing,conversation').data[0]
+        self.assertEqual(len(group['listing']['images']), 3)
+        self.assertEqual(group['listing']['owner_details']['username'], 'owner')
+        self.assertEqual(group['conversation']['last_message']['id'], str(self.last.id))
+
+        with self.assertNumQueries(3):
+            group = self.groups(expand='members').data[0]
+        self.assertIn('email', group['members'][0])
+
+
+class RoommateGroupCostTests(TestCase):
+    def setUp(self):
+        self.users = [
+            User.objects.create_user(username=f'payer{i}', email=f'payer{i}@edu.sa', password='pass', role='student', gender='male')
+            for i in range(3)
+        ]
+        owner = User.objects.create_user(username='landlord', email='landlord@x.sa', password='pass', role='landlord', gender='male')
+        self.listing = Listing.objects.create(
+            owner=owner, id_type='National_ID', owner_identification_id='0000000000',
+            deed_number='0000000000', title='Flat', price=1000, type='APARTMENT',
+            status='AVAILABLE', district='AL_OLAYA', location_link='https://maps.example.com/x',
+        )
+        self.group = RoommateGroup.objects.create(name='trio', leader=self.users[0], max_members=4, listing=self.listing)
+
+    def stored(self):
+        self.group.refresh_from_db()
+        return self.group.member_count, self.group.cost_per_member
+
+    def test_count_and_cost_follow_members_and_price(self):
+        # Insert and count update inside one savepoint
+        with self.assertNumQueries(4):
+            RoommateMembership.join(self.group, self.users[:2])
+        self.assertEqual(self.stored(), (2, Decimal('500.00')))
+
+        self.group.members.add(self.users[2])
+        self.assertEqual(self.stored(), (3, Decimal('333.33')))
+        self.users[1].roommate_groups.clear()
+        self.assertEqual(self.stored(), (2, Decimal('500.00')))
+
+        self.listing.price = 1500
+        self.listing.save()
+        self.assertEqual(self.stored(), (2, Decimal('750.00')))
+
+        # A stale copy (another member left meanwhile) still ends up with the stored count
+        stale = RoommateGroup.objects.get(pk=self.group.pk)
+        RoommateMembership.leave(self.group, [self.users[0].id])
+        RoommateMembership.leave(stale, [self.users[2].id])
+        self.assertEqual(stale.member_count, 0)
+        self.assertEqual(self.stored(), (0, None))
+
+        RoommateMembership.join(self.group, [self.users[0]])
+        self.listing.delete()
+        self.assertEqual(self.stored(), (1, None))
+
+    def test_full_save_and_patch_do_not_write_a_stale_member_count(self):
+        stale = RoommateGroup.objects.get(pk=self.group.pk)
+        RoommateMembership.join(self.group, self.users)
+        stale.name = 'renamed'
+        stale.save()
+        self.assertEqual((stale.member_count, stale.cost_per_member), (3, Decimal('333.33')))
+        self.assertEqual(self.stored(), (3, Decimal('333.33')))
+
+        view = RoommateGroupViewSet.as_view({'patch': 'partial_update'})
+        request = APIRequestFactory().patch(f'/roommates/groups/{self.group.pk}/', {'max_members': 2}, format='json')
+        force_authenticate(request, user=self.users[0])
+        response = view(request, pk=self.group.pk)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('max_members', response.data)
+        self.group.refresh_from_db()
+        self.assertEqual(self.group.max_members, 4)
+
+
+class RoommateGroupDiscoveryTests(TestCase):
+    def setUp(self):
+        self.seeker = User.objects.create_user(username='looking', email='looking@edu.sa', password='pass', role='student', gender='male')
+        self.groups = {}
+        specs = [
+            ('ksu-cheap', 'KSU', 3, 1, False, 'OPEN'),
+            ('ksu-full', 'KSU', 2, 2, False, 'OPEN'),
+            ('ksu-women', 'KSU', 3, 1, True, 'OPEN'),
+            ('ksu-closed', 'KSU', 3, 1, False, 'CLOSED'),
+            ('pnu-open', 'PNU', 4, 2, False, 'OPEN'),
+        ]
+        for name, university, max_members, members, female_only, group_status in specs:
+            group = RoommateGroup.objects.create(
+                name=name, university=university, max_members=max_members, female_only=female_only, status=group_status,
+            )
+            users = [
+                User.objects.create_user(username=f'{name[:12]}{i}', email=f'{name}{i}@edu.sa', password='pass', role='student', gender='female' if female_only else 'male')
+                for i in range(members)
+            ]
+            RoommateMembership.join(group, users)
+            # Costs as maintained from a listing price, without creating listings here
+            RoommateGroup.objects.filter(pk=group.pk).update(cost_per_member=1200 if university == 'KSU' else 2000)
+            self.groups[name] = group
+        self.factory = APIRequestFactory()
+
+    def discover(self, **params):
+        request = self.factory.get('/roommates/groups/discover/', params)
+        force_authenticate(request, user=self.seeker)
+        return RoommateGroupViewSet.as_view({'get': 'discover'})(request)
+
+    def test_lists_open_groups_with_seats(self):
+        # Groups page and members (plus listing images once groups have listings)
+        with self.assertNumQueries(2):
+            response = self.discover()
+        self.assertEqual([g['name'] for g in response.data['results']], ['pnu-open', 'ksu-cheap'])
+        self.assertEqual(response.data['results'][0]['open_seats'], 2)
+        self.assertNotIn('email', response.data['results'][0]['members'][0])
+
+        names = [g['name'] for g in self.discover(university='KSU', max_cost=1500).data['results']]
+        self.assertEqual(names, ['ksu-cheap'])
+        self.assertEqual(self.discover(min_cost='cheap').status_code, 400)
+
+        # Members don't discover their own group
+        RoommateMembership.join(self.groups['pnu-open'], [self.seeker])
+        names = [g['name'] for g in self.discover().data['results']]
+        self.assertEqual(names, ['ksu-cheap'])
+
+
+class RoommateMatchingTests(TestCase):
+    def setUp(self):
+        index_patch = patch('roommates.matching._index', CandidateIndex())
+        index_patch.start()
+        self.addCleanup(index_patch.stop)
+        self.seeker = User.objects.create_user(username='seeker', email='seeker@edu.sa', password='pass', role='student', gender='male')
+        self.close = User.objects.create_user(username='close', email='close@edu.sa', password='pass', role='student', gender='male')
+        self.far = User.objects.create_user(username='far', email='far@edu.sa', password='pass', role='student', gender='male')
+        self.woman = User.objects.create_user(username='woman', email='woman@edu.sa', password='pass', role='student', gender='female')
+        RoommatePost.objects.create(author=self.seeker, max_budget=1000, university='KSU', district='Al Malqa', preferred_type='APARTMENT')
+        self.close_post = RoommatePost.objects.create(author=self.close, max_budget=1100, university=' ksu', district='Al Malqa', preferred_type='APARTMENT')
+        self.far_post = RoommatePost.objects.create(author=self.far, max_budget=3000, university='PNU', district='Al Olaya', preferred_type='STUDIO')
+        RoommatePost.objects.create(author=self.woman, max_budget=1000, university='KSU', female_only=True)
+        self.factory = APIRequestFactory()
+        self.view = RoommatePostViewSet.as_view({'get': 'matches'})
+
+    def matches(self, **params):
+        request = self.factory.get('/roommates/posts/matches/', params)
+        force_authenticate(request, user=self.seeker)
+        response = self.view(request)
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_ranks_by_compatibility_and_respects_gender(self):
+        data = self.matches()
+        self.assertEqual([m['id'] for m in data], [str(self.close_post.id), str(self.far_post.id)])
+        self.assertGreater(data[0]['match_score'], 0.9)
+        self.assertLess(data[1]['match_score'], 0.3)
+        # Query params override the caller's own post
+        data = self.matches(university='PNU', district='Al Olaya', preferred_type='STUDIO', max_budget=3000)
+        self.assertEqual(data[0]['id'], str(self.far_post.id))
+
+    def test_index_refreshes_only_changed_posts(self):
+        self.matches()
+        self.far_post.max_budget = 1000
+        self.far_post.university = 'KSU'
+        self.far_post.district = 'Al Malqa'
+        self.far_post.preferred_type = 'APARTMENT'
+        self.far_post.save()
+        self.close_post.delete()
+        # Caller's post, the two changed posts, the page itself
+        with self.assertNumQueries(3):
+            data = self.matches()
+        self.assertEqual([m['id'] for m in data], [str(self.far_post.id)])
+        self.assertEqual(data[0]['match_score'], 1.0)
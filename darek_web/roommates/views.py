@@ -3,23 +3,71 @@ from rest_framework import viewsets, status
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.decorators import action
+from rest_framework.pagination import CursorPagination
+from django.core.exceptions import ValidationError
+from django_filters import rest_framework as filters
 from django_filters.rest_framework import DjangoFilterBackend
-from .models import RoommatePost, RoommateRequest, RoommateGroup
-from .serializers import RoommatePostSerializer, RoommateRequestSerializer, RoommateGroupSerializer
-from twilio.rest import Client
-from django.conf import settings
-from messaging.models import Conversation
-from django.db.models import Count
+from .models import RoommatePost, RoommateRequest, RoommateGroup, RoommateMembership
+from .serializers import (
+    RoommatePostSerializer, RoommateRequestSerializer, RoommateGroupSerializer, RoommateMatchSerializer,
+    RoommateGroupDiscoverySerializer, group_expansions,
+)
+from .matching import match_posts
+from messaging.twilio_client import twilio_configured, twilio_identity_for_user
+from messaging.provisioning import provision_conversation, discard_sid
+from messaging.models import Conversation, Message
+from messaging.realtime import publish_conversation_created
+from users.models import User
+from users.serializers import UserCompactSerializer
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Prefetch, Q, Window
+from django.db.models.functions import RowNumber
+from django.http import Http404
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def provision_group_chat(conversation_id, name, identities):
+    """Attach a Twilio conversation to a committed group chat; it stays local-only if Twilio fails."""
+    if not twilio_configured():
+        return
+    try:
+        sid = provision_conversation(name, identities)
+    except Exception as e:
+        if getattr(e, 'sid', None):
+            discard_sid(e.sid)
+        logger.warning("Could not provision Twilio chat for conversation %s", conversation_id, exc_info=True)
+        return
+    Conversation.objects.filter(pk=conversation_id, twilio_sid__isnull=True).update(twilio_sid=sid)
+
+
+class RoommatePostFilter(filters.FilterSet):
+    min_budget = filters.NumberFilter(field_name='max_budget', lookup_expr='gte')
+    max_budget = filters.NumberFilter(field_name='max_budget', lookup_expr='lte')
+
+    class Meta:
+        model = RoommatePost
+        fields = ['female_only', 'university', 'district', 'preferred_type', 'min_budget', 'max_budget']
+
+
+class RoommatePostCursorPagination(CursorPagination):
+    ordering = ('-created_at', '-id')
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
 
 class RoommatePostViewSet(viewsets.ModelViewSet):
     queryset = RoommatePost.objects.all()
     serializer_class = RoommatePostSerializer
     permission_classes = [IsAuthenticated]
     filter_backends = [DjangoFilterBackend]
-    filterset_fields = ['female_only', 'university', 'district', 'preferred_type']
+    filterset_class = RoommatePostFilter
 
     def get_queryset(self):
-        return self.queryset.filter(author__role__in=['student', 'other'])
+        # is_visible mirrors the author's role, so listing needs no join on users to filter
+        return self.queryset.filter(is_visible=True).select_related('author')
 
     def perform_create(self, serializer):
         serializer.save(author=self.request.user)
@@ -30,6 +78,34 @@ class RoommatePostViewSet(viewsets.ModelViewSet):
             return Response({'error': 'Only the author can delete this post.'}, status=status.HTTP_403_FORBIDDEN)
         return super().destroy(request, *args, **kwargs)
 
+    @action(detail=False, methods=['get'])
+    def feed(self, request):
+        # Newest first; filters as on the list, backed by the partial rmpost_* indexes
+        paginator = RoommatePostCursorPagination()
+        page = paginator.paginate_queryset(self.filter_queryset(self.get_queryset()), request, view=self)
+        return paginator.get_paginated_response(self.get_serializer(page, many=True).data)
+
+    @action(detail=False, methods=['get'])
+    def matches(self, request):
+        # Preferences default to the caller's latest post; query params override them
+        try:
+            limit = min(int(request.query_params.get('limit', 20)), 100)
+            if request.query_params.get('max_budget'):
+                float(request.query_params['max_budget'])
+        except ValueError:
+            return Response({'error': 'limit and max_budget must be numbers.'}, status=status.HTTP_400_BAD_REQUEST)
+        if limit < 1:
+            return Response({'error': 'limit must be positive.'}, status=status.HTTP_400_BAD_REQUEST)
+        posts = match_posts(request.user, request.query_params, limit)
+        return Response(RoommateMatchSerializer(posts, many=True, context={'request': request}).data)
+
+class RoommateRequestCursorPagination(CursorPagination):
+    ordering = ('-created_at', '-id')
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+
 class RoommateRequestViewSet(viewsets.ModelViewSet):
     queryset = RoommateRequest.objects.all()
     serializer_class = RoommateRequestSerializer
@@ -39,11 +115,38 @@ class RoommateRequestViewSet(viewsets.ModelViewSet):
         # Receiver should not see rejected requests; sender sees all (including rejected)
         receiver_qs = self.queryset.filter(receiver=self.request.user).exclude(status='REJECTED')
         sender_qs = self.queryset.filter(sender=self.request.user)
-        return receiver_qs | sender_qs
+        return (receiver_qs | sender_qs).select_related('sender', 'receiver', 'post__author')
+
+    def _inbox(self, request, queryset):
+        # ?status=PENDING keeps the page on the (user, status, created_at) index range
+        if request.query_params.get('status'):
+            queryset = queryset.filter(status=request.query_params['status'])
+        paginator = RoommateRequestCursorPagination()
+        page = paginator.paginate_queryset(
+            queryset.select_related('sender', 'receiver', 'post__author'), request, view=self
+        )
+        response = paginator.get_paginated_response(self.get_serializer(page, many=True).data)
+        response.data['pending_counts'] = RoommateRequest.objects.filter(
+            Q(receiver=request.user) | Q(sender=request.user), status=RoommateRequest.Status.PENDING
+        ).aggregate(
+            incoming=Count('id', filter=Q(receiver=request.user)),
+            outgoing=Count('id', filter=Q(sender=request.user)),
+        )
+        return response
+
+    @action(detail=False, methods=['get'])
+    def incoming(self, request):
+        return self._inbox(
+            request, RoommateRequest.objects.filter(receiver=request.user).exclude(status=RoommateRequest.Status.REJECTED)
+        )
+
+    @action(detail=False, methods=['get'])
+    def outgoing(self, request):
+        return self._inbox(request, RoommateRequest.objects.filter(sender=request.user))
 
     def create(self, request, *args, **kwargs):
         # Prevent sending requests if the user is already in a group
-        if RoommateGroup.objects.filter(members=request.user).exists():
+        if RoommateMembership.objects.filter(user=request.user).exists():
             return Response(
                 {'error': 'You are already in a group and cannot send requests.'},
                 status=status.HTTP_400_BAD_REQUEST
@@ -52,15 +155,16 @@ class RoommateRequestViewSet(viewsets.ModelViewSet):
         post_id = request.data.get('post')
         if post_id:
             try:
-                post = RoommatePost.objects.get(id=post_id)
-                author_in_full_group = RoommateGroup.objects.filter(members=post.author).annotate(member_count=Count('members')).filter(member_count__gte=2).exists()
-                if author_in_full_group:
-                    return Response(
-                        {'error': 'This post author is already in a full group. You cannot send a request to this post.'},
-                        status=status.HTTP_400_BAD_REQUEST
-                    )
-            except RoommatePost.DoesNotExist:
-                pass
+                author_in_full_group = RoommateMembership.objects.filter(
+                    user__roommate_posts__id=post_id, group__member_count__gte=2
+                ).exists()
+            except ValidationError:
+                author_in_full_group = False
+            if author_in_full_group:
+                return Response(
+                    {'error': 'This post author is already in a full group. You cannot send a request to this post.'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
         return super().create(request, *args, **kwargs)
 
     def perform_create(self, serializer):
@@ -68,76 +172,59 @@ class RoommateRequestViewSet(viewsets.ModelViewSet):
 
     @action(detail=True, methods=['post'])
     def accept(self, request, pk=None):
-        req = self.get_object()
-        if req.status != 'PENDING':
-            return Response({'error': 'Request not pending'}, status=status.HTTP_400_BAD_REQUEST)
-        if req.receiver != request.user:
-            return Response({'error': 'Only receiver can accept'}, status=status.HTTP_403_FORBIDDEN)
+        # Everything the accept writes commits together; the Twilio chat is provisioned after commit
+        try:
+            with transaction.atomic():
+                req = (
+                    self.get_queryset().select_for_update(of=('self',))
+                    .select_related('sender', 'receiver', 'post').filter(pk=pk).first()
+                )
+                if req is None:
+                    raise Http404
+                if req.status != 'PENDING':
+                    return Response({'error': 'Request not pending'}, status=status.HTTP_400_BAD_REQUEST)
+                if req.receiver_id != request.user.id:
+                    return Response({'error': 'Only receiver can accept'}, status=status.HTTP_403_FORBIDDEN)
+
+                members = [req.sender, req.receiver]
+                # Enforce single-group membership: neither sender nor receiver can already be in a group
+                if RoommateMembership.objects.filter(user_id__in=[req.sender_id, req.receiver_id]).exists():
+                    return Response(
+                        {'error': 'Either sender or receiver is already in a group.'},
+                        status=status.HTTP_400_BAD_REQUEST
+                    )
 
-        # Enforce single-group membership: neither sender nor receiver can already be in a group
-        if RoommateGroup.objects.filter(members=req.sender).exists() or RoommateGroup.objects.filter(members=req.receiver).exists():
+                convo = Conversation.objects.create(twilio_sid=None)
+                Conversation.participants.through.objects.bulk_create([
+                    Conversation.participants.through(conversation_id=convo.id, user_id=member.id) for member in members
+                ])
+                # Groups formed by accepting a request are two-member groups, full from the start
+                group = RoommateGroup.objects.create(
+                    name=f"Group of {req.receiver.username} and {req.sender.username}",
+                    leader=req.receiver,
+                    max_members=2,
+                    member_count=len(members),
+                    university=req.post.university if req.post else None,
+                    female_only=req.post.female_only if req.post else False,
+                    conversation=convo,
+                )
+                RoommateMembership.objects.bulk_create([RoommateMembership(group=group, user=member) for member in members])
+
+                # The group is full, so the post (if any) no longer takes requests
+                if req.post_id:
+                    RoommatePost.objects.filter(pk=req.post_id).delete()
+                RoommateRequest.objects.filter(pk=req.pk).update(status=RoommateRequest.Status.ACCEPTED)
+
+                identities = [twilio_identity_for_user(member) for member in members]
+                transaction.on_commit(lambda: provision_group_chat(convo.id, group.name, identities))
+                publish_conversation_created(convo.id, [member.id for member in members])
+        except IntegrityError:
+            # The membership constraints reject a concurrent accept that got either user first
             return Response(
                 {'error': 'Either sender or receiver is already in a group.'},
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        req.status = 'ACCEPTED'
-        req.save()
-
-        # Create or update group
-        group, created = RoommateGroup.objects.get_or_create(
-            leader=req.receiver,
-            defaults={'name': f"Group of {req.receiver.username} and {req.sender.username}"}
-        )
-        # Enforce 2-member groups; do not allow adding beyond 2
-        if group.members.count() >= 2:
-            return Response({'error': 'Group is already full.'}, status=status.HTTP_400_BAD_REQUEST)
-        group.members.add(req.sender, req.receiver)
-        if req.post:
-            group.university = req.post.university
-            group.female_only = req.post.female_only
-        # Ensure max_members reflects the two-member rule
-        if group.max_members != 2:
-            group.max_members = 2
-
-        # Create group conversation if none, with Twilio fallback
-        if not group.conversation:
-            convo = None
-            try:
-                if not all([
-                    settings.TWILIO_ACCOUNT_SID,
-                    settings.TWILIO_AUTH_TOKEN,
-                    settings.TWILIO_CONVERSATIONS_SERVICE_SID,
-                ]):
-                    raise RuntimeError("Twilio not configured")
-                client = Client(settings.TWILIO_ACCOUNT_SID, settings.TWILIO_AUTH_TOKEN)
-                twilio_convo = client.conversations.services(settings.TWILIO_CONVERSATIONS_SERVICE_SID).conversations.create(
-                    friendly_name=group.name
-                )
-                for member in group.members.all():
-                    client.conversations.services(settings.TWILIO_CONVERSATIONS_SERVICE_SID).conversations(twilio_convo.sid).participants.create(
-                        identity=str(member.id)
-                    )
-                convo = Conversation.objects.create(twilio_sid=twilio_convo.sid)
-            except Exception:
-                convo = Conversation.objects.create(twilio_sid=None)
-            convo.participants.add(*group.members.all())
-            group.conversation = convo
-            group.save()
-
-        # If group now has two members, delete the associated post (if any) to avoid further requests
-        if group.members.count() >= 2 and req.post:
-            try:
-                req.post.delete()
-            except Exception:
-                pass
-
-        # Delete the original request after successful acceptance to prevent stale entries
-        try:
-            req.delete()
-        except Exception:
-            pass
-
         return Response({'success': 'Request accepted, added to group'}, status=status.HTTP_200_OK)
 
     @action(detail=True, methods=['post'])
@@ -162,48 +249,115 @@ class RoommateRequestViewSet(viewsets.ModelViewSet):
             return Response({'error': 'Only the sender can delete this request.'}, status=status.HTTP_403_FORBIDDEN)
         return super().destroy(request, *args, **kwargs)
 
+class RoommateGroupDiscoveryFilter(filters.FilterSet):
+    min_cost = filters.NumberFilter(field_name='cost_per_member', lookup_expr='gte')
+    max_cost = filters.NumberFilter(field_name='cost_per_member', lookup_expr='lte')
+
+    class Meta:
+        model = RoommateGroup
+        fields = ['university', 'female_only', 'min_cost', 'max_cost']
+
+
+class RoommateGroupCursorPagination(CursorPagination):
+    ordering = ('-created_at', '-id')
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+
 class RoommateGroupViewSet(viewsets.ModelViewSet):
     queryset = RoommateGroup.objects.all()
     serializer_class = RoommateGroupSerializer
     permission_classes = [IsAuthenticated]
 
     def get_queryset(self):
-        return self.queryset.filter(members=self.request.user)
+        # Fixed number of queries per page: groups (leader, listing owner, conversation joined),
+        # members, listing images, plus the latest group messages when the conversation is expanded
+        queryset = self.queryset.filter(members=self.request.user)
+        if self.action not in ('list', 'retrieve'):
+            return queryset
+        expand = group_expansions(self.request)
+        members = User.objects.all() if 'members' in expand else User.objects.only(*UserCompactSerializer.Meta.fields)
+        queryset = (
+            queryset.select_related('leader', 'listing__owner', 'conversation')
+            .prefetch_related(Prefetch('members', queryset=members), 'listing__images')
+        )
+        if 'conversation' in expand:
+            latest_messages = (
+                Message.objects.select_related('sender')
+                .annotate(row=Window(
+                    RowNumber(),
+                    partition_by=F('conversation'),
+                    order_by=[F('created_at').desc(), F('id').desc()],
+                ))
+                .filter(row=1)
+            )
+            queryset = queryset.prefetch_related(
+                Prefetch('conversation__messages', queryset=latest_messages, to_attr='latest_messages')
+            )
+        return queryset
 
     def perform_create(self, serializer):
         serializer.save(leader=self.request.user)
 
+    @action(detail=False, methods=['get'])
+    def discover(self, request):
+        # Open groups with a free seat, read off the partial rmgroup_open_* indexes through the stored
+        # member_count; memberships are only touched for the caller's own group (one unique-index row)
+        # and to prefetch the members of the page
+        queryset = RoommateGroup.objects.filter(
+            status=RoommateGroup.Status.OPEN, member_count__lt=F('max_members')
+        ).exclude(pk__in=RoommateMembership.objects.filter(user=request.user).values('group_id'))
+        if request.user.gender != 'female':
+            queryset = queryset.filter(female_only=False)
+        filterset = RoommateGroupDiscoveryFilter(request.query_params, queryset=queryset, request=request)
+        if not filterset.is_valid():
+            return Response(filterset.errors, status=status.HTTP_400_BAD_REQUEST)
+        paginator = RoommateGroupCursorPagination()
+        page = paginator.paginate_queryset(
+            filterset.qs.select_related('leader', 'listing').prefetch_related('members', 'listing__images'),
+            request, view=self,
+        )
+        data = RoommateGroupDiscoverySerializer(page, many=True, context={'request': request}).data
+        return paginator.get_paginated_response(data)
+
+    def get_locked_group(self):
+        """The requested group, row-locked until the surrounding transaction ends."""
+        group = self.get_object()
+        try:
+            return RoommateGroup.objects.select_for_update().get(pk=group.pk)
+        except RoommateGroup.DoesNotExist:
+            # Deleted by a concurrent leave while we waited for the lock
+            raise Http404
+
     @action(detail=True, methods=['post'])
+    @transaction.atomic
     def leave(self, request, pk=None):
-        group = self.get_object()
-        members_before = list(group.members.all())
+        # Locked so concurrent leaves see each other's effect on the members and the stored count
+        group = self.get_locked_group()
+        members_before = list(group.memberships.values_list('user_id', flat=True))
         # User must be a member to leave
-        if not group.members.filter(id=request.user.id).exists():
+        if not RoommateMembership.leave(group, [request.user.id]):
             return Response({'error': 'You are not a member of this group.'}, status=status.HTTP_403_FORBIDDEN)
 
-        group.members.remove(request.user)
-
         # If no members remain, delete the group
-        if group.members.count() == 0:
+        if group.member_count == 0:
             # Cascade delete any requests between previous group members
-            try:
-                RoommateRequest.objects.filter(sender__in=members_before, receiver__in=members_before).delete()
-            except Exception:
-                pass
+            RoommateRequest.objects.filter(sender__in=members_before, receiver__in=members_before).delete()
             group.delete()
             return Response({'success': 'You left the group. Group deleted.'}, status=status.HTTP_200_OK)
 
-        # If leader left, keep remaining member as leader
-        if group.leader == request.user:
-            remaining = group.members.first()
-            group.leader = remaining
+        # If leader left, the longest-standing remaining member leads
+        if group.leader_id == request.user.id:
+            group.leader_id = group.memberships.order_by('joined_at', 'id').values_list('user_id', flat=True).first()
             group.save(update_fields=['leader'])
 
         return Response({'success': 'You left the group.'}, status=status.HTTP_200_OK)
 
     @action(detail=True, methods=['post'])
+    @transaction.atomic
     def kick(self, request, pk=None):
-        group = self.get_object()
+        group = self.get_locked_group()
         # Only leader can kick
         if group.leader != request.user:
             return Response({'error': 'Only the group leader can kick members.'}, status=status.HTTP_403_FORBIDDEN)
@@ -217,20 +371,18 @@ class RoommateGroupViewSet(viewsets.ModelViewSet):
         except (TypeError, ValueError):
             return Response({'error': 'Invalid member_id.'}, status=status.HTTP_400_BAD_REQUEST)
 
-        if not group.members.filter(id=member_id_int).exists():
-            return Response({'error': 'User is not a member of this group.'}, status=status.HTTP_404_NOT_FOUND)
-
         # Prevent leader from kicking themselves via this endpoint
         if group.leader_id == member_id_int:
             return Response({'error': 'Leader cannot kick themselves. Use leave instead.'}, status=status.HTTP_400_BAD_REQUEST)
 
-        group.members.remove(member_id_int)
+        if not RoommateMembership.leave(group, [member_id_int]):
+            return Response({'error': 'User is not a member of this group.'}, status=status.HTTP_404_NOT_FOUND)
 
         return Response({'success': 'Member kicked from the group.'}, status=status.HTTP_200_OK)
 
     def destroy(self, request, *args, **kwargs):
         group = self.get_object()
-        members_before = list(group.members.all())
+        members_before = list(group.memberships.values_list('user_id', flat=True))
         response = super().destroy(request, *args, **kwargs)
         # Cascade delete any requests between former members when the group is deleted
         try:
@@ -118,3 +118,12 @@ class UserSerializer(serializers.ModelSerializer):
             # Convert to local timezone (from settings.TIME_ZONE = 'Asia/Riyadh')
             return obj.last_login.astimezone(timezone.get_current_timezone())
         return None
+
+
+# Slim public projection for embedding users in lists (participants, senders, members).
+class UserCompactSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = User
+        fields = ("id", "username", "first_name", "last_name", "role", "gender", "avatar_url", "avatar")
+        read_only_fields = fields
+
@@ -21,9 +21,12 @@ import {
 } from "lucide-react";
 import { ImageWithFallback } from "./figma/ImageWithFallback";
 import { districtOptions as fetchDistrictOptions } from "../services/listings";
-import type { Review } from "../services/reviews";
+import type { RatingAggregate, Review } from "../services/reviews";
 import {
   listReviews,
+  listMoreReviews,
+  getMyReview,
+  getRatings,
   createReview,
   updateReview,
   deleteReview,
@@ -61,7 +64,16 @@ export function ListingDetails({ propertyId, onNavigate }: ListingDetailsProps)
     { value: string; label: string }[]
   >([]);
   const [reviews, setReviews] = useState<Review[]>([]);
-  const [ownerReviews, setOwnerReviews] = useState<Review[]>([]);
+  const [reviewsNext, setReviewsNext] = useState<string | null>(null);
+  const [myReview, setMyReview] = useState<Review | null>(null);
+  const [listingRating, setListingRating] = useState<RatingAggregate>({
+    average: null,
+    count: 0,
+  });
+  const [ownerRating, setOwnerRating] = useState<RatingAggregate>({
+    average: null,
+    count: 0,
+  });
   const [me, setMe] = useState<User | null>(null);
   const [loading, setLoading] = useState(true);
   const [showOwnerProfile, setShowOwnerProfile] = useState(false);
@@ -97,30 +109,52 @@ export function ListingDetails({ propertyId, onNavigate }: ListingDetailsProps)
     (async () => {
       try {
         if (!propertyId) return;
-        const list = await listReviews({
+        const page = await listReviews({
           target_type: "LISTING",
           target_id: propertyId,
         });
-        setReviews(Array.isArray(list) ? list : []);
+        setReviews(page.results);
+        setReviewsNext(page.next);
       } catch (_) {}
     })();
   }, [propertyId]);
 
-  // Fetch reviews for the landlord (owner) to display accurate stats
+  async function loadMoreReviews() {
+    if (!reviewsNext) return;
+    try {
+      const page = await listMoreReviews(reviewsNext);
+      setReviews((prev) => [
+        ...prev,
+        ...page.results.filter((r) => !prev.some((p) => p.id === r.id)),
+      ]);
+      setReviewsNext(page.next);
+    } catch (_) {}
+  }
+
+  // Counts and averages for the listing and its landlord come from the review summaries,
+  // not from the loaded page of reviews
+  const ownerId = (data?.owner_details?.id as any) ?? (data?.owner as any);
+  async function loadRatings() {
+    if (!propertyId) return;
+    try {
+      const ratings = await getRatings({
+        listings: [String(propertyId)],
+        users: ownerId ? [ownerId] : [],
+      });
+      setListingRating(
+        ratings.listings[String(propertyId)] ?? { average: null, count: 0 }
+      );
+      if (ownerId) {
+        setOwnerRating(
+          ratings.users[String(ownerId)] ?? { average: null, count: 0 }
+        );
+      }
+    } catch (_) {}
+  }
+
   useEffect(() => {
-    (async () => {
-      try {
-        const ownerId =
-          (data?.owner_details?.id as any) ?? (data?.owner as any);
-        if (!ownerId) return;
-        const list = await listReviews({
-          target_type: "USER",
-          target_id: ownerId,
-        });
-        setOwnerReviews(Array.isArray(list) ? list : []);
-      } catch (_) {}
-    })();
-  }, [data]);
+    loadRatings();
+  }, [propertyId, ownerId]);
 
   useEffect(() => {
     (async () => {
@@ -133,10 +167,21 @@ export function ListingDetails({ propertyId, onNavigate }: ListingDetailsProps)
     })();
   }, []);
 
-  const myReview = useMemo(() => {
-    if (!me) return null;
-    return reviews.find((r) => (r.author?.id ?? null) === me.id) || null;
-  }, [reviews, me]);
+  useEffect(() => {
+    (async () => {
+      try {
+        if (!me || !propertyId) {
+          setMyReview(null);
+          return;
+        }
+        setMyReview(
+          await getMyReview({ target_type: "LISTING", target_id: propertyId })
+        );
+      } catch (_) {
+        setMyReview(null);
+      }
+    })();
+  }, [me, propertyId]);
 
   const [isEditingReview, setIsEditingReview] = useState(false);
 
@@ -239,6 +284,7 @@ export function ListingDetails({ propertyId, onNavigate }: ListingDetailsProps)
           rating: reviewRating,
           comment: reviewComment,
         });
+        setMyReview(updated);
         setReviews((prev) =>
           prev.map((r) => (r.id === updated.id ? updated : r))
         );
@@ -249,8 +295,10 @@ export function ListingDetails({ propertyId, onNavigate }: ListingDetailsProps)
           rating: reviewRating,
           comment: reviewComment,
         });
+        setMyReview(created);
         setReviews((prev) => [created, ...prev]);
       }
+      loadRatings();
       setReviewRating(0);
       setReviewHover(0);
       setReviewComment("");
@@ -277,6 +325,8 @@ export function ListingDetails({ propertyId, onNavigate }: ListingDetailsProps)
       setReviewSubmitting(true);
       await deleteReview(myReview.id);
       setReviews((prev) => prev.filter((r) => r.id !== myReview.id));
+      setMyReview(null);
+      loadRatings();
       setReviewRating(0);
       setReviewHover(0);
       setReviewComment("");
@@ -550,16 +600,9 @@ export function ListingDetails({ propertyId, onNavigate }: ListingDetailsProps)
 
                   <TabsContent value="reviews" className="mt-6">
                     {(() => {
-                      const count = reviews.length;
+                      const count = listingRating.count;
                       const avg = count
-                        ? Math.round(
-                            (reviews.reduce(
-                              (s, r) => s + (Number(r.rating) || 0),
-                              0
-                            ) /
-                              count) *
-                              10
-                          ) / 10
+                        ? Math.round((listingRating.average ?? 0) * 10) / 10
                         : 0;
                       return (
                         <>
@@ -666,6 +709,15 @@ export function ListingDetails({ propertyId, onNavigate }: ListingDetailsProps)
                                 </div>
                               </div>
                             ))}
+                            {reviewsNext && (
+                              <Button
+                                variant="outline"
+                                size="sm"
+                                onClick={loadMoreReviews}
+                              >
+                                Load more reviews
+                              </Button>
+                            )}
                           </div>
                           {/* Write/Edit my review */}
                           <div className="mt-6">
@@ -875,17 +927,9 @@ export function ListingDetails({ propertyId, onNavigate }: ListingDetailsProps)
                     <div className="flex items-center gap-1">
                       <Star className="w-4 h-4 fill-primary text-primary" />
                       {(() => {
-                        const count = ownerReviews.length;
+                        const count = ownerRating.count;
                         const avg = count
-                          ? Math.round(
-                              (ownerReviews.reduce(
-                                (s, r) =>
-                                  s + (Number((r as any).rating) || 0),
-                                0
-                              ) /
-                                count) *
-                                10
-                            ) / 10
+                          ? Math.round((ownerRating.average ?? 0) * 10) / 10
                           : 0;
                         return count > 0 ? (
                           <span className="text-sm">
@@ -7,7 +7,7 @@ import { Textarea } from "./ui/textarea";
 import { Star } from "lucide-react";
 import type { User } from "../services/auth";
 import { profile } from "../services/auth";
-import { listReviews, createReview, updateReview, deleteReview, type Review } from "../services/reviews";
+import { listReviews, listMoreReviews, getMyReview, createReview, updateReview, deleteReview, type Review } from "../services/reviews";
 import { Skeleton } from "./ui/skeleton";
 
 interface Props {
@@ -18,6 +18,8 @@ interface Props {
 
 export function UserProfileDialog({ user, open, onOpenChange }: Props) {
   const [reviews, setReviews] = useState<Review[]>([]);
+  const [reviewsNext, setReviewsNext] = useState<string | null>(null);
+  const [myReview, setMyReview] = useState<Review | null>(null);
   const [loading, setLoading] = useState(false);
   const [rating, setRating] = useState<number>(0);
   const [hoverRating, setHoverRating] = useState<number>(0);
@@ -32,8 +34,9 @@ export function UserProfileDialog({ user, open, onOpenChange }: Props) {
       if (!open || !user) return;
       try {
         setLoading(true);
-        const list = await listReviews({ target_type: "USER", target_id: user.id });
-        setReviews(Array.isArray(list) ? list : []);
+        const page = await listReviews({ target_type: "USER", target_id: user.id });
+        setReviews(page.results);
+        setReviewsNext(page.next);
       } catch (e: any) {
         setError(e?.message ?? "Failed to load reviews");
       } finally {
@@ -53,10 +56,29 @@ export function UserProfileDialog({ user, open, onOpenChange }: Props) {
     })();
   }, []);
 
-  const myReview = useMemo(() => {
-    if (!me) return null;
-    return reviews.find((r) => (r.author?.id ?? null) === me.id) || null;
-  }, [reviews, me]);
+  // Looked up directly: the loaded page of reviews may not contain the caller's own review
+  useEffect(() => {
+    (async () => {
+      if (!open || !user || !me) {
+        setMyReview(null);
+        return;
+      }
+      try {
+        setMyReview(await getMyReview({ target_type: "USER", target_id: user.id }));
+      } catch (_) {
+        setMyReview(null);
+      }
+    })();
+  }, [open, user, me]);
+
+  async function loadMoreReviews() {
+    if (!reviewsNext) return;
+    try {
+      const page = await listMoreReviews(reviewsNext);
+      setReviews((prev) => [...prev, ...page.results.filter((r) => !prev.some((p) => p.id === r.id))]);
+      setReviewsNext(page.next);
+    } catch (_) {}
+  }
 
   // Do not auto-initialize edit fields; only when user clicks Edit/Write
 
@@ -92,9 +114,11 @@ export function UserProfileDialog({ user, open, onOpenChange }: Props) {
       setSubmitting(true);
       if (myReview) {
         const updated = await updateReview(myReview.id, { rating, comment });
+        setMyReview(updated);
         setReviews((prev) => prev.map((r) => (r.id === updated.id ? updated : r)));
       } else {
         const created = await createReview({ target_type: "USER", target_id: user.id, rating, comment });
+        setMyReview(created);
         setReviews((prev) => [created, ...prev]);
       }
       setRating(0);
@@ -120,6 +144,7 @@ export function UserProfileDialog({ user, open, onOpenChange }: Props) {
       setSubmitting(true);
       await deleteReview(myReview.id);
       setReviews((prev) => prev.filter((r) => r.id !== myReview.id));
+      setMyReview(null);
       setRating(0);
       setComment("");
       setIsEditing(false);
@@ -191,6 +216,11 @@ export function UserProfileDialog({ user, open, onOpenChange }: Props) {
                       <div className="text-sm text-foreground whitespace-pre-wrap break-words ">{r.comment}</div>
                     </div>
                   ))}
+                  {reviewsNext && (
+                    <Button variant="outline" className="h-9 px-5 text-sm" onClick={loadMoreReviews}>
+                      Load more reviews
+                    </Button>
+                  )}
                 </div>
               )}
             </div>
@@ -19,7 +19,7 @@ async function loadTwilioModule(): Promise<TwilioModule> {
 /** ---- REST endpoints (your Django API) ---- */
 export async function twilioToken() {
   const { data } = await api.get("/messaging/twilio-token/");
-  return data as { token: string };
+  return data as { token: string; ttl: number };
 }
 
 export async function createConversation(other_user_id: number) {
@@ -51,6 +51,24 @@ export async function markRead(message_sid: string) {
   return { success: !!data };
 }
 
+export async function listMessages(conversation_id: string, cursorUrl?: string | null) {
+  const { data } = await api.get(cursorUrl || `/messaging/conversations/${conversation_id}/messages/`);
+  return data as { next: string | null; previous: string | null; results: any[] };
+}
+
+export async function searchMessages(q: string, cursorUrl?: string | null) {
+  const { data } = await api.get(cursorUrl || "/messaging/messages/search/", cursorUrl ? undefined : { params: { q } });
+  return data as { next: string | null; previous: string | null; results: any[] };
+}
+
+export async function markConversationRead(conversation_id: string, message_id?: string) {
+  const { data } = await api.post(
+    `/messaging/conversations/${conversation_id}/read/`,
+    message_id ? { message_id } : {}
+  );
+  return data as { conversation_id: string; last_read_at: string | null };
+}
+
 /** ---- Twilio Conversations client (browser SDK) ----
  * We cache a single client instance per session.
  * If the logged-in user changes, call resetTwilioClient() first.
@@ -13,9 +13,41 @@ export type Review = {
   created_at: string;
 };
 
-export async function listReviews(params?: { target_type?: "USER" | "LISTING"; target_id?: string | number }) {
+export type ReviewPage = { results: Review[]; next: string | null };
+
+export type RatingAggregate = { average: number | null; count: number };
+
+type ReviewTarget = { target_type: "USER" | "LISTING"; target_id: string | number };
+
+function toPage(data: any): ReviewPage {
+  // Review lists are cursor-paginated: { next, previous, results }
+  return Array.isArray(data) ? { results: data, next: null } : { results: data.results, next: data.next };
+}
+
+export async function listReviews(params?: Partial<ReviewTarget>) {
   const { data } = await api.get("/reviews/", { params });
-  return data as Review[];
+  return toPage(data);
+}
+
+// Follows the `next` cursor URL of a previous page
+export async function listMoreReviews(next: string) {
+  const { data } = await api.get(next);
+  return toPage(data);
+}
+
+// The caller's own review of a target (at most one), independent of list paging
+export async function getMyReview(target: ReviewTarget) {
+  const { data } = await api.get("/reviews/my/", { params: target });
+  return (toPage(data).results[0] ?? null) as Review | null;
+}
+
+// Count and average from the precomputed summaries, for any number of listings and users
+export async function getRatings(ids: { listings?: string[]; users?: Array<string | number> }) {
+  const params: Record<string, string> = {};
+  if (ids.listings?.length) params.listings = ids.listings.join(",");
+  if (ids.users?.length) params.users = ids.users.join(",");
+  const { data } = await api.get("/reviews/ratings/", { params });
+  return data as { listings: Record<string, RatingAggregate>; users: Record<string, RatingAggregate> };
 }
 
 export async function createReview(payload: Omit<Review, "id" | "created_at" | "author">) {
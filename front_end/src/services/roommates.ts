@@ -25,6 +25,33 @@ export async function posts(params?: Partial<{
   return data as RoommatePost[];
 }
 
+// Newest posts first; pass the previous page's next/previous URL to move
+export async function postFeed(cursorUrl?: string | null, params?: Partial<{
+  min_budget: number;
+  max_budget: number;
+  university: string;
+  district: string;
+  female_only: boolean;
+  preferred_type: "APARTMENT" | "STUDIO" | "OTHER";
+  page_size: number;
+}>) {
+  const { data } = await api.get(cursorUrl || "/roommates/posts/feed/", cursorUrl ? undefined : { params });
+  return data as { next: string | null; previous: string | null; results: RoommatePost[] };
+}
+
+// Posts ranked by compatibility with the caller's latest post (params override it)
+export async function matchPosts(params?: Partial<{
+  max_budget: number;
+  university: string;
+  district: string;
+  preferred_type: "APARTMENT" | "STUDIO" | "OTHER";
+  female_only: boolean;
+  limit: number;
+}>) {
+  const { data } = await api.get("/roommates/posts/matches/", { params });
+  return data as (RoommatePost & { match_score: number })[];
+}
+
 export async function createPost(payload: Omit<RoommatePost, "id" | "author" | "created_at" | "updated_at">) {
   const { data } = await api.post("/roommates/posts/", payload);
   return data as RoommatePost;
@@ -35,15 +62,33 @@ export async function deletePost(id: string) {
   return data as unknown;
 }
 
+export type ListingSummary = Pick<Listing, "id" | "title" | "district"> & { primary_image: string | null };
+
+export type GroupConversation = {
+  id: string;
+  twilio_sid: string | null;
+  last_message: unknown | null;
+  created_at: string;
+  updated_at: string;
+};
+
+export type GroupMember = Pick<
+  User,
+  "id" | "username" | "first_name" | "last_name" | "role" | "gender" | "avatar_url"
+>;
+
+// members are compact, listing a summary and conversation an id unless requested via groups({ expand })
 export type RoommateGroup = {
   id: string;
   name: string;
-  members: User[];
-  leader: User;
-  listing?: Listing | null;
+  members: GroupMember[]; // full User objects with expand: ["members"]
+  leader: Pick<User, "id" | "username" | "first_name" | "last_name">;
+  listing?: ListingSummary | Listing | null;
+  conversation?: string | GroupConversation | null;
   address?: string | null;
   university?: string | null;
   max_members: number;
+  member_count: number;
   cost_per_member?: number | null;
   female_only: boolean;
   status: "OPEN" | "CLOSED";
@@ -51,11 +96,34 @@ export type RoommateGroup = {
   updated_at: string;
 };
 
-export async function groups() {
-  const { data } = await api.get("/roommates/groups/");
+export async function groups(options?: { expand?: ("members" | "listing" | "conversation")[] }) {
+  const params = options?.expand?.length ? { expand: options.expand.join(",") } : undefined;
+  const { data } = await api.get("/roommates/groups/", { params });
   return data as RoommateGroup[];
 }
 
+export type DiscoverableGroup = Pick<
+  RoommateGroup,
+  "id" | "name" | "university" | "max_members" | "member_count" | "cost_per_member" | "female_only" | "created_at"
+> & {
+  members: Pick<User, "id" | "username" | "first_name" | "last_name">[];
+  leader: Pick<User, "id" | "username" | "first_name" | "last_name"> | null;
+  listing: ListingSummary | null;
+  open_seats: number;
+};
+
+// OPEN groups with free seats the caller is not in, newest first; pass next/previous URLs to move
+export async function discoverGroups(cursorUrl?: string | null, params?: Partial<{
+  university: string;
+  female_only: boolean;
+  min_cost: number;
+  max_cost: number;
+  page_size: number;
+}>) {
+  const { data } = await api.get(cursorUrl || "/roommates/groups/discover/", cursorUrl ? undefined : { params });
+  return data as { next: string | null; previous: string | null; results: DiscoverableGroup[] };
+}
+
 export async function leaveGroup(id: string) {
   const { data } = await api.post(`/roommates/groups/${id}/leave/`);
   return data as { success: string };
@@ -92,6 +160,24 @@ export async function requests() {
   return data as RoommateRequest[];
 }
 
+export type RoommateRequestPage = {
+  next: string | null;
+  previous: string | null;
+  results: RoommateRequest[];
+  pending_counts: { incoming: number; outgoing: number };
+};
+
+// Requests received by / sent by the caller, newest first; pass the previous page's next/previous URL to move
+export async function incomingRequests(cursorUrl?: string | null, status?: RoommateRequest["status"]) {
+  const { data } = await api.get(cursorUrl || "/roommates/requests/incoming/", cursorUrl ? undefined : { params: { status } });
+  return data as RoommateRequestPage;
+}
+
+export async function outgoingRequests(cursorUrl?: string | null, status?: RoommateRequest["status"]) {
+  const { data } = await api.get(cursorUrl || "/roommates/requests/outgoing/", cursorUrl ? undefined : { params: { status } });
+  return data as RoommateRequestPage;
+}
+
 export async function acceptRequest(id: string) {
   const { data } = await api.post(`/roommates/requests/${id}/accept/`);
   return data as { success: string };